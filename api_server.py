@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Serveur HTTP local (asyncio) exposant les services recettes et nutrition
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from config import Config
+from models import DataManager, IngredientFilter, Recipe
+from ollama_service import OllamaService
+from recipe_service import RecipeService
+from recipe_library import RecipeLibrary
+from recipe_index import RecipeIndex
+from calorie_service import CalorieService
+from prompt_builder import prompt_stats
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from instrumentation import instrumentation, bind
+from resilience import Deadline
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 411: "Length Required", 413: "Payload Too Large",
+    500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable",
+    504: "Gateway Timeout"
+}
+
+API_DURATION = metrics.histogram('api_request_duration_seconds', "Durée des requêtes API par route", ('path',))
+
+class HttpError(Exception):
+    """Erreur renvoyée au client avec un statut HTTP"""
+    
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class Request:
+    """Requête HTTP/1.1 déjà lue"""
+    
+    def __init__(self, method: str, target: str, version: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        self.body = body
+        parts = urlsplit(target)
+        self.path = unquote(parts.path).rstrip('/') or '/'
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+    
+    def json(self) -> Dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError as e:
+            raise HttpError(400, f"JSON invalide: {e}")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Objet JSON attendu")
+        return data
+
+class OllamaGate:
+    """Limite les générations simultanées et la file d'attente vers Ollama
+    
+    Au-delà de max_waiting demandes en attente, la requête est refusée
+    (503 + Retry-After estimé) plutôt que d'allonger indéfiniment la file.
+    """
+    
+    def __init__(self, concurrency: int, max_waiting: int):
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.avg_duration = 10.0  # Moyenne glissante (s) d'un appel
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+    
+    def retry_after(self) -> int:
+        """Secondes estimées avant qu'une place se libère"""
+        backlog = self.waiting + self.in_flight
+        return max(1, math.ceil(backlog * self.avg_duration / self.concurrency))
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, deadline: Optional[Deadline] = None):
+        """Place de génération; l'attente en file compte dans l'échéance de la requête"""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise HttpError(503, "File Ollama pleine, réessayez plus tard",
+                            {'Retry-After': str(self.retry_after())})
+        
+        self.waiting += 1
+        try:
+            if deadline is None:
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), deadline.remaining())
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HttpError(504, "Délai de la requête écoulé en file d'attente Ollama")
+        finally:
+            self.waiting -= 1
+        
+        self.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.monotonic() - start)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+            'avg_duration_s': round(self.avg_duration, 2)
+        }
+
+class ChunkedWriter:
+    """Corps de réponse en Transfer-Encoding: chunked (flux SSE ou NDJSON)"""
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+    
+    async def write(self, data: bytes):
+        if data:
+            self.writer.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            await self.writer.drain()
+    
+    async def close(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+class ApiServer:
+    """Un seul DataManager, un seul jeu de services et de caches pour toutes les requêtes"""
+    
+    def __init__(self, config: Config):
+        self.config = config
+        Config.ensure_data_dir()
+        self.data_manager = DataManager(config)
+        self.ollama_service = OllamaService(config)
+        self.recipe_library = RecipeLibrary(config.RECIPE_LIBRARY_DB, config.RECIPE_LIBRARY_VARIANTS)
+        self.recipe_service = RecipeService(self.ollama_service, config, self.recipe_library)
+        # Autant d'analyses simultanées que la porte Ollama en laisse passer
+        self.calorie_service = CalorieService(
+            self.ollama_service, self.data_manager, config,
+            concurrent_analyses=config.API_OLLAMA_CONCURRENCY * len(self.ollama_service.pool.backends)
+        )
+        self.recipe_index = RecipeIndex(self.calorie_service.linker)
+        self.recipe_index.build(self.recipe_library.iter_rows())
+        self.recipe_library.listeners.append(self.recipe_index.on_library_change)
+        self.ingredient_filter = IngredientFilter(
+            sorted(self.data_manager.get_all_ingredients(), key=lambda ing: ing.name),
+            config.SEARCH_CACHE_SIZE
+        )
+        
+        self.max_requests = config.API_MAX_CONCURRENT_REQUESTS
+        self.active_requests = 0
+        self.counters = {'requests': 0, 'errors': 0, 'rejected': 0, 'connections': 0}
+        self.gate: Optional[OllamaGate] = None
+        self._pool = ThreadPoolExecutor(max_workers=config.API_WORKERS, thread_name_prefix="api")
+        
+        self.routes: Dict[Tuple[str, str], Callable[[Request, asyncio.StreamWriter], Awaitable[Any]]] = {
+            ('GET', '/health'): self.handle_health,
+            ('GET', '/metrics'): self.handle_metrics,
+            ('GET', '/ingredients'): self.handle_search,
+            ('GET', '/ingredients/link'): self.handle_link,
+            ('POST', '/meals/calories'): self.handle_meal_calories,
+            ('POST', '/nutrition'): self.handle_nutrition,
+            ('POST', '/recipes'): self.handle_recipe,
+            ('GET', '/recipes/search'): self.handle_recipe_search,
+        }
+        metrics.register_collector('api', self._collect_metrics)
+    
+    async def serve(self, host: str, port: int):
+        """Démarre l'écoute et sert jusqu'à l'interruption"""
+        # Chaque serveur du pool traite API_OLLAMA_CONCURRENCY générations
+        self.gate = OllamaGate(self.config.API_OLLAMA_CONCURRENCY * len(self.ollama_service.pool.backends),
+                               self.config.API_OLLAMA_QUEUE)
+        server = await asyncio.start_server(self.handle_connection, host, port,
+                                            limit=self.config.API_MAX_HEADER_BYTES)
+        print(f"🌐 API en écoute sur http://{host}:{port}")
+        snapshots = metrics.start_snapshots(self.config.METRICS_FILE) if self.config.METRICS_FILE else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if snapshots is not None:
+                snapshots.set()
+                metrics.write_snapshot(self.config.METRICS_FILE)
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self.calorie_service.linker.save()
+            self.recipe_library.close()
+            if self.config.PERF_TRACE_FILE:
+                count = instrumentation.dump_trace(self.config.PERF_TRACE_FILE)
+                print(f"📈 Trace écrite ({count} spans): {self.config.PERF_TRACE_FILE}")
+    
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        """Exécute un appel bloquant des services hors de la boucle (sous le span de la requête)"""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, bind(func), *args)
+    
+    # ===== CONNEXIONS =====
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Traite les requêtes successives d'une connexion (keep-alive)"""
+        self.counters['connections'] += 1
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader),
+                                                     self.config.API_KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except HttpError as e:
+                    await self._send_error(writer, e, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                
+                keep_alive = await self._dispatch(request, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+    
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        try:
+            line = await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HttpError(400, "Ligne de requête trop longue")
+        if not line:
+            return None
+        
+        try:
+            method, target, version = line.decode('latin-1').strip().split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "Ligne de requête invalide")
+        
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise HttpError(400, "En-tête trop long")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise HttpError(411, "Content-Length requis")
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, "Content-Length invalide")
+        if length > self.config.API_MAX_BODY_BYTES:
+            raise HttpError(413, "Corps de requête trop volumineux")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), target, version, headers, body)
+    
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """Route la requête; retourne False si la connexion doit être fermée"""
+        self.counters['requests'] += 1
+        keep_alive = request.keep_alive
+        
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            allowed = [method for method, path in self.routes if path == request.path]
+            status = 405 if allowed else 404
+            await self._send_error(writer, HttpError(status, f"{request.method} {request.path}"), keep_alive)
+            return keep_alive
+        
+        if self.active_requests >= self.max_requests:
+            self.counters['rejected'] += 1
+            await self._send_error(writer, HttpError(503, "Serveur saturé", {'Retry-After': '1'}), keep_alive)
+            return keep_alive
+        
+        self.active_requests += 1
+        start = time.monotonic()
+        try:
+            # Chaque connexion est une tâche asyncio: le span de la requête ne se mêle pas aux autres
+            with instrumentation.span(f"API {request.method} {request.path}", "api"):
+                result = await handler(request, writer)
+            if result is not None:
+                await self._send_json(writer, 200, result, keep_alive)
+        except HttpError as e:
+            await self._send_error(writer, e, keep_alive)
+        except ValueError as e:
+            await self._send_error(writer, HttpError(400, str(e)), keep_alive)
+        except (ConnectionResetError, BrokenPipeError):
+            raise  # Client parti: rien à répondre
+        except ConnectionError as e:
+            # Ollama indisponible
+            await self._send_error(writer, HttpError(503, str(e), {'Retry-After': '5'}), keep_alive)
+        except TimeoutError as e:
+            # Échéance de la requête dépassée
+            await self._send_error(writer, HttpError(504, str(e)), keep_alive)
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"Erreur API {request.method} {request.path}: {e}", file=sys.stderr)
+            await self._send_error(writer, HttpError(502 if isinstance(e, RuntimeError) else 500, str(e)),
+                                   keep_alive)
+        finally:
+            self.active_requests -= 1
+            API_DURATION.observe(time.monotonic() - start, path=request.path)
+        return keep_alive
+    
+    # ===== RÉPONSES =====
+    
+    def _head(self, status: int, content_type: str, keep_alive: bool,
+              extra: Optional[Dict[str, str]] = None) -> bytes:
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                 f"Content-Type: {content_type}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if keep_alive:
+            lines.append(f"Keep-Alive: timeout={int(self.config.API_KEEPALIVE_TIMEOUT)}")
+        for name, value in (extra or {}).items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+    
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, data: Any, keep_alive: bool,
+                         extra: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        headers = dict(extra or {})
+        headers['Content-Length'] = str(len(body))
+        writer.write(self._head(status, "application/json; charset=utf-8", keep_alive, headers) + body)
+        await writer.drain()
+    
+    async def _send_error(self, writer: asyncio.StreamWriter, error: HttpError, keep_alive: bool):
+        await self._send_json(writer, error.status, {'error': error.message}, keep_alive, error.headers)
+    
+    # ===== POINTS D'ENTRÉE =====
+    
+    async def handle_health(self, request: Request, writer) -> Dict[str, Any]:
+        """État du serveur, de la file et des serveurs Ollama, du cache d'ingrédients, des prompts et des routes"""
+        return {
+            'status': 'ok',
+            'model': self.config.OLLAMA_MODEL,
+            'active_requests': self.active_requests,
+            'counters': dict(self.counters),
+            'ollama': self.gate.stats(),
+            'ingredient_links': self.calorie_service.linker.get_stats(),
+            'recipe_library': {'hits': self.recipe_library.hits, 'misses': self.recipe_library.misses},
+            'prompts': prompt_stats.report(),
+            'routes': self.ollama_service.route_report(),
+            'backends': self.ollama_service.pool.stats(),
+            'breaker': dict(self.ollama_service.breaker.stats(), retries=self.ollama_service.retries)
+        }
+    
+    async def handle_metrics(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        """GET /metrics: exposition Prometheus (les collecteurs lisent SQLite: hors de la boucle)"""
+        body = (await self.run_blocking(metrics.render)).encode('utf-8')
+        writer.write(self._head(200, METRICS_CONTENT_TYPE, request.keep_alive,
+                                {'Content-Length': str(len(body))}) + body)
+        await writer.drain()
+        return None
+    
+    def _collect_metrics(self):
+        """Collecteur: requêtes actives, compteurs et file d'attente Ollama"""
+        metrics.gauge('api_active_requests', "Requêtes API en cours").set(self.active_requests)
+        events = metrics.counter('api_events_total', "Requêtes, erreurs, refus et connexions de l'API", ('event',))
+        for event, value in self.counters.items():
+            events.sync(value, event=event)
+        if self.gate is not None:
+            gate = self.gate.stats()
+            metrics.gauge('api_ollama_waiting', "Requêtes en attente d'une place Ollama").set(gate['waiting'])
+            metrics.gauge('api_ollama_in_flight', "Générations Ollama en cours").set(gate['in_flight'])
+            metrics.gauge('api_ollama_capacity', "Places de génération Ollama").set(self.gate.concurrency)
+            metrics.counter('api_ollama_rejected_total', "Requêtes refusées (file pleine ou délai écoulé)").sync(
+                gate['rejected'])
+    
+    async def handle_search(self, request: Request, writer) -> Dict[str, Any]:
+        """GET /ingredients?q=pou&category=Viandes&limit=20"""
+        category = request.query.get('category', IngredientFilter.ALL_CATEGORIES)
+        try:
+            limit = int(request.query.get('limit', 50))
+        except ValueError:
+            raise HttpError(400, "limit doit être un entier")
+        matches = self.ingredient_filter.filter(request.query.get('q', ""), category)
+        return {'total': len(matches), 'ingredients': [asdict(ing) for ing in matches[:max(0, limit)]]}
+    
+    async def handle_link(self, request: Request, writer) -> Dict[str, Any]:
+        """GET /ingredients/link?name=filets de poulet"""
+        name = request.query.get('name', "").strip()
+        if not name:
+            raise HttpError(400, "Paramètre name requis")
+        linker = self.calorie_service.linker
+        key = await self.run_blocking(linker.resolve, name)
+        return {
+            'name': name,
+            'match': key,
+            'candidates': [{'key': k, 'score': round(score, 3)} for k, score in linker.candidates(name)]
+        }
+    
+    async def handle_recipe_search(self, request: Request, writer) -> Dict[str, Any]:
+        """GET /recipes/search?with=poulet,courgette&without=fromage&limit=20
+        
+        rank=1: classement par couverture des ingrédients de with au lieu
+        d'exiger qu'ils soient tous présents.
+        """
+        include = [name for name in request.query.get('with', "").split(',') if name.strip()]
+        exclude = [name for name in request.query.get('without', "").split(',') if name.strip()]
+        try:
+            limit = int(request.query.get('limit', 20))
+        except ValueError:
+            raise HttpError(400, "limit doit être un entier")
+        
+        if request.query.get('rank') in ('1', 'true'):
+            if not include:
+                raise HttpError(400, "Paramètre with requis pour rank")
+            results = await self.run_blocking(self.recipe_index.rank, include, exclude, limit)
+            return {'total': len(results), 'recipes': results}
+        
+        ids = await self.run_blocking(self.recipe_index.query, include, exclude)
+        return {'total': len(ids),
+                'recipes': [{'id': recipe_id, 'title': self.recipe_index.title(recipe_id)}
+                            for recipe_id in ids[:max(0, limit)]]}
+    
+    def _foods(self, data: Dict[str, Any]) -> list:
+        foods = data.get('foods', data.get('ingredients'))
+        if not isinstance(foods, list) or not foods:
+            raise HttpError(400, "Liste 'foods' requise: [{\"name\", \"quantity\", \"unit\"}]")
+        return [{'name': str(item.get('name', "")), 'quantity': float(item.get('quantity') or 100),
+                 'unit': str(item.get('unit') or 'g')}
+                for item in foods if isinstance(item, dict)]
+    
+    def _deadline(self, data: Dict[str, Any]) -> Deadline:
+        """Échéance de la requête: champ "timeout" (s) borné par API_REQUEST_TIMEOUT"""
+        timeout = data.get('timeout', self.config.API_REQUEST_TIMEOUT)
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            raise HttpError(400, "timeout doit être un nombre de secondes")
+        if timeout <= 0:
+            raise HttpError(400, "timeout doit être positif")
+        return Deadline(min(timeout, self.config.API_REQUEST_TIMEOUT))
+    
+    async def handle_meal_calories(self, request: Request, writer) -> Dict[str, Any]:
+        """POST /meals/calories: calcul local, sans IA"""
+        foods = self._foods(request.json())
+        return await self.run_blocking(self.calorie_service.summarize_meal, foods)
+    
+    async def handle_nutrition(self, request: Request, writer) -> Dict[str, Any]:
+        """POST /nutrition: analyse nutritionnelle (base + IA selon Config.NUTRITION_MODE)"""
+        data = request.json()
+        recipe = Recipe(title=str(data.get('title', "Analyse nutritionnelle")), ingredients=self._foods(data),
+                        steps=[], prep_time="", difficulty="")
+        deadline = self._deadline(data)
+        cancel_event = threading.Event()
+        try:
+            async with self.gate.slot(deadline):
+                analysis = await self.run_blocking(
+                    lambda: self.calorie_service.analyze_nutrition(recipe, cancel_event=cancel_event,
+                                                                   deadline=deadline)
+                )
+        finally:
+            cancel_event.set()  # Libère Ollama si la requête est abandonnée
+        if analysis is None:
+            raise HttpError(502, "Analyse indisponible")
+        return asdict(analysis)
+    
+    async def handle_recipe(self, request: Request, writer: asyncio.StreamWriter) -> Optional[Dict[str, Any]]:
+        """POST /recipes {"ingredients": [...], "stream": true, "policy": "library"}
+        
+        En flux: SSE (text/event-stream) par défaut, NDJSON si Accept:
+        application/x-ndjson. La déconnexion du client annule la génération.
+        Une recette servie par la bibliothèque ne prend pas de place Ollama.
+        """
+        data = request.json()
+        ingredients = data.get('ingredients')
+        if not isinstance(ingredients, list) or not ingredients:
+            raise HttpError(400, "Liste 'ingredients' requise")
+        ingredients = [str(name) for name in ingredients]
+        options = (str(data.get('cuisine_type', "")), str(data.get('difficulty', "")),
+                   str(data.get('prep_time', "")))
+        
+        stream = data.get('stream') or request.query.get('stream') in ('1', 'true')
+        deadline = self._deadline(data)
+        cancel_event = threading.Event()
+        ndjson = 'application/x-ndjson' in request.headers.get('accept', '')
+        
+        # Bibliothèque: servie sans passer par la file Ollama
+        policy = data.get('policy') or request.query.get('policy')
+        stored = await self.run_blocking(
+            lambda: self.recipe_service.library_lookup(ingredients, *options, policy=policy)
+        )
+        if stored is not None:
+            if not stream:
+                return asdict(stored)
+            await self._stream_recipe(writer, request.keep_alive, ndjson, ingredients, options,
+                                      cancel_event, deadline, stored)
+            return None
+        
+        if not stream:
+            try:
+                async with self.gate.slot(deadline):
+                    recipe = await self.run_blocking(
+                        lambda: self.recipe_service.generate_recipe(ingredients, *options,
+                                                                    cancel_event=cancel_event,
+                                                                    deadline=deadline)
+                    )
+            finally:
+                cancel_event.set()
+            return asdict(recipe)
+        
+        async with self.gate.slot(deadline):
+            await self._stream_recipe(writer, request.keep_alive, ndjson, ingredients, options,
+                                      cancel_event, deadline)
+        return None
+    
+    async def _stream_recipe(self, writer: asyncio.StreamWriter, keep_alive: bool, ndjson: bool,
+                             ingredients: list, options: tuple, cancel_event: threading.Event,
+                             deadline: Optional[Deadline] = None, stored: Optional[Recipe] = None):
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        
+        def on_chunk(text: str):
+            loop.call_soon_threadsafe(chunks.put_nowait, ('chunk', text))
+        
+        def generate():
+            if stored is not None:
+                loop.call_soon_threadsafe(chunks.put_nowait, ('recipe', asdict(stored)))
+                return
+            try:
+                recipe = self.recipe_service.generate_recipe(ingredients, *options, cancel_event=cancel_event,
+                                                             on_chunk=on_chunk, deadline=deadline)
+                loop.call_soon_threadsafe(chunks.put_nowait, ('recipe', asdict(recipe) if recipe else None))
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, ('error', str(e)))
+        
+        content_type = "application/x-ndjson" if ndjson else "text/event-stream"
+        writer.write(self._head(200, f"{content_type}; charset=utf-8", keep_alive,
+                                {'Cache-Control': 'no-cache', 'Transfer-Encoding': 'chunked'}))
+        body = ChunkedWriter(writer)
+        task = loop.run_in_executor(self._pool, bind(generate))
+        
+        try:
+            while True:
+                kind, value = await chunks.get()
+                payload = {'text': value} if kind == 'chunk' else value if kind == 'recipe' else {'error': value}
+                if ndjson:
+                    line = json.dumps({'type': kind, 'data': payload}, ensure_ascii=False) + "\n"
+                else:
+                    line = f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                await body.write(line.encode('utf-8'))
+                if kind != 'chunk':
+                    break
+            await body.close()
+        finally:
+            # Client parti ou flux terminé: ne pas laisser Ollama générer pour rien
+            cancel_event.set()
+            await task
+
+def run_server(argv=None) -> int:
+    """Point d'entrée: python api_server.py [--host H] [--port P]"""
+    parser = argparse.ArgumentParser(prog="api_server.py", description="API HTTP locale recettes et nutrition")
+    parser.add_argument('--host', default=Config.API_HOST)
+    parser.add_argument('--port', type=int, default=Config.API_PORT)
+    args = parser.parse_args(argv)
+    
+    server = ApiServer(Config())
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("👋 API arrêtée")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run_server())
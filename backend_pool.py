@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Pool de serveurs Ollama: santé par hôte, requêtes en cours et latence lissée (EWMA)
+"""
+
+import random
+import threading
+import time
+import requests
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set
+from config import Config
+
+# Politiques de choix d'un hôte
+POLICY_LEAST_LOADED = 'least_loaded'  # Attente estimée la plus faible
+POLICY_WEIGHTED = 'weighted'          # Tirage pondéré par l'inverse de l'attente estimée
+POLICIES = (POLICY_LEAST_LOADED, POLICY_WEIGHTED)
+
+@dataclass
+class Backend:
+    """Un serveur Ollama tel que le pool le voit"""
+    url: str
+    alive: bool = True
+    in_flight: int = 0
+    ewma_ms: Optional[float] = None  # Délai lissé du premier morceau
+    failures: int = 0                # Échecs consécutifs
+    next_check: float = 0.0          # Prochaine vérification d'un hôte retiré (monotonic)
+    models: Optional[List[str]] = None  # None tant que /api/tags n'a pas répondu
+    requests: int = 0
+    errors: int = 0
+    probe_ms: Optional[float] = None  # Durée lissée de la sonde /api/tags
+    
+    def has_model(self, model: str) -> bool:
+        return self.models is None or any(model in name for name in self.models)
+    
+    def cost(self, default_ms: float) -> float:
+        """Attente estimée: requêtes en cours (plus la nouvelle) x latence lissée"""
+        latency = self.ewma_ms if self.ewma_ms is not None else default_ms
+        return (self.in_flight + 1) * latency
+
+class BackendPool:
+    """Répartit les appels entre plusieurs serveurs Ollama
+    
+    acquire() réserve l'hôte le moins chargé parmi les vivants qui ont le
+    modèle; release() rend la place et met à jour latence et santé. Après
+    failures_to_dead échecs de connexion consécutifs, un hôte est retiré,
+    puis revérifié en arrière-plan toutes les retry_interval secondes.
+    """
+    
+    def __init__(self, urls: Iterable[str], policy: str = Config.BACKEND_POLICY,
+                 alpha: float = Config.BACKEND_EWMA_ALPHA,
+                 failures_to_dead: int = Config.BACKEND_FAILURES_TO_DEAD,
+                 retry_interval: float = Config.BACKEND_RETRY_INTERVAL,
+                 default_ms: float = Config.BACKEND_DEFAULT_LATENCY_MS):
+        if policy not in POLICIES:
+            raise ValueError(f"❌ Politique de répartition inconnue: {policy} ({', '.join(POLICIES)})")
+        self.backends = [Backend(url.rstrip('/')) for url in dict.fromkeys(urls)]
+        if not self.backends:
+            raise ValueError("❌ Aucun serveur Ollama configuré")
+        self.policy = policy
+        self.alpha = alpha
+        self.failures_to_dead = max(1, failures_to_dead)
+        self.retry_interval = retry_interval
+        self.default_ms = default_ms
+        self._lock = threading.Lock()
+        self._checking: Set[str] = set()
+    
+    # ===== RÉSERVATION =====
+    
+    def acquire(self, model: Optional[str] = None, prefer: Optional[str] = None,
+                exclude: Iterable[str] = ()) -> Optional[Backend]:
+        """Réserve un hôte (in_flight + 1), ou None si tous sont exclus
+        
+        prefer épingle un hôte tant qu'il est vivant (conversation dont le
+        cache est sur cet hôte). Si aucun hôte n'est vivant, le premier à
+        revérifier est tenté quand même: l'erreur remonte à l'appelant.
+        """
+        self._revive_due()
+        exclude = set(exclude)
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.url not in exclude]
+            if not candidates:
+                return None
+            alive = [backend for backend in candidates if backend.alive]
+            chosen = next((backend for backend in alive if backend.url == prefer), None)
+            if chosen is None and alive:
+                with_model = [backend for backend in alive if model is None or backend.has_model(model)]
+                chosen = self._choose(with_model or alive)
+            if chosen is None:
+                chosen = min(candidates, key=lambda backend: backend.next_check)
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen
+    
+    def _choose(self, backends: List[Backend]) -> Backend:
+        if self.policy == POLICY_WEIGHTED:
+            weights = [1.0 / backend.cost(self.default_ms) for backend in backends]
+            return random.choices(backends, weights)[0]
+        return min(backends, key=lambda backend: (backend.cost(self.default_ms), backend.in_flight))
+    
+    def release(self, backend: Backend, ok: bool, latency: Optional[float] = None):
+        """Rend la place; ok=False pour un échec de l'hôte (connexion, 5xx)
+        
+        latency (s) est le délai du premier morceau: il reflète la charge de
+        l'hôte sans dépendre de la longueur de la réponse.
+        """
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+            if ok:
+                backend.failures = 0
+                backend.alive = True
+                if latency is not None:
+                    latency_ms = latency * 1000
+                    backend.ewma_ms = latency_ms if backend.ewma_ms is None else \
+                        self.alpha * latency_ms + (1 - self.alpha) * backend.ewma_ms
+                return
+            
+            backend.errors += 1
+            backend.failures += 1
+            retired = backend.alive and backend.failures >= self.failures_to_dead
+            if retired:
+                backend.alive = False
+                backend.next_check = time.monotonic() + self.retry_interval
+        if retired:
+            print(f"⚠️ Ollama {backend.url} en échec, retiré du pool")
+    
+    # ===== SANTÉ =====
+    
+    def check(self, backend: Backend) -> bool:
+        """Interroge /api/tags: état de l'hôte et modèles installés
+        
+        Le délai de lecture suit la durée habituelle de la sonde (4 x EWMA,
+        borné): un hôte figé est détecté vite sans pénaliser un hôte lent.
+        """
+        if backend.probe_ms is None:
+            read_timeout = Config.HEALTH_TIMEOUT_MAX
+        else:
+            read_timeout = min(max(4 * backend.probe_ms / 1000, Config.HEALTH_TIMEOUT_MIN), Config.HEALTH_TIMEOUT_MAX)
+        start = time.perf_counter()
+        try:
+            response = requests.get(f"{backend.url}/api/tags", timeout=(Config.OLLAMA_CONNECT_TIMEOUT, read_timeout))
+            ok = response.status_code == 200
+            models = [model.get('name', '') for model in response.json().get('models', [])] if ok else None
+        except (requests.RequestException, ValueError):
+            ok, models = False, None
+        
+        with self._lock:
+            revived = ok and not backend.alive
+            backend.alive = ok
+            if ok:
+                probe_ms = (time.perf_counter() - start) * 1000
+                backend.probe_ms = probe_ms if backend.probe_ms is None else \
+                    self.alpha * probe_ms + (1 - self.alpha) * backend.probe_ms
+                backend.models = models
+                backend.failures = 0
+            else:
+                backend.next_check = time.monotonic() + self.retry_interval
+        if revived:
+            print(f"✅ Ollama {backend.url} de retour dans le pool")
+        return ok
+    
+    def check_all(self) -> List[Backend]:
+        """Vérifie tous les hôtes en parallèle; retourne les vivants"""
+        if len(self.backends) == 1:
+            self.check(self.backends[0])
+        else:
+            threads = [threading.Thread(target=self.check, args=(backend,), daemon=True)
+                       for backend in self.backends]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return [backend for backend in self.backends if backend.alive]
+    
+    def _revive_due(self):
+        """Revérifie en arrière-plan les hôtes retirés dont le délai est écoulé"""
+        now = time.monotonic()
+        with self._lock:
+            due = [backend for backend in self.backends
+                   if not backend.alive and backend.next_check <= now and backend.url not in self._checking]
+            for backend in due:
+                self._checking.add(backend.url)
+                backend.next_check = now + self.retry_interval
+        for backend in due:
+            threading.Thread(target=self._recheck, args=(backend,), name="santé-ollama", daemon=True).start()
+    
+    def _recheck(self, backend: Backend):
+        try:
+            self.check(backend)
+        finally:
+            with self._lock:
+                self._checking.discard(backend.url)
+    
+    # ===== ÉTAT =====
+    
+    def models(self) -> List[str]:
+        """Modèles installés sur au moins un hôte vivant"""
+        with self._lock:
+            names = []
+            for backend in self.backends:
+                if backend.alive and backend.models:
+                    names.extend(name for name in backend.models if name not in names)
+            return names
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{
+                'url': backend.url,
+                'alive': backend.alive,
+                'in_flight': backend.in_flight,
+                'ewma_ms': backend.ewma_ms,
+                'requests': backend.requests,
+                'errors': backend.errors
+            } for backend in self.backends]
@@ -4,18 +4,40 @@ Service de calcul de calories avec llama3.2:1b
 """
 
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from dataclasses import asdict, replace
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Callable
 from models import NutritionAnalysis, CalorieCalculation, Recipe, DataManager
-from ollama_service import OllamaService
+from ingredient_linker import IngredientLinker
+from semantic_index import SemanticIngredientIndex
+from ollama_service import OllamaService, ChatSession
+from resilience import Deadline, CircuitOpenError
+from instrumentation import instrumentation, bind
+from prompt_builder import PromptBuilder, Prompt
 from config import Config
 
 class CalorieService:
     """Service pour le calcul de calories avec IA uniquement"""
     
-    def __init__(self, ollama_service: OllamaService, data_manager: DataManager, config: Config):
+    DEFAULT_TIPS = "Plat équilibré, à consommer avec modération."
+    
+    def __init__(self, ollama_service: OllamaService, data_manager: DataManager, config: Config,
+                 concurrent_analyses: int = 1):
+        """concurrent_analyses: analyses IA simultanées attendues (API, batch -j)"""
         self.ollama_service = ollama_service
         self.data_manager = data_manager
         self.config = config
+        self.prompts = PromptBuilder(config)
+        self.linker = IngredientLinker(
+            data_manager, config,
+            semantic_index=SemanticIngredientIndex(ollama_service, data_manager, config)
+        )
+        
+        # Pool pour les appels IA concurrents: affinage + conseils de chaque analyse en cours,
+        # sans qu'une analyse attende dans la file derrière une autre
+        self._ai_executor = ThreadPoolExecutor(max_workers=2 * max(1, concurrent_analyses),
+                                               thread_name_prefix="nutrition-ia")
         
         # Facteurs de conversion
         self.conversion_factors = {
@@ -26,57 +48,299 @@ class CalorieService:
             'tranche': 30.0, 'poignée': 50.0
         }
     
-    def analyze_nutrition_with_ai(self, recipe: Recipe) -> Optional[NutritionAnalysis]:
-        """Analyse nutritionnelle avec llama3.2:1b - OBLIGATOIRE"""
-        # Vérifier que llama3.2:1b est disponible
-        if not self.ollama_service.is_available():
+    def analyze_nutrition(self, recipe: Recipe,
+                          on_provisional: Optional[Callable[[NutritionAnalysis], None]] = None,
+                          time_budget: Optional[float] = None,
+                          cancel_event: Optional[threading.Event] = None,
+                          deadline: Optional[Deadline] = None) -> Optional[NutritionAnalysis]:
+        """Analyse nutritionnelle selon Config.NUTRITION_MODE ('hybrid' ou 'ai')
+        
+        deadline est l'échéance de l'action appelante: le budget de l'analyse
+        ne la dépasse pas.
+        """
+        if self.config.NUTRITION_MODE == 'hybrid':
+            return self.analyze_nutrition_hybrid(recipe, on_provisional, time_budget, cancel_event, deadline)
+        return self.analyze_nutrition_with_ai(recipe, on_provisional, time_budget, cancel_event, deadline)
+    
+    @instrumentation.timed(category="service")
+    def analyze_nutrition_with_ai(self, recipe: Recipe,
+                                  on_provisional: Optional[Callable[[NutritionAnalysis], None]] = None,
+                                  time_budget: Optional[float] = None,
+                                  cancel_event: Optional[threading.Event] = None,
+                                  deadline: Optional[Deadline] = None) -> Optional[NutritionAnalysis]:
+        """Analyse nutritionnelle avec llama3.2:1b - OBLIGATOIRE
+        
+        Les totaux de la base sont calculés immédiatement et transmis à
+        on_provisional. L'affinage IA et les conseils tournent en parallèle;
+        le budget de temps commun décide de la réponse finale. Avec
+        Config.NUTRITION_ADVICE_FOLLOWUP, les conseils manquants sont demandés
+        ensuite dans la conversation d'affinage, toujours dans ce budget.
+        """
+        # Le budget commun compte aussi la vérification d'Ollama
+        budget = time_budget if time_budget is not None else self.config.NUTRITION_TIME_BUDGET
+        deadline = Deadline.earliest(deadline, Deadline(budget))
+        
+        # Résultat provisoire à partir de la base de données, avant toute sonde:
+        # affiché même si Ollama est absent
+        basic_analysis = self._calculate_basic_nutrition(recipe)
+        if on_provisional and not (cancel_event is not None and cancel_event.is_set()):
+            on_provisional(basic_analysis)
+        
+        # Circuit ouvert: échec immédiat, sans attendre les délais des sondes
+        try:
+            self.ollama_service.breaker.raise_if_open()
+        except CircuitOpenError as e:
+            raise ConnectionError(f"❌ {e}") from e
+        
+        # Vérifier que llama3.2:1b est disponible (une seule requête)
+        status = self.ollama_service.check_status()
+        if not status['ollama_available']:
             raise ConnectionError("❌ Ollama n'est pas disponible. Démarrez Ollama avec: ollama serve")
         
-        if not self.ollama_service.is_model_available():
+        if not status['model_available']:
             raise ConnectionError("❌ llama3.2:1b n'est pas disponible. Installez avec: ollama pull llama3.2:1b")
         
         # Créer le prompt pour l'analyse nutritionnelle
         ingredients_str = ", ".join([f"{ing['name']} ({ing['quantity']} {ing['unit']})" 
                                    for ing in recipe.ingredients])
         
-        prompt = self.config.PROMPTS['nutrition_prompt'].format(
-            dish_name=recipe.title,
-            ingredients=ingredients_str
-        )
+        prompt = self.prompts.build('nutrition', dish_name=recipe.title, ingredients=ingredients_str)
+        advice_prompt = self.prompts.build('advice', dish_name=recipe.title,
+                                           calories=f"{basic_analysis.total_calories:.0f}",
+                                           proteins=f"{basic_analysis.total_proteins:.0f}")
         
-        # Générer l'analyse avec llama3.2:1b
         print(f"🤖 Analyse nutritionnelle avec llama3.2:1b...")
-        response = self.ollama_service.generate_text(
-            prompt,
-            self.config.PROMPTS['calories_system']
-        )
         
-        if not response:
+        session = None
+        if self.config.NUTRITION_ADVICE_FOLLOWUP:
+            session = self.ollama_service.chat_session(prompt.system, prompt.task)
+            results = self._generate_concurrently({'refine': prompt}, deadline, cancel_event=cancel_event,
+                                                  sessions={'refine': session})
+        else:
+            def refined_with_tips(results):
+                # L'analyse IA complète rend les conseils séparés inutiles
+                analysis = self._parse_nutrition_response(results.get('refine') or "")
+                return bool(analysis and analysis.health_tips)
+            
+            results = self._generate_concurrently({
+                'refine': prompt,
+                'advice': advice_prompt
+            }, deadline, refined_with_tips, cancel_event)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        
+        analysis = self._parse_nutrition_response(results.get('refine') or "")
+        if results.get('refine'):
+            self.prompts.stats.record_parse(prompt, analysis is not None)
+        advice = results.get('advice')
+        advice_done = 'advice' in results
+        if advice_done:
+            self.prompts.stats.record_parse(advice_prompt, bool(advice))
+        
+        # Relance optionnelle: conseils seulement si l'analyse n'en donne pas,
+        # dans la conversation où le plat et ses ingrédients sont déjà évalués
+        if session is not None and not (analysis and analysis.health_tips) and not deadline.expired():
+            sessions = None
+            if session.turns:
+                advice_prompt = self.prompts.build('advice_followup', variant=prompt.variant,
+                                                   dish_name=recipe.title)
+                sessions = {'advice': session}
+            advice_results = self._generate_concurrently({'advice': advice_prompt}, deadline,
+                                                         cancel_event=cancel_event, sessions=sessions)
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            advice = advice_results.get('advice')
+            advice_done = 'advice' in advice_results
+            if advice_done:
+                self.prompts.stats.record_parse(advice_prompt, bool(advice))
+        
+        if analysis:
+            analysis.sources = {ing['name']: 'ia' for ing in recipe.ingredients}
+            if analysis.health_tips:
+                analysis.tips_source = 'ia'
+            else:
+                analysis.health_tips = advice or self.DEFAULT_TIPS
+                analysis.tips_source = 'ia' if advice else 'défaut'
+            return analysis
+        
+        # Aucune réponse exploitable alors que les deux appels sont terminés
+        if 'refine' in results and advice_done and not advice:
             raise RuntimeError("❌ llama3.2:1b n'a pas pu générer d'analyse nutritionnelle")
         
-        # Parser la réponse
-        analysis = self._parse_nutrition_response(response)
+        # Budget écoulé ou parsing impossible: calcul de base + conseils IA
+        return NutritionAnalysis(
+            total_calories=basic_analysis.total_calories,
+            total_proteins=basic_analysis.total_proteins,
+            total_carbs=basic_analysis.total_carbs,
+            total_fats=basic_analysis.total_fats,
+            health_tips=advice or self.DEFAULT_TIPS,
+            sources=basic_analysis.sources,
+            tips_source='ia' if advice else 'défaut'
+        )
+    
+    @instrumentation.timed(category="service")
+    def analyze_nutrition_hybrid(self, recipe: Recipe,
+                                 on_provisional: Optional[Callable[[NutritionAnalysis], None]] = None,
+                                 time_budget: Optional[float] = None,
+                                 cancel_event: Optional[threading.Event] = None,
+                                 deadline: Optional[Deadline] = None) -> Optional[NutritionAnalysis]:
+        """Analyse hybride: totaux de la base, IA pour les aliments inconnus et les conseils
         
-        if not analysis:
-            # Si le parsing échoue, faire un calcul basique + IA pour les conseils
-            basic_analysis = self._calculate_basic_nutrition(recipe)
-            
-            # Demander juste des conseils à l'IA
-            advice_prompt = f"Donne des conseils santé courts pour ce plat: {recipe.title} ({basic_analysis.total_calories:.0f} kcal, {basic_analysis.total_proteins:.0f}g protéines)"
-            advice = self.ollama_service.generate_text(advice_prompt, "Tu es nutritionniste. Réponds en 1-2 phrases.")
-            
-            return NutritionAnalysis(
-                total_calories=basic_analysis.total_calories,
-                total_proteins=basic_analysis.total_proteins,
-                total_carbs=basic_analysis.total_carbs,
-                total_fats=basic_analysis.total_fats,
-                health_tips=advice or "Plat équilibré, à consommer avec modération."
+        Quand tous les ingrédients sont dans la base, les totaux sont définitifs
+        sans génération; llama3.2:1b ne fournit plus que des conseils courts.
+        Le champ sources indique l'origine des valeurs de chaque ingrédient.
+        """
+        resolved, unresolved = [], []
+        for ingredient_info in recipe.ingredients:
+            calc = self._calculate_single_ingredient(
+                ingredient_info.get('name', ''),
+                ingredient_info.get('quantity', 0),
+                ingredient_info.get('unit', 'g')
             )
+            if calc:
+                resolved.append((ingredient_info, calc))
+            else:
+                unresolved.append(ingredient_info)
+        self.linker.save()
+        
+        local = NutritionAnalysis(
+            total_calories=sum(calc.total_calories for _, calc in resolved),
+            total_proteins=sum(calc.proteins for _, calc in resolved),
+            total_carbs=sum(calc.carbs for _, calc in resolved),
+            total_fats=sum(calc.fats for _, calc in resolved),
+            health_tips=self.DEFAULT_TIPS,
+            is_provisional=bool(unresolved),
+            sources={info['name']: 'base' for info, _ in resolved},
+            tips_source='défaut'
+        )
+        for info in unresolved:
+            local.sources[info['name']] = 'non résolu'
+        
+        if on_provisional and not (cancel_event is not None and cancel_event.is_set()):
+            # Copie: local est complété ensuite par les réponses IA
+            on_provisional(replace(local, sources=dict(local.sources)))
+        
+        if self.ollama_service.breaker.stats()['retry_in'] > 0:
+            status = {'model_available': False}  # Circuit ouvert: pas de sonde
+        else:
+            status = self.ollama_service.check_status()
+        if not status['model_available']:
+            # Sans IA, les totaux de la base restent la meilleure réponse
+            local.is_provisional = False
+            return local
+        
+        prompts = {
+            'advice': self.prompts.build('advice', dish_name=recipe.title,
+                                         calories=f"{local.total_calories:.0f}",
+                                         proteins=f"{local.total_proteins:.0f}")
+        }
+        if unresolved:
+            unresolved_str = ", ".join([f"{ing['name']} ({ing['quantity']} {ing['unit']})" 
+                                        for ing in unresolved])
+            prompts['unresolved'] = self.prompts.build('nutrition', dish_name="Aliments hors base",
+                                                       ingredients=unresolved_str)
+            budget = self.config.NUTRITION_TIME_BUDGET
+        else:
+            budget = self.config.ADVICE_TIME_BUDGET
+        
+        if time_budget is not None:
+            budget = time_budget
+        deadline = Deadline.earliest(deadline, Deadline(budget))
+        
+        print(f"🤖 Analyse hybride: {len(resolved)} aliment(s) en base, {len(unresolved)} via llama3.2:1b...")
+        results = self._generate_concurrently(prompts, deadline, cancel_event=cancel_event)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        
+        # Compléter avec l'estimation IA des aliments inconnus
+        estimate = self._parse_nutrition_response(results.get('unresolved') or "")
+        if results.get('unresolved'):
+            self.prompts.stats.record_parse(prompts['unresolved'], estimate is not None)
+        if 'advice' in results:
+            self.prompts.stats.record_parse(prompts['advice'], bool(results['advice']))
+        if estimate:
+            local.total_calories += estimate.total_calories
+            local.total_proteins += estimate.total_proteins
+            local.total_carbs += estimate.total_carbs
+            local.total_fats += estimate.total_fats
+            for info in unresolved:
+                local.sources[info['name']] = 'ia'
+        
+        advice = results.get('advice')
+        if advice:
+            local.health_tips = advice
+            local.tips_source = 'ia'
+        
+        local.is_provisional = False
+        return local
+    
+    def _generate_concurrently(self, prompts: Dict[str, Prompt], deadline: Deadline,
+                               enough: Optional[Callable[[Dict[str, Optional[str]]], bool]] = None,
+                               cancel_event: Optional[threading.Event] = None,
+                               sessions: Optional[Dict[str, ChatSession]] = None
+                               ) -> Dict[str, Optional[str]]:
+        """Lance plusieurs générations en parallèle jusqu'à une échéance commune
+        
+        Retourne les réponses terminées à temps, indexées comme prompts.
+        enough permet d'arrêter l'attente dès qu'un résultat suffit.
+        Un prompt dont la clé est dans sessions est envoyé dans cette conversation.
+        Les générations encore en cours à la fin sont interrompues.
+        """
+        # Événement propre au lot: levé par l'appelant ou à la fin du budget
+        batch_cancel = threading.Event()
+        sessions = sessions or {}
+        futures = {}
+        for key, prompt in prompts.items():
+            if key in sessions:
+                futures[key] = self._ai_executor.submit(bind(sessions[key].send), prompt.text, batch_cancel,
+                                                        None, self._eval_recorder(prompt), deadline)
+            else:
+                futures[key] = self._ai_executor.submit(bind(self.ollama_service.generate_text), prompt.text,
+                                                        prompt.system, batch_cancel, None,
+                                                        self._eval_recorder(prompt), prompt.task, deadline)
+        pending = set(futures.values())
+        results = {}
+        
+        while pending:
+            remaining = deadline.remaining()
+            if remaining <= 0 or (cancel_event is not None and cancel_event.is_set()):
+                break
+            # Attente par tranches pour réagir vite à une annulation
+            done, pending = wait(pending, timeout=min(remaining, 0.25), return_when=FIRST_COMPLETED)
+            for key, future in futures.items():
+                if future in done:
+                    results[key] = self._future_text(future)
+            if enough and enough(results):
+                break
+        
+        for future in pending:
+            future.cancel()
+        if pending:
+            # Libérer le modèle: les réponses tardives ne serviront pas
+            batch_cancel.set()
         
-        return analysis
+        return results
+    
+    def _eval_recorder(self, prompt: Prompt) -> Callable[[Dict[str, Any]], None]:
+        return lambda timings: self.prompts.stats.record_eval(prompt, timings)
+    
+    def _future_text(self, future) -> Optional[str]:
+        """Résultat d'un appel IA terminé, None sinon"""
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Erreur appel IA: {e}")
+            return None
     
-    def calculate_meal_calories(self, foods_data: List[Dict[str, Any]]) -> List[CalorieCalculation]:
-        """Calcule les calories pour une liste d'aliments - avec IA pour conseils"""
+    def calculate_meal_calories(self, foods_data: List[Dict[str, Any]],
+                                blocking: bool = True) -> List[CalorieCalculation]:
+        """Calcule les calories pour une liste d'aliments (base de données uniquement)
+        
+        blocking=False depuis le thread de l'interface: aucun appel à Ollama
+        pour rapprocher les noms inconnus.
+        """
         if not foods_data:
             raise ValueError("❌ Aucun aliment à analyser")
         
@@ -86,39 +350,38 @@ class CalorieService:
             calc = self._calculate_single_ingredient(
                 item.get('name', ''),
                 item.get('quantity', 0),
-                item.get('unit', 'g')
+                item.get('unit', 'g'),
+                blocking
             )
             if calc:
                 calculations.append(calc)
         
-        # Si llama3.2:1b est disponible, ajouter des conseils IA
-        if calculations and self.ollama_service.is_available() and self.ollama_service.is_model_available():
-            total_calories = sum(calc.total_calories for calc in calculations)
-            foods_list = ", ".join([calc.ingredient_name for calc in calculations])
-            
-            advice_prompt = f"Conseils nutritionnels courts pour ce repas: {foods_list} (Total: {total_calories:.0f} kcal)"
-            advice = self.ollama_service.generate_text(
-                advice_prompt, 
-                "Tu es nutritionniste. Donne 1-2 conseils courts en français."
-            )
-            
-            # Stocker les conseils pour utilisation ultérieure
-            if advice and calculations:
-                # Les conseils seront utilisés dans l'interface
-                pass
-        
+        self.linker.save()
         return calculations
     
-    def _calculate_single_ingredient(self, name: str, quantity: float, unit: str) -> Optional[CalorieCalculation]:
+    def summarize_meal(self, foods_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Totaux, détail par aliment et noms non reconnus d'un repas (sérialisable en JSON)"""
+        calculations = self.calculate_meal_calories(foods_data)
+        unresolved = [item.get('name', '') for item in foods_data
+                      if self.linker.link(item.get('name', '')) is None]
+        return {
+            'totals': {
+                'calories': round(sum(c.total_calories for c in calculations), 1),
+                'proteins': round(sum(c.proteins for c in calculations), 1),
+                'carbs': round(sum(c.carbs for c in calculations), 1),
+                'fats': round(sum(c.fats for c in calculations), 1),
+                'fiber': round(sum(c.fiber for c in calculations), 1)
+            },
+            'items': [asdict(calc) for calc in calculations],
+            'resolved': len(calculations),
+            'unresolved': unresolved
+        }
+    
+    def _calculate_single_ingredient(self, name: str, quantity: float, unit: str,
+                                     blocking: bool = True) -> Optional[CalorieCalculation]:
         """Calcule les calories pour un seul ingrédient"""
-        # Chercher l'ingrédient dans la base de données
-        ingredient = self.data_manager.get_ingredient(name)
-        if not ingredient:
-            # Essayer une recherche floue
-            search_results = self.data_manager.search_ingredients(name)
-            if search_results:
-                ingredient = search_results[0]  # Prendre le premier résultat
-        
+        # Chercher l'ingrédient dans la base de données (noms libres liés)
+        ingredient = self.linker.link(name, blocking)
         if not ingredient:
             return None
         
@@ -152,6 +415,7 @@ class CalorieService:
         # Si l'unité n'est pas trouvée, considérer comme grammes
         return quantity
     
+    @instrumentation.timed(category="service")
     def _parse_nutrition_response(self, response: str) -> Optional[NutritionAnalysis]:
         """Parse la réponse nutritionnelle de llama3.2:1b"""
         try:
@@ -172,22 +436,22 @@ class CalorieService:
                     calories_match = re.search(r'(\d+(?:\.\d+)?)', line)
                     if calories_match:
                         nutrition_data['calories'] = float(calories_match.group(1))
-                        
+                
                 elif 'PROTEINES:' in line_upper or 'PROTÉINES:' in line_upper:
                     proteins_match = re.search(r'(\d+(?:\.\d+)?)', line)
                     if proteins_match:
                         nutrition_data['proteins'] = float(proteins_match.group(1))
-                        
+                
                 elif 'GLUCIDES:' in line_upper:
                     carbs_match = re.search(r'(\d+(?:\.\d+)?)', line)
                     if carbs_match:
                         nutrition_data['carbs'] = float(carbs_match.group(1))
-                        
+                
                 elif 'LIPIDES:' in line_upper:
                     fats_match = re.search(r'(\d+(?:\.\d+)?)', line)
                     if fats_match:
                         nutrition_data['fats'] = float(fats_match.group(1))
-                        
+                
                 elif 'CONSEILS_NUTRITION:' in line_upper:
                     nutrition_data['tips'] = line.split(':', 1)[1].strip()
             
@@ -202,20 +466,23 @@ class CalorieService:
                 )
             
             return None
-            
+        
         except Exception as e:
             print(f"Erreur parsing nutrition: {e}")
             return None
     
+    @instrumentation.timed(category="service")
     def _calculate_basic_nutrition(self, recipe: Recipe) -> NutritionAnalysis:
         """Calcul nutritionnel de base à partir de la base de données"""
         total_calories = 0
         total_proteins = 0
         total_carbs = 0
         total_fats = 0
+        sources = {}
         
         for ingredient_info in recipe.ingredients:
-            ingredient = self.data_manager.get_ingredient(ingredient_info['name'])
+            ingredient = self.linker.link(ingredient_info['name'])
+            sources[ingredient_info['name']] = 'base' if ingredient else 'non résolu'
             if ingredient:
                 quantity_g = self._convert_to_grams(
                     ingredient_info['quantity'], 
@@ -227,11 +494,14 @@ class CalorieService:
                 total_proteins += ingredient.proteins * factor
                 total_carbs += ingredient.carbs * factor
                 total_fats += ingredient.fats * factor
+        self.linker.save()
         
         return NutritionAnalysis(
             total_calories=total_calories,
             total_proteins=total_proteins,
             total_carbs=total_carbs,
             total_fats=total_fats,
-            health_tips="Calcul basé sur la base de données nutritionnelles"
+            health_tips="Calcul basé sur la base de données nutritionnelles",
+            is_provisional=True,
+            sources=sources
         )
\ No newline at end of file
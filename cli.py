@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+Mode batch sans interface: recettes et nutrition depuis JSONL/CSV vers JSONL,
+export du journal des repas ou des résultats vers JSONL, CSV ou PDF,
+comparaison des variantes de prompts
+"""
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from config import Config
+
+class BatchJob:
+    """Exécute une tâche par enregistrement et écrit chaque résultat dès qu'il est prêt
+    
+    Les enregistrements sont lus au fil de l'eau (au plus 2 x concurrence en
+    vol), de sorte qu'un catalogue entier ne passe jamais en mémoire.
+    """
+    
+    def __init__(self, handler: Callable[[Dict[str, Any], threading.Event], Dict[str, Any]], output,
+                 concurrency: int = Config.CLI_CONCURRENCY, cache: Optional['ResultCache'] = None,
+                 done_ids: Optional[Set[str]] = None):
+        self.handler = handler
+        self.output = output
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self.done_ids = done_ids or set()
+        self.cancel_event = threading.Event()
+        
+        self._write_lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.counts = {'ok': 0, 'error': 0, 'skipped': 0, 'cached': 0}
+    
+    def run(self, records: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """Traite tous les enregistrements et retourne le résumé"""
+        started = time.perf_counter()
+        pending = set()
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as pool:
+            try:
+                for record in records:
+                    if self.cancel_event.is_set():
+                        break
+                    if record['id'] in self.done_ids:
+                        self.counts['skipped'] += 1
+                        continue
+                    
+                    cached = self.cache.get(record['key']) if self.cache else None
+                    if cached is not None:
+                        self.counts['cached'] += 1
+                        self._write(record, 'ok', cached, 0.0, cached=True)
+                        continue
+                    
+                    pending.add(pool.submit(self._process, record))
+                    if len(pending) >= self.concurrency * 2:
+                        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                
+                wait(pending)
+            except KeyboardInterrupt:
+                print("⏹️ Interruption: arrêt après les tâches en cours", file=sys.stderr)
+                self.cancel_event.set()
+                for future in pending:
+                    future.cancel()
+        
+        return self.summary(time.perf_counter() - started)
+    
+    def _process(self, record: Dict[str, Any]):
+        if self.cancel_event.is_set():
+            return
+        start = time.perf_counter()
+        try:
+            result = self.handler(record, self.cancel_event)
+        except Exception as e:
+            self._write(record, 'error', str(e), time.perf_counter() - start)
+            return
+        
+        latency = time.perf_counter() - start
+        if self.cache:
+            self.cache.put(record['key'], result)
+        self._write(record, 'ok', result, latency)
+    
+    def _write(self, record: Dict[str, Any], status: str, value: Any, latency: float, cached: bool = False):
+        line = {'id': record['id'], 'status': status, 'latency_ms': round(latency * 1000, 1)}
+        if cached:
+            line['cached'] = True
+        line['result' if status == 'ok' else 'error'] = value
+        
+        with self._write_lock:
+            self.output.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self.output.flush()
+            if status == 'ok':
+                self.counts['ok'] += 1
+            else:
+                self.counts['error'] += 1
+            if not cached:
+                self.latencies.append(latency)
+    
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """Débit et percentiles de latence (ms)"""
+        latencies = sorted(self.latencies)
+        processed = self.counts['ok'] + self.counts['error']
+        summary = dict(self.counts)
+        summary['elapsed_s'] = round(elapsed, 2)
+        summary['throughput_per_s'] = round(processed / elapsed, 2) if elapsed > 0 else 0.0
+        for name, fraction in (('p50', 0.50), ('p90', 0.90), ('p99', 0.99)):
+            summary[f'{name}_ms'] = round(percentile(latencies, fraction) * 1000, 1)
+        summary['max_ms'] = round(latencies[-1] * 1000, 1) if latencies else 0.0
+        return summary
+
+class ResultCache:
+    """Résultats persistés (JSONL) indexés par la forme canonique de la demande"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._results: Dict[str, Any] = {}
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            self._results[entry['key']] = entry['result']
+                        except (ValueError, KeyError):
+                            continue  # Ligne tronquée par un arrêt brutal
+        except OSError as e:
+            print(f"Erreur lecture cache batch: {e}", file=sys.stderr)
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._results.get(key)
+    
+    def put(self, key: str, result: Any):
+        with self._lock:
+            self._results[key] = result
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'result': result}, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Erreur écriture cache batch: {e}", file=sys.stderr)
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentile au rang le plus proche d'une liste triée"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def canonical_key(kind: str, payload: Dict[str, Any]) -> str:
+    """Empreinte stable d'une demande, indépendante de l'ordre et de la casse"""
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return f"{kind}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+# ===== LECTURE DES ENTRÉES =====
+
+def _split_list(value: Any) -> List[str]:
+    """Liste d'ingrédients depuis une liste JSON ou "a;b;c" / "a|b" / "a, b" """
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    text = str(value or "")
+    for separator in (';', '|', ','):
+        if separator in text:
+            return [part.strip() for part in text.split(separator) if part.strip()]
+    return [text.strip()] if text.strip() else []
+
+def _read_rows(stream, fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(numéro de ligne, objet) depuis du JSONL ou du CSV"""
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield number, {key.strip(): (value or "").strip() for key, value in row.items() if key}
+        return
+    
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            print(f"Ligne {number} ignorée (JSON invalide): {e}", file=sys.stderr)
+            continue
+        # Une liste seule est un ensemble d'ingrédients
+        yield number, data if isinstance(data, dict) else {'ingredients': data}
+
+def read_recipe_requests(stream, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Ensembles d'ingrédients: {"id", "ingredients", "cuisine_type", "difficulty", "prep_time"}"""
+    for number, row in _read_rows(stream, fmt):
+        ingredients = _split_list(row.get('ingredients'))
+        payload = {
+            'ingredients': sorted({name.lower() for name in ingredients}),
+            'cuisine_type': row.get('cuisine_type', ""),
+            'difficulty': row.get('difficulty', ""),
+            'prep_time': row.get('prep_time', "")
+        }
+        yield {
+            'id': str(row.get('id') or f"ligne-{number}"),
+            'key': canonical_key('recipe', payload),
+            'ingredients': ingredients,
+            'cuisine_type': payload['cuisine_type'],
+            'difficulty': payload['difficulty'],
+            'prep_time': payload['prep_time']
+        }
+
+def _food(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Aliment d'un repas; ValueError si le nom manque ou si la quantité n'est pas un nombre"""
+    name = str(item.get('name') or "").strip()
+    if not name:
+        raise ValueError("Aliment sans 'name'")
+    quantity = item.get('quantity')
+    try:
+        quantity = float(quantity) if quantity not in (None, "") else 100.0
+    except (TypeError, ValueError):
+        raise ValueError(f"Quantité invalide pour '{name}': {quantity!r}") from None
+    return {'name': name, 'quantity': quantity, 'unit': str(item.get('unit') or 'g').strip()}
+
+def read_meal_requests(stream, fmt: str, with_ai: bool = False) -> Iterator[Dict[str, Any]]:
+    """Repas: JSONL {"id", "foods": [{"name", "quantity", "unit"}]}
+    
+    En CSV, une ligne par aliment (id,name,quantity,unit); les lignes
+    consécutives de même id forment un repas. Un repas dont un aliment est
+    invalide porte son erreur et sera rapporté en échec, sans calcul.
+    """
+    def meal(meal_id: str, foods: List[Dict[str, Any]], error: Optional[str] = None) -> Dict[str, Any]:
+        if error:
+            # Jamais mis en cache: la clé ne sert qu'à cet enregistrement
+            return {'id': meal_id, 'key': canonical_key('invalid', {'id': meal_id, 'error': error}),
+                    'foods': [], 'error': error}
+        payload = sorted((food['name'].lower(), food['quantity'], food['unit'].lower()) for food in foods)
+        key = canonical_key('meal', {'foods': payload, 'ai': with_ai})
+        return {'id': meal_id, 'key': key, 'foods': foods}
+    
+    if fmt == 'csv':
+        current_id, foods, error = None, [], None
+        for number, row in _read_rows(stream, fmt):
+            row_id = str(row.get('id') or f"ligne-{number}")
+            if current_id is not None and row_id != current_id:
+                yield meal(current_id, foods, error)
+                foods, error = [], None
+            current_id = row_id
+            try:
+                foods.append(_food(row))
+            except ValueError as e:
+                error = error or f"Ligne {number}: {e}"
+        if current_id is not None:
+            yield meal(current_id, foods, error)
+        return
+    
+    for number, row in _read_rows(stream, fmt):
+        meal_id = str(row.get('id') or f"ligne-{number}")
+        try:
+            foods = [_food(item) for item in row.get('foods', []) if isinstance(item, dict)]
+        except ValueError as e:
+            yield meal(meal_id, [], f"Ligne {number}: {e}")
+            continue
+        yield meal(meal_id, foods)
+
+def completed_ids(path: str) -> Set[str]:
+    """Identifiants déjà traités avec succès dans un fichier de sortie existant"""
+    done = set()
+    if not path or path == '-' or not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('status') == 'ok':
+                done.add(str(entry.get('id')))
+    return done
+
+# ===== TRAITEMENTS =====
+
+def make_recipe_handler(recipe_service) -> Callable[[Dict[str, Any], threading.Event], Dict[str, Any]]:
+    from resilience import Deadline
+    
+    def handle(record: Dict[str, Any], cancel_event: threading.Event) -> Dict[str, Any]:
+        # Un budget par enregistrement, réessais compris
+        recipe = recipe_service.generate_recipe(
+            record['ingredients'], record['cuisine_type'], record['difficulty'], record['prep_time'],
+            cancel_event=cancel_event, deadline=Deadline(recipe_service.config.RECIPE_TIME_BUDGET)
+        )
+        if recipe is None:
+            raise RuntimeError("Génération annulée")
+        return asdict(recipe)
+    return handle
+
+def make_meal_handler(calorie_service, with_ai: bool) -> Callable[[Dict[str, Any], threading.Event], Dict[str, Any]]:
+    from models import Recipe
+    
+    def handle(record: Dict[str, Any], cancel_event: threading.Event) -> Dict[str, Any]:
+        if record.get('error'):
+            raise ValueError(record['error'])
+        foods = record['foods']
+        result = calorie_service.summarize_meal(foods)
+        
+        if with_ai:
+            recipe = Recipe(title=record['id'], ingredients=foods, steps=[], prep_time="", difficulty="")
+            analysis = calorie_service.analyze_nutrition(recipe, cancel_event=cancel_event)
+            result['analysis'] = asdict(analysis) if analysis else None
+        return result
+    return handle
+
+# ===== POINT D'ENTRÉE =====
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Traitement par lots sans interface (sortie JSONL, un résultat par ligne)"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    def common(sub):
+        sub.add_argument('-i', '--input', default='-', help="Fichier JSONL/CSV (défaut: entrée standard)")
+        sub.add_argument('-o', '--output', default='-', help="Fichier JSONL (défaut: sortie standard)")
+        sub.add_argument('-f', '--format', choices=['auto', 'jsonl', 'csv'], default='auto',
+                         help="Format d'entrée (auto: selon l'extension)")
+        sub.add_argument('-j', '--concurrency', type=int, default=Config.CLI_CONCURRENCY,
+                         help="Traitements simultanés")
+        sub.add_argument('--resume', action='store_true',
+                         help="Ignorer les id déjà réussis dans le fichier de sortie et y ajouter la suite")
+        sub.add_argument('--cache', default=Config.CLI_CACHE_FILE,
+                         help="Cache des résultats par demande canonique")
+        sub.add_argument('--no-cache', action='store_true', help="Ne pas lire ni écrire le cache")
+    
+    common(subparsers.add_parser('recipes', help="Générer une recette par ensemble d'ingrédients"))
+    nutrition = subparsers.add_parser('nutrition', help="Calculer les calories de chaque repas")
+    common(nutrition)
+    nutrition.add_argument('--ai', action='store_true',
+                           help="Ajouter l'analyse nutritionnelle IA (Config.NUTRITION_MODE)")
+    
+    export = subparsers.add_parser('export', help="Exporter le journal des repas ou des résultats JSONL")
+    export.add_argument('-s', '--source', default='meal-log',
+                        help="meal-log (journal des repas), library (recettes) ou fichier JSONL de résultats")
+    export.add_argument('-k', '--kind', choices=['recipe', 'meal'], default='meal',
+                        help="Type d'enregistrements du fichier source")
+    export.add_argument('-u', '--user', default=None, help="Utilisateur du journal (défaut: tous)")
+    export.add_argument('-o', '--output', required=True, help="Fichier .jsonl, .json, .csv ou .pdf")
+    
+    prompts = subparsers.add_parser('prompts', help="Comparer les variantes de prompts sur des exemples")
+    prompts.add_argument('-n', '--runs', type=int, default=3, help="Exécutions par tâche et par variante")
+    return parser
+
+# Exemples du banc d'essai: des entrées différentes à chaque exécution,
+# sinon le cache de préfixe d'Ollama fausse prompt_eval_count
+BENCHMARK_INGREDIENTS = [
+    ['poulet', 'riz', 'courgette'],
+    ['saumon', 'pomme de terre', 'brocoli', 'citron'],
+    ['pâtes', 'tomate', 'basilic', 'mozzarella'],
+    ['lentilles', 'carotte', 'oignon'],
+    ['oeuf', 'épinards', 'fromage', 'pain']
+]
+
+def run_prompts(args) -> int:
+    """Banc d'essai: chaque variante sur les mêmes exemples, mesures d'Ollama
+    
+    Le tableau (stderr) permet de choisir Config.PROMPT_VARIANTS: la variante
+    la plus rapide à évaluer dont le taux de parsing reste à 100 %.
+    """
+    with contextlib.redirect_stdout(sys.stderr):
+        from models import DataManager, Recipe
+        from ollama_service import OllamaService
+        from recipe_service import RecipeService
+        from calorie_service import CalorieService
+        from prompt_builder import PromptBuilder, TASKS, prompt_stats
+        
+        config = Config()
+        ollama_service = OllamaService(config)
+        if not ollama_service.check_status()['model_available']:
+            print(f"❌ {config.OLLAMA_MODEL} indisponible sur {', '.join(config.OLLAMA_BASE_URLS)}", file=sys.stderr)
+            return 2
+        
+        # Sans bibliothèque: chaque demande part au modèle
+        recipe_service = RecipeService(ollama_service, config)
+        calorie_service = CalorieService(ollama_service, DataManager(config), config)
+        prompt_stats.reset()
+        
+        for variant in PromptBuilder.VARIANTS:
+            config.PROMPT_VARIANTS = {task: variant for task in TASKS}
+            for run in range(max(1, args.runs)):
+                ingredients = BENCHMARK_INGREDIENTS[run % len(BENCHMARK_INGREDIENTS)]
+                print(f"🧪 {variant} {run + 1}/{args.runs}: {', '.join(ingredients)}", file=sys.stderr)
+                try:
+                    recipe = recipe_service.generate_recipe(ingredients)
+                    recipe = recipe or Recipe(title=" ".join(ingredients).capitalize(), steps=[],
+                                              ingredients=[{'name': name, 'quantity': 100, 'unit': 'g'}
+                                                           for name in ingredients],
+                                              prep_time="", difficulty="")
+                    calorie_service.analyze_nutrition_with_ai(recipe, time_budget=ollama_service.timeout)
+                except (ConnectionError, RuntimeError, ValueError) as e:
+                    print(f"❌ {e}", file=sys.stderr)
+    
+    report = prompt_stats.report()
+    print(f"{'tâche':<10} {'variante':<9} {'estimés':>8} {'prompt':>7} {'éval ms':>8} "
+          f"{'génér. ms':>10} {'parsing':>8}", file=sys.stderr)
+    for row in report:
+        parse_rate = f"{row['parse_rate']:.0%}" if row['parse_rate'] is not None else "-"
+        print(f"{row['task']:<10} {row['variant']:<9} {row['estimated_tokens']:>8.0f} "
+              f"{row['prompt_tokens']:>7.0f} {row['prompt_eval_ms']:>8.1f} "
+              f"{row['eval_ms']:>10.1f} {parse_rate:>8}", file=sys.stderr)
+    for row in report:
+        print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+def run_export(args) -> int:
+    """Export en flux: la source est lue au fil de l'écriture"""
+    import export_pipeline
+    
+    store = None
+    try:
+        if args.source == 'meal-log':
+            from meal_log import MealLog
+            store = MealLog(Config.MEAL_LOG_DB, Config.MEAL_LOG_BATCH_SIZE)
+            kind = 'meal'
+            total = store.count_days(args.user)
+            records = export_pipeline.meal_log_source(store, args.user)
+        elif args.source == 'library':
+            from recipe_library import RecipeLibrary
+            store = RecipeLibrary(Config.RECIPE_LIBRARY_DB, Config.RECIPE_LIBRARY_VARIANTS)
+            kind = 'recipe'
+            total = store.stats()['recipes']
+            records = export_pipeline.library_source(store)
+        else:
+            kind = args.kind
+            total = export_pipeline.count_lines(args.source)
+            records = export_pipeline.jsonl_source(args.source, kind)
+        
+        writer = export_pipeline.writer_for(args.output, kind)
+        start = time.perf_counter()
+        
+        def on_progress(done, total):
+            print(f"\r📤 {done}/{total}", end="", file=sys.stderr, flush=True)
+        
+        count = export_pipeline.export_records(records, writer, total, on_progress)
+        print(f"\n✅ {count} enregistrement(s) exporté(s) vers {args.output} "
+              f"en {time.perf_counter() - start:.2f} s", file=sys.stderr)
+        return 0
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ Export impossible: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if store is not None:
+            store.close()
+
+def run_cli(argv: Optional[List[str]] = None) -> int:
+    """Exécute une sous-commande; retourne le code de sortie"""
+    args = build_parser().parse_args(argv)
+    if args.command == 'export':
+        return run_export(args)
+    if args.command == 'prompts':
+        return run_prompts(args)
+    
+    fmt = args.format
+    if fmt == 'auto':
+        fmt = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+    if args.resume and args.output == '-':
+        print("❌ --resume nécessite --output FICHIER", file=sys.stderr)
+        return 2
+    
+    # Les services écrivent leur progression avec print: la garder hors du JSONL
+    results_out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        from models import DataManager
+        from ollama_service import OllamaService
+        
+        Config.ensure_data_dir()
+        config = Config()
+        ollama_service = OllamaService(config)
+        needs_ai = args.command == 'recipes' or args.ai
+        if needs_ai:
+            status = ollama_service.check_status()
+            if not status['model_available']:
+                print(f"❌ {config.OLLAMA_MODEL} indisponible sur {', '.join(config.OLLAMA_BASE_URLS)}", file=sys.stderr)
+                return 2
+        
+        if args.command == 'recipes':
+            from recipe_service import RecipeService
+            from recipe_library import RecipeLibrary
+            # Les recettes générées alimentent aussi la bibliothèque de l'interface
+            library = RecipeLibrary(config.RECIPE_LIBRARY_DB, config.RECIPE_LIBRARY_VARIANTS)
+            handler = make_recipe_handler(RecipeService(ollama_service, config, library))
+            reader = read_recipe_requests
+        else:
+            from calorie_service import CalorieService
+            calorie_service = CalorieService(ollama_service, DataManager(config), config,
+                                             concurrent_analyses=args.concurrency)
+            handler = make_meal_handler(calorie_service, args.ai)
+            reader = lambda stream, fmt: read_meal_requests(stream, fmt, args.ai)
+        
+        done_ids = completed_ids(args.output) if args.resume else set()
+        cache = None if args.no_cache else ResultCache(args.cache)
+        
+        input_stream = (sys.stdin if args.input == '-'
+                        else open(args.input, 'r', encoding='utf-8', newline=''))
+        output_stream = (results_out if args.output == '-'
+                         else open(args.output, 'a' if args.resume else 'w', encoding='utf-8'))
+        try:
+            job = BatchJob(handler, output_stream, args.concurrency, cache, done_ids)
+            summary = job.run(reader(input_stream, fmt))
+        finally:
+            if input_stream is not sys.stdin:
+                input_stream.close()
+            if output_stream is not results_out:
+                output_stream.close()
+            if config.METRICS_FILE:
+                # Instantané pour le collecteur textfile (avant la fermeture de la bibliothèque)
+                from metrics import metrics
+                try:
+                    metrics.write_snapshot(config.METRICS_FILE)
+                except OSError as e:
+                    print(f"❌ Instantané des métriques: {e}", file=sys.stderr)
+            if args.command == 'nutrition':
+                calorie_service.linker.save()
+            else:
+                library.close()
+    
+    print(f"📊 {args.command}: {summary['ok']} ok, {summary['error']} erreurs, "
+          f"{summary['skipped']} déjà faits, {summary['cached']} depuis le cache "
+          f"en {summary['elapsed_s']} s ({summary['throughput_per_s']}/s) | "
+          f"p50 {summary['p50_ms']} ms, p90 {summary['p90_ms']} ms, "
+          f"p99 {summary['p99_ms']} ms, max {summary['max_ms']} ms", file=sys.stderr)
+    print(json.dumps({'summary': summary}), file=sys.stderr)
+    return 0 if summary['error'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
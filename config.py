@@ -10,15 +10,158 @@ class Config:
     # Configuration Ollama
     OLLAMA_BASE_URL = "http://localhost:11434"
     OLLAMA_MODEL = "llama3.2:1b"  # Modèle compact spécialisé
+    OLLAMA_KEEP_ALIVE = "10m"  # Modèle gardé chargé (et son cache de préfixe) entre deux appels
+    
+    # Serveurs Ollama du pool (OLLAMA_HOSTS="http://a:11434,http://b:11434"), OLLAMA_BASE_URL par défaut
+    OLLAMA_BASE_URLS = [url.strip() for url in os.environ.get("OLLAMA_HOSTS", "").split(",")
+                        if url.strip()] or [OLLAMA_BASE_URL]
+    BACKEND_POLICY = "least_loaded"  # ou "weighted": tirage pondéré par l'inverse de l'attente estimée
+    BACKEND_EWMA_ALPHA = 0.3  # Poids de la dernière mesure dans la latence lissée
+    BACKEND_FAILURES_TO_DEAD = 2  # Échecs de connexion consécutifs avant retrait d'un hôte
+    BACKEND_RETRY_INTERVAL = 15  # Secondes entre deux vérifications d'un hôte retiré
+    BACKEND_DEFAULT_LATENCY_MS = 1000  # Latence supposée d'un hôte pas encore mesuré
+    
+    # Résilience: délai de connexion, réessais (avant le premier morceau) et disjoncteur
+    OLLAMA_CONNECT_TIMEOUT = 3
+    OLLAMA_RETRY_ATTEMPTS = 3  # Essais au total par appel
+    OLLAMA_RETRY_BASE = 0.5  # Attente maximale du 1er réessai (s), doublée ensuite, tirée au hasard
+    OLLAMA_RETRY_MAX = 4
+    OLLAMA_RETRY_KINDS = ('connect', 'server')  # Un délai de lecture dépassé a déjà coûté le timeout entier
+    BREAKER_FAILURES = 4  # Échecs serveur consécutifs avant ouverture du circuit
+    BREAKER_RESET = 20  # Secondes de refus immédiat avant un appel test
+    
+    # Délais adaptatifs par route: marge sur les percentiles observés (premier morceau,
+    # débit en tokens/s) et longueur demandée; valeurs de départ tant que la route est peu mesurée
+    TIMEOUT_FACTOR = 2.0
+    TIMEOUT_MIN_SAMPLES = 5
+    FIRST_TOKEN_TIMEOUT = 30  # Avant mesure (chargement du modèle compris)
+    FIRST_TOKEN_TIMEOUT_MIN = 5
+    FIRST_TOKEN_TIMEOUT_MAX = 120
+    TOTAL_TIMEOUT_MIN = 10
+    TOTAL_TIMEOUT_MAX = 600
+    STALL_TOKENS = 20  # Flux bloqué: plus rien pendant le temps de ~20 tokens au débit le plus lent
+    STALL_TIMEOUT_MIN = 5
+    STALL_TIMEOUT_MAX = 60
+    OLLAMA_ASSUMED_RATE = 5  # Tokens/s supposés (CPU lent) avant mesure
+    TASK_OUTPUT_TOKENS = {'recipe': 600, 'nutrition': 150, 'advice': 80, 'ping': 30}  # Sans num_predict
+    OUTPUT_TOKENS_DEFAULT = 400
+    HEALTH_TIMEOUT_MIN = 1  # Sonde /api/tags: 4 x latence lissée, dans ces bornes
+    HEALTH_TIMEOUT_MAX = 5
+    
+    # Budget global d'une action (clic, requête API, enregistrement batch) de génération de recette
+    RECIPE_TIME_BUDGET = 300
+    
+    # Routage par tâche: modèle, options propres et replis (OLLAMA_MODEL en dernier recours)
+    MODEL_ROUTES = {
+        'recipe': {'model': OLLAMA_MODEL},
+        'nutrition': {'model': OLLAMA_MODEL},
+        'advice': {'model': "qwen2.5:0.5b", 'fallback': [OLLAMA_MODEL], 'options': {'num_predict': 80}},
+        'ping': {'model': "qwen2.5:0.5b", 'fallback': [OLLAMA_MODEL], 'options': {'num_predict': 30}}
+    }
+    MODEL_LIST_TTL = 60  # Secondes avant de relire la liste des modèles installés
+    ROUTE_LATENCY_WINDOW = 200  # Derniers appels gardés par route pour les percentiles
+    
+    # Conversations (/api/chat): tours conservés, taille estimée maximale, sessions gardées par recette
+    CHAT_MAX_TURNS = 4
+    CHAT_MAX_TOKENS = 1500
+    CHAT_SESSIONS = 16
+    
+    # Analyse nutritionnelle: 'hybrid' (base + IA pour l'inconnu) ou 'ai'
+    NUTRITION_MODE = "hybrid"
+    # Mode 'ai': conseils demandés en relance de la conversation d'affinage
+    # (préfixe en cache, mais deux générations successives) au lieu d'en parallèle
+    NUTRITION_ADVICE_FOLLOWUP = False
+    
+    # Budget global (secondes) de l'analyse nutritionnelle IA
+    NUTRITION_TIME_BUDGET = 25
+    ADVICE_TIME_BUDGET = 10
     
     # Configuration de l'application
     APP_TITLE = "🍽️ Assistant Culinaire & Calories IA"
     APP_VERSION = "3.0.0"
     APP_GEOMETRY = "1600x1000"
+    STARTUP_TARGET_MS = 1500  # Objectif lancement → premier affichage
+    
+    # Tâches d'arrière-plan: nombre de workers et période de la file Tk (ms)
+    TASK_WORKERS = 3
+    TASK_POLL_MS = 50
+    
+    # Instrumentation: période de mesure de la boucle Tk et seuil de blocage (ms)
+    LAG_MONITOR_INTERVAL_MS = 100
+    LAG_WARN_MS = 200
+    PERF_REFRESH_MS = 1000
+    TRACE_MAX_SPANS = 5000
+    PERF_TRACE_FILE = os.environ.get("ASSISTANT_TRACE_FILE", "")  # Trace écrite à la fermeture
+    
+    # Métriques Prometheus: GET /metrics sur ce port (0 = désactivé; l'API les sert
+    # sur son propre port) et instantané périodique dans un fichier (vide = aucun)
+    METRICS_HOST = "127.0.0.1"
+    METRICS_PORT = int(os.environ.get("ASSISTANT_METRICS_PORT", "0") or 0)
+    METRICS_FILE = os.environ.get("ASSISTANT_METRICS_FILE", "")
+    METRICS_SNAPSHOT_INTERVAL = 15
+    
+    # Journal des repas: utilisateur par défaut, taille des lots d'insertion, pages d'historique
+    MEAL_LOG_USER = os.environ.get("USER") or os.environ.get("USERNAME") or "moi"
+    MEAL_LOG_BATCH_SIZE = 500
+    MEAL_HISTORY_PAGE = 60
+    
+    # Bibliothèque de recettes: politique par défaut (library, variants, regenerate)
+    # et nombre de variantes conservées par ensemble d'ingrédients et d'options
+    RECIPE_LIBRARY_POLICY = 'library'
+    RECIPE_LIBRARY_VARIANTS = 3
+    RECIPE_SUGGESTIONS = 5  # Recettes proches proposées pendant une génération
+    
+    # Export groupé: période minimale (s) entre deux mises à jour de progression
+    EXPORT_PROGRESS_INTERVAL = 0.2
+    
+    # Mode batch (cli.py): traitements simultanés et cache des résultats
+    CLI_CONCURRENCY = 4
+    CLI_CACHE_FILE = os.path.join(os.path.dirname(__file__), "data", "batch_cache.jsonl")
+    
+    # API HTTP locale (api_server.py)
+    API_HOST = "127.0.0.1"
+    API_PORT = 8765
+    API_WORKERS = 8                   # Threads pour les appels bloquants des services
+    API_MAX_CONCURRENT_REQUESTS = 64  # Au-delà: 503
+    API_OLLAMA_CONCURRENCY = 2        # Générations simultanées par serveur (OLLAMA_NUM_PARALLEL)
+    API_OLLAMA_QUEUE = 8              # Demandes IA en attente avant 503 + Retry-After
+    API_KEEPALIVE_TIMEOUT = 15        # Secondes d'inactivité avant fermeture
+    API_MAX_BODY_BYTES = 1_000_000
+    API_MAX_HEADER_BYTES = 65536
+    API_REQUEST_TIMEOUT = 300         # Budget maximal d'une requête IA (champ "timeout" pour le réduire)
+    
+    # Recherche d'ingrédients: délai de saisie (ms) et taille du cache
+    SEARCH_DEBOUNCE_MS = 150
+    SEARCH_CACHE_SIZE = 256
     
     # Chemins des fichiers
     DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
     CALORIES_CSV = os.path.join(DATA_DIR, "calories.csv")
+    MEAL_LOG_DB = os.path.join(DATA_DIR, "meal_log.db")
+    RECIPE_LIBRARY_DB = os.path.join(DATA_DIR, "recipe_library.db")
+    INGREDIENT_LINKS_CACHE = os.path.join(DATA_DIR, "ingredient_links.json")
+    
+    # Liaison des noms d'ingrédients (score minimal entre 0 et 1)
+    LINK_MIN_SCORE = 0.6
+    # Rapprochement sémantique optionnel (embeddings Ollama + NumPy)
+    SEMANTIC_MATCHING = False
+    EMBEDDING_MODEL = "nomic-embed-text"
+    EMBEDDING_BATCH_SIZE = 64
+    SEMANTIC_MIN_SCORE = 0.75
+    SEMANTIC_RETRY_DELAY = 60
+    
+    INGREDIENT_SYNONYMS = {
+        "volaille": "poulet", "dinde": "poulet",
+        "steak": "bœuf", "veau": "bœuf",
+        "patate": "pomme de terre", "pdt": "pomme de terre", "patate douce": "pomme de terre",
+        "spaghetti": "pâtes", "penne": "pâtes", "tagliatelle": "pâtes", "macaroni": "pâtes",
+        "baguette": "pain",
+        "emmental": "fromage", "gruyère": "fromage", "parmesan": "fromage", "mozzarella": "fromage",
+        "échalote": "oignon",
+        "cèpe": "champignon", "girolle": "champignon",
+        "huile": "huile d'olive",
+        "zucchini": "courgette",
+    }
     
     # Configuration des couleurs
     COLORS = {
@@ -48,6 +191,8 @@ class Config:
         'calories_system': """Tu es un nutritionniste expert. Analyse précisément en français.
         Format: CALORIES_TOTALES, PROTEINES, GLUCIDES, LIPIDES, CONSEILS_NUTRITION.""",
         
+        'advice_system': "Tu es nutritionniste. Réponds en 1-2 phrases courtes en français.",
+        
         'recipe_prompt': """Crée une recette française avec: {ingredients}
 
 TITRE: [nom de recette créatif]
@@ -62,7 +207,7 @@ PRÉPARATION:
 
 TEMPS: [X minutes]
 DIFFICULTÉ: [Facile/Moyen/Difficile]
-CONSEILS: [astuce du chef]""",
+CONSEILS: [astuce du chef]{options}""",
         
         'nutrition_prompt': """Analyse nutritionnelle pour: {dish_name}
 Ingrédients: {ingredients}
@@ -71,9 +216,54 @@ CALORIES_TOTALES: [nombre précis] kcal
 PROTEINES: [nombre] g
 GLUCIDES: [nombre] g
 LIPIDES: [nombre] g
-CONSEILS_NUTRITION: [conseil santé français court et utile]"""
+CONSEILS_NUTRITION: [conseil santé français court et utile]""",
+        
+        'advice_prompt': "Donne des conseils santé courts pour ce plat: {dish_name} ({calories} kcal, {proteins}g protéines)",
+        
+        # Relances dans une conversation: la demande et le format sont déjà dans l'historique
+        'variant_prompt': "Propose une autre recette avec les mêmes ingrédients, différente de la précédente, au même format.",
+        
+        'advice_followup_prompt': "Donne en 1-2 phrases courtes un conseil santé pour {dish_name}."
+    }
+    
+    # Variante compacte: ingrédients listés une seule fois, format décrit une
+    # seule fois (dans le prompt, pas dans le système), mêmes en-têtes de sections
+    PROMPTS_COMPACT = {
+        'recipe_system': "Chef français. Réponds en français, uniquement au format demandé.",
+        
+        'calories_system': "Nutritionniste. Réponds en français, uniquement au format demandé.",
+        
+        'advice_system': "Nutritionniste. 1-2 phrases courtes en français.",
+        
+        'recipe_prompt': """Recette avec: {ingredients}{options}
+TITRE: nom
+INGRÉDIENTS:
+- nom: quantité unité
+PRÉPARATION:
+1. étape
+TEMPS: X minutes
+DIFFICULTÉ: Facile/Moyen/Difficile
+CONSEILS: astuce""",
+        
+        'nutrition_prompt': """Valeurs nutritionnelles de {dish_name}: {ingredients}
+CALORIES_TOTALES: X kcal
+PROTEINES: X g
+GLUCIDES: X g
+LIPIDES: X g
+CONSEILS_NUTRITION: conseil court""",
+        
+        'advice_prompt': "Conseils santé pour {dish_name} ({calories} kcal, {proteins}g protéines)",
+        
+        'variant_prompt': "Autre recette, mêmes ingrédients, même format.",
+        
+        'advice_followup_prompt': "Conseil santé court pour {dish_name}."
     }
     
+    # Variante utilisée par tâche (recipe, nutrition, advice): 'standard' (PROMPTS) ou 'compact'
+    PROMPT_VARIANTS = {'recipe': 'compact', 'nutrition': 'compact', 'advice': 'compact'}
+    # Budget estimé du prompt (système + utilisateur) en tokens, par tâche
+    PROMPT_TOKEN_BUDGETS = {'recipe': 260, 'nutrition': 220, 'advice': 80}
+    
     @classmethod
     def ensure_data_dir(cls):
         """Crée le répertoire de données s'il n'existe pas"""
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Export en flux des recettes et analyses de repas vers JSONL, JSON, CSV ou PDF
+"""
+
+import abc
+import csv
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from config import Config
+
+MACRO_LABELS = (('calories', 'Calories'), ('proteins', 'Protéines'), ('carbs', 'Glucides'),
+                ('fats', 'Lipides'), ('fiber', 'Fibres'))
+
+class ExportWriter(abc.ABC):
+    """Écrit les enregistrements un par un; rien n'est gardé en mémoire entre deux appels"""
+    
+    def __init__(self, path: str, kind: str):
+        if kind not in ('recipe', 'meal'):
+            raise ValueError(f"Type d'export inconnu: {kind}")
+        self.path = path
+        self.kind = kind
+    
+    @abc.abstractmethod
+    def write(self, record: Dict[str, Any]):
+        """Écrit un enregistrement"""
+    
+    def close(self):
+        pass
+
+class JsonlExportWriter(ExportWriter):
+    """Un objet JSON par ligne"""
+    
+    def __init__(self, path: str, kind: str):
+        super().__init__(path, kind)
+        self._file = open(path, 'w', encoding='utf-8')
+    
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    def close(self):
+        self._file.close()
+
+class JsonExportWriter(ExportWriter):
+    """Un tableau JSON valide, écrit élément par élément (crochets à l'ouverture et à la fermeture)"""
+    
+    def __init__(self, path: str, kind: str):
+        super().__init__(path, kind)
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write("[")
+        self._count = 0
+    
+    def write(self, record: Dict[str, Any]):
+        self._file.write(("," if self._count else "") + "\n" + json.dumps(record, ensure_ascii=False))
+        self._count += 1
+    
+    def close(self):
+        self._file.write("\n]\n")
+        self._file.close()
+
+class CsvExportWriter(ExportWriter):
+    """Recettes: une ligne par recette. Repas: une ligne par aliment puis une ligne TOTAL"""
+    
+    RECIPE_HEADER = ['Titre', 'Temps', 'Difficulté', 'Ingrédients', 'Étapes', 'Conseils', 'Calories']
+    MEAL_HEADER = ['Repas', 'Type', 'Aliment', 'Quantité', 'Unité'] + [label for _, label in MACRO_LABELS]
+    
+    def __init__(self, path: str, kind: str):
+        super().__init__(path, kind)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.RECIPE_HEADER if kind == 'recipe' else self.MEAL_HEADER)
+    
+    def write(self, record: Dict[str, Any]):
+        if self.kind == 'recipe':
+            self._writer.writerow([
+                record.get('title', ""),
+                record.get('prep_time', ""),
+                record.get('difficulty', ""),
+                "; ".join(format_ingredient(ing) for ing in record.get('ingredients', [])),
+                " | ".join(record.get('steps', [])),
+                record.get('tips', ""),
+                f"{record.get('total_calories', 0):.0f}"
+            ])
+            return
+        
+        title = record.get('title', "")
+        for item in record.get('items', []):
+            self._writer.writerow([title, item.get('meal', ""), item.get('food', ""),
+                                   item.get('quantity', ""), item.get('unit', "")]
+                                  + [f"{item.get(key, 0):.1f}" for key, _ in MACRO_LABELS])
+        totals = record.get('totals', {})
+        self._writer.writerow([title, 'TOTAL', "", "", ""]
+                              + [f"{totals.get(key, 0):.1f}" for key, _ in MACRO_LABELS])
+    
+    def close(self):
+        self._file.close()
+
+class PdfExportWriter(ExportWriter):
+    """PDF paginé dessiné directement sur le canvas reportlab
+    
+    Chaque page accumule ses lignes dans un seul objet texte, émis quand
+    elle est pleine (showPage) sans retour en arrière: un seul passage par
+    page. Les tableaux sont en police à chasse fixe, une ligne par aliment.
+    Le numéro de page est écrit sans total, qui exigerait un second passage.
+    """
+    
+    PAGE_MARGIN = 50
+    LINE_HEIGHT = 12
+    BODY_FONT = ('Helvetica', 9)
+    TITLE_FONT = ('Helvetica-Bold', 11)
+    TABLE_FONT = ('Courier', 8)
+    TABLE_BOLD_FONT = ('Courier-Bold', 8)
+    
+    def __init__(self, path: str, kind: str, title: str = ""):
+        super().__init__(path, kind)
+        try:
+            from reportlab.lib.pagesizes import A4
+            from reportlab.lib.utils import simpleSplit
+            from reportlab.pdfgen import canvas
+        except ImportError:
+            raise RuntimeError("❌ Export PDF indisponible. Installez: pip install reportlab")
+        
+        self._split = simpleSplit
+        self.width, self.height = A4
+        self.title = title or ("Recettes" if kind == 'recipe' else "Journal des repas")
+        self.canvas = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(self.title)
+        self.page = 0
+        self.text = None
+        self._new_page()
+    
+    def _new_page(self):
+        if self.text is not None:
+            self.canvas.drawText(self.text)
+            self.canvas.showPage()
+        self.page += 1
+        self.canvas.setFont('Helvetica', 8)
+        self.canvas.drawString(self.PAGE_MARGIN, self.height - 30, pdf_text(self.title))
+        self.canvas.drawRightString(self.width - self.PAGE_MARGIN, 30, f"Page {self.page}")
+        
+        self.y = self.height - self.PAGE_MARGIN - 10
+        self.text = self.canvas.beginText(self.PAGE_MARGIN, self.y)
+        self._font = None
+        self._indent = 0
+    
+    def _emit(self, line: str, font, indent: float = 0):
+        """Ajoute une ligne déjà découpée à l'objet texte de la page"""
+        if self.y < self.PAGE_MARGIN:
+            self._new_page()
+        if font != self._font:
+            self.text.setFont(font[0], font[1], self.LINE_HEIGHT)
+            self._font = font
+        if indent != self._indent:
+            self.text.setTextOrigin(self.PAGE_MARGIN + indent, self.y)
+            self._indent = indent
+        self.text.textLine(line)
+        self.y -= self.LINE_HEIGHT
+    
+    def _line(self, text: str, font=BODY_FONT, indent: float = 0):
+        """Paragraphe découpé à la largeur utile"""
+        width = self.width - 2 * self.PAGE_MARGIN - indent
+        for part in self._split(pdf_text(text), font[0], font[1], width) or [""]:
+            self._emit(part, font, indent)
+    
+    def _gap(self):
+        """Demi-ligne d'espace entre deux enregistrements"""
+        self.y -= self.LINE_HEIGHT / 2
+        self.text.setTextOrigin(self.PAGE_MARGIN + self._indent, self.y)
+    
+    def write(self, record: Dict[str, Any]):
+        # Garder un titre avec au moins trois lignes de contenu
+        if self.y < self.PAGE_MARGIN + 4 * self.LINE_HEIGHT:
+            self._new_page()
+        
+        if self.kind == 'recipe':
+            self._line(record.get('title', "Recette"), self.TITLE_FONT)
+            self._line(f"Temps: {record.get('prep_time', '')}   Difficulté: {record.get('difficulty', '')}")
+            for ing in record.get('ingredients', []):
+                self._line(f"- {format_ingredient(ing)}", indent=10)
+            for number, step in enumerate(record.get('steps', []), 1):
+                self._line(f"{number}. {step}", indent=10)
+            if record.get('tips'):
+                self._line(f"Conseil: {record['tips']}")
+        else:
+            self._line(record.get('title', "Repas"), self.TITLE_FONT)
+            self._emit(self._table_row('Type', 'Aliment', 'Quantité', 'kcal', 'Prot.', 'Gluc.', 'Lip.'),
+                       self.TABLE_BOLD_FONT)
+            for item in record.get('items', []):
+                self._emit(self._table_row(
+                    item.get('meal', ""), item.get('food', ""),
+                    f"{item.get('quantity', '')} {item.get('unit', '')}",
+                    f"{item.get('calories', 0):.0f}", f"{item.get('proteins', 0):.1f}",
+                    f"{item.get('carbs', 0):.1f}", f"{item.get('fats', 0):.1f}"
+                ), self.TABLE_FONT)
+            totals = record.get('totals', {})
+            self._emit(self._table_row(
+                'TOTAL', "", "", f"{totals.get('calories', 0):.0f}", f"{totals.get('proteins', 0):.1f}",
+                f"{totals.get('carbs', 0):.1f}", f"{totals.get('fats', 0):.1f}"
+            ), self.TABLE_BOLD_FONT)
+        self._gap()
+    
+    @staticmethod
+    def _table_row(meal, food, quantity, calories, proteins, carbs, fats) -> str:
+        return pdf_text(f"{meal:<16.16}{food:<30.30}{quantity:>12.12}{calories:>8}{proteins:>8}{carbs:>8}{fats:>8}")
+    
+    def close(self):
+        self.canvas.drawText(self.text)
+        self.canvas.save()
+
+WRITERS = {'.jsonl': JsonlExportWriter, '.json': JsonExportWriter, '.csv': CsvExportWriter,
+           '.pdf': PdfExportWriter}
+
+def writer_for(path: str, kind: str) -> ExportWriter:
+    """Writer choisi d'après l'extension du fichier"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Format non supporté: {extension or path} (jsonl, json, csv ou pdf)")
+    return WRITERS[extension](path, kind)
+
+def format_ingredient(ing: Dict[str, Any]) -> str:
+    return f"{ing.get('name', '')}: {ing.get('quantity', '')} {ing.get('unit', '')}".strip()
+
+def pdf_text(text: Any) -> str:
+    """Texte limité au jeu de caractères des polices PDF standard (emojis retirés)"""
+    return "".join(c for c in str(text) if ord(c) < 256 or c in "œŒ€’‘“”–—…").strip()
+
+def export_records(records: Iterable[Dict[str, Any]], writer: ExportWriter, total: Optional[int] = None,
+                   on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+                   cancel_event: Optional[threading.Event] = None) -> int:
+    """Écrit les enregistrements au fil de la lecture; retourne le nombre exporté
+    
+    on_progress(fait, total) est appelé au plus toutes les
+    Config.EXPORT_PROGRESS_INTERVAL secondes, puis à la fin.
+    """
+    count = 0
+    last_report = time.monotonic()
+    try:
+        for record in records:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            writer.write(record)
+            count += 1
+            if on_progress and time.monotonic() - last_report >= Config.EXPORT_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                on_progress(count, total)
+    finally:
+        writer.close()
+    if on_progress:
+        on_progress(count, total)
+    return count
+
+# ===== SOURCES =====
+
+def meal_log_source(meal_log, user: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Journées du journal des repas, une par enregistrement"""
+    for day in meal_log.iter_days(user):
+        title = f"{day['day']} - {day['user']}" if user is None else day['day']
+        yield {'title': title, 'user': day['user'], 'day': day['day'],
+               'items': day['entries'], 'totals': day['totals']}
+
+def library_source(library) -> Iterator[Dict[str, Any]]:
+    """Recettes de la bibliothèque (RecipeLibrary)"""
+    return library.iter_recipes()
+
+def jsonl_source(path: str, kind: str) -> Iterator[Dict[str, Any]]:
+    """Résultats d'un fichier JSONL (sortie de cli.py ou export JSONL)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if 'status' in data:
+                # Sortie de cli.py: ignorer les erreurs
+                if data.get('status') != 'ok':
+                    continue
+                result = dict(data.get('result') or {})
+                result.setdefault('title', str(data.get('id', "")))
+                data = result
+            if kind == 'meal' and 'items' in data:
+                data['items'] = [normalize_meal_item(item) for item in data['items']]
+            yield data
+
+def normalize_meal_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne d'aliment issue d'un CalorieCalculation sérialisé ou du journal"""
+    if 'ingredient_name' not in item:
+        return item
+    return {'meal': "", 'food': item['ingredient_name'], 'quantity': item.get('quantity', ""),
+            'unit': item.get('unit', ""), 'calories': item.get('total_calories', 0),
+            'proteins': item.get('proteins', 0), 'carbs': item.get('carbs', 0),
+            'fats': item.get('fats', 0), 'fiber': item.get('fiber', 0)}
+
+def count_lines(path: str) -> int:
+    """Nombre de lignes, lu par blocs (total de progression)"""
+    count = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            count += block.count(b"\n")
+    return count
+
+def default_filename(kind: str, extension: str) -> str:
+    prefix = "recettes" if kind == 'recipe' else "repas"
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
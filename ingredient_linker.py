@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Liaison des noms d'ingrédients libres vers les entrées du DataManager
+"""
+
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+from models import Ingredient, DataManager
+from metrics import metrics, observe_cache
+from semantic_index import SemanticIndexUnavailable
+from config import Config
+
+class IngredientLinker:
+    """Relie les noms produits par llama3.2:1b ("filets de poulet") aux ingrédients de la base"""
+    
+    # Mots vides et qualificatifs sans effet sur les valeurs nutritionnelles
+    STOPWORDS = {
+        'de', 'du', 'des', 'd', 'la', 'le', 'les', 'l', 'au', 'aux', 'a', 'en', 'et',
+        'un', 'une', 'avec', 'sans', 'pour',
+        'frais', 'fraiche', 'fraiches', 'bio', 'gros', 'grosse', 'petit', 'petite',
+        'entier', 'entiere', 'hache', 'hachee', 'emince', 'emincee', 'coupe', 'coupee',
+        'rape', 'rapee', 'cuit', 'cuite', 'cru', 'crue', 'surgele', 'surgelee',
+        'extra', 'vierge', 'nature', 'moyen', 'moyenne', 'environ', 'bien', 'mur', 'mure'
+    }
+    
+    # Morceaux, variétés et préparations: un mot non reconnu de cette liste
+    # pèse peu ("filets de poulet"), tout autre mot change l'aliment ("lait de coco")
+    QUALIFIERS = {
+        'filet', 'blanc', 'cuisse', 'escalope', 'aiguillette', 'pave', 'tranche', 'gousse',
+        'brin', 'feuille', 'quartier', 'rondelle',
+        'rouge', 'vert', 'verte', 'jaune', 'noir', 'cerise', 'grappe', 'basmati', 'thai', 'paris',
+        'fume', 'fumee', 'roti', 'rotie', 'grille', 'grillee', 'concasse', 'concassee',
+        'pele', 'pelee', 'demi', 'ecreme', 'ecremee'
+    }
+    QUALIFIER_WEIGHT = 0.25
+    
+    # Incrémenté quand le score change: les liens persistés sont recalculés
+    SCORING_VERSION = 2
+    
+    def __init__(self, data_manager: DataManager, config: Config, semantic_index=None):
+        self.data_manager = data_manager
+        self.config = config
+        self.semantic_index = semantic_index
+        self.cache_path = config.INGREDIENT_LINKS_CACHE
+        self.min_score = config.LINK_MIN_SCORE
+        
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Un seul écrivain du fichier temporaire
+        self._cache: Dict[str, Optional[str]] = {}
+        self._dirty = False
+        self.stats = {'hits': 0, 'misses': 0, 'resolved': 0, 'unresolved': 0, 'semantic': 0}
+        
+        self._build_index()
+        self._load_cache()
+        metrics.register_collector('ingredient_links', self._collect_metrics)
+    
+    def _build_index(self):
+        """Indexe les ingrédients de la base par forme normalisée et par mot"""
+        self._keys_by_form: Dict[str, str] = {}
+        self._tokens_by_key: Dict[str, Tuple[str, ...]] = {}
+        self._keys_by_token: Dict[str, Set[str]] = {}
+        
+        for key in self.data_manager.ingredients_db:
+            tokens = tuple(self._tokens(key))
+            form = " ".join(tokens)
+            if not form:
+                continue
+            self._keys_by_form[form] = key
+            self._tokens_by_key[key] = tokens
+            for token in tokens:
+                self._keys_by_token.setdefault(token, set()).add(key)
+        
+        # Synonymes normalisés, uniquement vers des entrées existantes
+        self._synonyms: Dict[str, str] = {}
+        for alias, target in self.config.INGREDIENT_SYNONYMS.items():
+            target_key = target.lower()
+            if target_key in self.data_manager.ingredients_db:
+                self._synonyms[" ".join(self._tokens(alias))] = target_key
+        self._qualifiers = {self.lemmatize(word) for word in self.QUALIFIERS}
+        
+        # Signature de la base pour invalider le cache si elle change
+        digest = hashlib.sha1("\n".join(sorted(self._tokens_by_key)).encode('utf-8')).hexdigest()
+        self.data_signature = f"{len(self._tokens_by_key)}:{digest[:12]}:v{self.SCORING_VERSION}"
+        if self.semantic_index is not None and self.semantic_index.enabled:
+            # Les échecs sans embeddings ne valent pas avec
+            self.data_signature += f":{self.semantic_index.model}"
+    
+    @staticmethod
+    def strip_accents(text: str) -> str:
+        """Supprime les accents et ligatures (bœuf -> boeuf)"""
+        text = text.replace('œ', 'oe').replace('æ', 'ae')
+        decomposed = unicodedata.normalize('NFKD', text)
+        return "".join(c for c in decomposed if not unicodedata.combining(c))
+    
+    @staticmethod
+    def lemmatize(token: str) -> str:
+        """Réduit un mot français à une forme singulière approximative"""
+        if len(token) <= 3:
+            return token
+        if token.endswith('eaux'):
+            return token[:-1]
+        if token.endswith('aux'):
+            return token[:-3] + 'al'
+        if token.endswith('s') or token.endswith('x'):
+            return token[:-1]
+        return token
+    
+    def _tokens(self, name: str) -> List[str]:
+        """Mots significatifs et lemmatisés d'un nom d'ingrédient"""
+        text = self.strip_accents(name.lower())
+        text = re.sub(r"[^a-z]+", " ", text)
+        return [self.lemmatize(word) for word in text.split()
+                if word not in self.STOPWORDS and len(word) > 1]
+    
+    def normalize(self, name: str) -> str:
+        """Forme canonique utilisée comme clé de cache"""
+        return " ".join(self._tokens(name))
+    
+    def link(self, name: str, blocking: bool = True) -> Optional[Ingredient]:
+        """Retourne l'ingrédient de la base correspondant à un nom libre"""
+        key = self.resolve(name, blocking)
+        return self.data_manager.ingredients_db.get(key) if key else None
+    
+    def resolve(self, name: str, blocking: bool = True) -> Optional[str]:
+        """Retourne la clé DataManager correspondant à un nom libre
+        
+        Sans blocking (thread de l'interface), le rapprochement sémantique
+        n'utilise que l'index déjà construit, sans appel à Ollama.
+        """
+        # Correspondance exacte: aucun calcul
+        exact = name.lower().strip()
+        if exact in self.data_manager.ingredients_db:
+            return exact
+        
+        form = self.normalize(name)
+        if not form:
+            return None
+        
+        with self._lock:
+            if form in self._cache:
+                self.stats['hits'] += 1
+                return self._cache[form]
+        
+        key, score = self._best_candidate(form)
+        semantic = False
+        if score < self.min_score:
+            key = None
+            # Dernier recours: similarité d'embeddings
+            if self.semantic_index is not None and self.config.SEMANTIC_MATCHING:
+                try:
+                    key = self.semantic_index.match(name, blocking)
+                except SemanticIndexUnavailable:
+                    # Échec provisoire: ni mis en cache ni persisté
+                    with self._lock:
+                        self.stats['misses'] += 1
+                        self.stats['unresolved'] += 1
+                    return None
+                semantic = key is not None
+        
+        with self._lock:
+            self.stats['misses'] += 1
+            if semantic:
+                self.stats['semantic'] += 1
+            self.stats['resolved' if key else 'unresolved'] += 1
+            self._cache[form] = key
+            self._dirty = True
+        
+        return key
+    
+    def candidates(self, name: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Candidats classés par score pour un nom libre"""
+        return self._score_candidates(self.normalize(name))[:limit]
+    
+    def _best_candidate(self, form: str) -> Tuple[Optional[str], float]:
+        """Meilleur candidat pour une forme normalisée"""
+        if form in self._keys_by_form:
+            return self._keys_by_form[form], 1.0
+        if form in self._synonyms:
+            return self._synonyms[form], 1.0
+        
+        scored = self._score_candidates(form)
+        return scored[0] if scored else (None, 0.0)
+    
+    def _score_candidates(self, form: str) -> List[Tuple[str, float]]:
+        """Note les entrées partageant des mots avec la forme normalisée"""
+        tokens = form.split()
+        if not tokens:
+            return []
+        
+        # Synonymes mot à mot ("pdt" -> "pomme de terre"); chaque mot
+        # libre reste une seule unité, même développé en plusieurs mots
+        groups = []
+        for token in tokens:
+            synonym = self._synonyms.get(token)
+            groups.append(frozenset(self._tokens_by_key[synonym] if synonym else (token,)))
+        query = set().union(*groups)
+        
+        candidate_keys: Set[str] = set()
+        for token in query:
+            candidate_keys |= self._keys_by_token.get(token, set())
+        
+        scores: Dict[str, float] = {}
+        for key in candidate_keys:
+            scores[key] = self._link_score(set(self._tokens_by_key[key]), groups)
+        
+        # Fautes de frappe: rapprochement approximatif mot à mot
+        if not scores:
+            for position, group in enumerate(groups):
+                if len(group) != 1:
+                    continue
+                token = next(iter(group))
+                for close in difflib.get_close_matches(token, self._keys_by_token.keys(), n=3, cutoff=0.8):
+                    ratio = difflib.SequenceMatcher(None, token, close).ratio()
+                    # Le mot mal orthographié compte comme reconnu
+                    corrected = groups[:position] + [frozenset((close,))] + groups[position + 1:]
+                    for key in self._keys_by_token[close]:
+                        score = ratio * self._link_score(set(self._tokens_by_key[key]), corrected)
+                        scores[key] = max(scores.get(key, 0.0), score)
+        
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    
+    def _link_score(self, key_tokens: Set[str], groups: List[frozenset]) -> float:
+        """Part du nom de la base couverte × part des mots libres reconnus
+        
+        Les mots libres non reconnus comptent entièrement, sauf les
+        qualificatifs (QUALIFIERS): "lait de coco" -> lait vaut 0.5, sous le
+        seuil, alors que "filets de poulet" -> poulet vaut 0.8.
+        """
+        covered = key_tokens & set().union(*groups)
+        if not covered:
+            return 0.0
+        matched = sum(1 for group in groups if group & key_tokens)
+        unmatched = [group for group in groups if not group & key_tokens]
+        soft = sum(1 for group in unmatched if group <= self._qualifiers)
+        query_weight = matched + len(unmatched) - soft + self.QUALIFIER_WEIGHT * soft
+        return (len(covered) / len(key_tokens)) * (matched / query_weight)
+    
+    def _load_cache(self):
+        """Charge les correspondances persistées si la base n'a pas changé"""
+        try:
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('signature') == self.data_signature:
+                    self._cache = data.get('links', {})
+        except (OSError, ValueError) as e:
+            print(f"Erreur chargement cache ingrédients: {e}")
+    
+    def save(self):
+        """Persiste les nouvelles correspondances"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {'signature': self.data_signature, 'links': dict(self._cache)}
+                self._dirty = False
+            
+            try:
+                os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                tmp_path = self.cache_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.cache_path)
+            except OSError as e:
+                print(f"Erreur sauvegarde cache ingrédients: {e}")
+    
+    def _collect_metrics(self):
+        stats = self.get_stats()
+        observe_cache('ingredient_links', stats['hits'], stats['misses'], stats['cached'])
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Statistiques du cache (taux de réussite inclus)"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cached'] = len(self._cache)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
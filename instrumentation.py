@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Mesures de latence: démarrage, callbacks de l'interface, boucle d'événements Tk
+et traces de bout en bout (spans imbriqués, propagés entre threads)
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from config import Config
+
+@dataclass(frozen=True)
+class SpanContext:
+    """Identité d'un span: sa trace (l'action d'origine) et son propre numéro"""
+    trace_id: int
+    span_id: int
+
+# Span courant du thread ou de la tâche asyncio; copié vers les threads par bind()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span_courant", default=None)
+
+def current_span() -> Optional[SpanContext]:
+    return _current_span.get()
+
+def bind(func: Callable) -> Callable:
+    """Fige le contexte courant: func s'exécutera sous le span actuel, quel que soit le thread
+    
+    Chaque appel part d'une copie, un même callable lié peut donc
+    s'exécuter plusieurs fois, y compris en parallèle.
+    """
+    context = contextvars.copy_context()
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+class Instrumentation:
+    """Enregistre des intervalles chronométrés (spans) et leurs statistiques par nom
+    
+    Un span ouvert pendant un autre en devient l'enfant (même trace). Les
+    spans sont gardés dans un tampon circulaire pour l'export de trace;
+    les statistiques agrégées couvrent toute la session.
+    """
+    
+    def __init__(self, max_spans: int = Config.TRACE_MAX_SPANS):
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._spans: deque = deque(maxlen=max_spans)
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._ids = itertools.count(1)
+        self.marks: Dict[str, float] = {}
+    
+    def set_origin(self, origin: float):
+        """Référence temporelle des traces (lancement du programme)"""
+        self.origin = origin
+    
+    def new_span(self, parent: Optional[SpanContext] = None) -> SpanContext:
+        """Identité d'un span enfant de parent, ou racine d'une nouvelle trace"""
+        span_id = next(self._ids)
+        return SpanContext(parent.trace_id if parent else span_id, span_id)
+    
+    @contextmanager
+    def span(self, name: str, category: str = "app", **args) -> Iterator[Dict[str, Any]]:
+        """Chronomètre le bloc englobé, qui devient le span courant
+        
+        Le dictionnaire retourné reçoit des attributs connus en cours de
+        route (modèle, taille de réponse...), exportés avec le span.
+        """
+        parent = _current_span.get()
+        context = self.new_span(parent)
+        token = _current_span.set(context)
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            _current_span.reset(token)
+            self.record(name, category, start, time.perf_counter() - start, context, parent, args)
+    
+    def timed(self, name: Optional[str] = None, category: str = "ui") -> Callable:
+        """Décorateur: chronomètre chaque appel de la fonction"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, category):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def record(self, name: str, category: str, start: float, duration: float,
+               context: Optional[SpanContext] = None, parent: Optional[SpanContext] = None,
+               args: Optional[Dict[str, Any]] = None):
+        """Ajoute un span mesuré par l'appelant (secondes perf_counter)
+        
+        Sans context, le span est rattaché au span courant.
+        """
+        if context is None:
+            parent = _current_span.get()
+            context = self.new_span(parent)
+        thread = threading.current_thread().name
+        with self._lock:
+            self._spans.append((name, category, start, duration, thread, context,
+                                parent.span_id if parent else None, args or None))
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['last'] = duration
+            if duration > stats['max']:
+                stats['max'] = duration
+    
+    def mark(self, name: str) -> float:
+        """Note un instant (ms depuis l'origine), ex. premier affichage"""
+        now = time.perf_counter()
+        elapsed_ms = (now - self.origin) * 1000
+        parent = _current_span.get()
+        with self._lock:
+            self.marks[name] = elapsed_ms
+            self._spans.append((name, "mark", now, 0.0, threading.current_thread().name,
+                                self.new_span(parent), parent.span_id if parent else None, None))
+        return elapsed_ms
+    
+    def summary(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Statistiques par span (ms), les plus coûteux en premier"""
+        with self._lock:
+            items = [(name, dict(stats)) for name, stats in self._stats.items()]
+        
+        rows = []
+        for name, stats in items:
+            rows.append({
+                'name': name,
+                'count': int(stats['count']),
+                'avg_ms': stats['total'] / stats['count'] * 1000,
+                'max_ms': stats['max'] * 1000,
+                'last_ms': stats['last'] * 1000,
+                'total_ms': stats['total'] * 1000
+            })
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:limit] if limit else rows
+    
+    def spans(self) -> List[Dict[str, Any]]:
+        """Spans du tampon (ms depuis l'origine), dans l'ordre de fin"""
+        with self._lock:
+            spans = list(self._spans)
+        return [{
+            'trace_id': context.trace_id,
+            'span_id': context.span_id,
+            'parent_id': parent_id,
+            'name': name,
+            'category': category,
+            'start_ms': round((start - self.origin) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+            'thread': thread,
+            'args': args or {}
+        } for name, category, start, duration, thread, context, parent_id, args in spans]
+    
+    def dump_trace(self, path: str) -> int:
+        """Écrit la trace: JSON lines (un span par ligne) si path finit par .jsonl,
+        sinon format Chrome (chrome://tracing, Perfetto)
+        
+        Retourne le nombre de spans écrits.
+        """
+        spans = self.spans()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if path.endswith('.jsonl'):
+            with open(path, 'w', encoding='utf-8') as f:
+                for span in spans:
+                    f.write(json.dumps(span, ensure_ascii=False) + "\n")
+            return len(spans)
+        
+        pid = os.getpid()
+        thread_ids: Dict[str, int] = {}
+        threads_by_span: Dict[int, int] = {}
+        events = []
+        for span in spans:
+            tid = thread_ids.setdefault(span['thread'], len(thread_ids) + 1)
+            threads_by_span[span['span_id']] = tid
+            event = {
+                'name': span['name'],
+                'cat': span['category'],
+                'ts': round(span['start_ms'] * 1000, 1),
+                'pid': pid,
+                'tid': tid,
+                'args': dict(span['args'], trace=span['trace_id'], span=span['span_id'],
+                             parent=span['parent_id'])
+            }
+            if span['category'] == "mark":
+                event.update(ph='i', s='g')
+            else:
+                event.update(ph='X', dur=round(span['duration_ms'] * 1000, 1))
+            events.append(event)
+        
+        # Flèches parent -> enfant quand l'enfant s'exécute sur un autre thread
+        # (départ dans le span parent, même s'il est terminé: callback différé)
+        spans_by_id = {span['span_id']: span for span in spans}
+        for span in spans:
+            parent = spans_by_id.get(span['parent_id'])
+            tid = threads_by_span[span['span_id']]
+            if parent is None or threads_by_span[parent['span_id']] == tid:
+                continue
+            departure = max(parent['start_ms'], min(span['start_ms'], parent['start_ms'] + parent['duration_ms']))
+            events.append({'name': 'passage', 'cat': 'flux', 'ph': 's', 'id': span['span_id'], 'pid': pid,
+                           'tid': threads_by_span[parent['span_id']], 'ts': round(departure * 1000, 1)})
+            events.append({'name': 'passage', 'cat': 'flux', 'ph': 'f', 'bp': 'e', 'id': span['span_id'],
+                           'pid': pid, 'tid': tid, 'ts': round(span['start_ms'] * 1000, 1)})
+        
+        # Noms des threads dans la vue de trace
+        for thread, tid in thread_ids.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': thread}})
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return len(spans)
+
+class EventLoopMonitor:
+    """Mesure le retard de la boucle Tk: un tick programmé toutes les interval_ms
+    
+    Tout retard au-delà de l'intervalle prévu est du temps pendant lequel un
+    callback a bloqué l'interface. Les retards au-delà de warn_ms sont
+    enregistrés comme spans "boucle.blocage".
+    """
+    
+    def __init__(self, root, recorder: Instrumentation,
+                 interval_ms: int = Config.LAG_MONITOR_INTERVAL_MS,
+                 warn_ms: int = Config.LAG_WARN_MS):
+        self.root = root
+        self.recorder = recorder
+        self.interval_ms = interval_ms
+        self.warn_ms = warn_ms
+        
+        self._samples: deque = deque(maxlen=max(1, 60000 // interval_ms))  # ~1 minute
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self._expected = time.perf_counter() + interval_ms / 1000
+        self._job = self.root.after(interval_ms, self._tick)
+    
+    def _tick(self):
+        now = time.perf_counter()
+        lag_ms = max(0.0, (now - self._expected) * 1000)
+        self._samples.append(lag_ms)
+        if lag_ms > self.max_lag_ms:
+            self.max_lag_ms = lag_ms
+        if lag_ms >= self.warn_ms:
+            self.stalls += 1
+            self.recorder.record("boucle.blocage", "lag", self._expected, lag_ms / 1000)
+        
+        self._expected = now + self.interval_ms / 1000
+        self._job = self.root.after(self.interval_ms, self._tick)
+    
+    def stats(self) -> Dict[str, float]:
+        """Retard courant, moyen, p95 et max (ms) sur la dernière minute"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {'current': 0.0, 'avg': 0.0, 'p95': 0.0, 'max': self.max_lag_ms, 'stalls': self.stalls}
+        return {
+            'current': self._samples[-1],
+            'avg': sum(samples) / len(samples),
+            'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'max': self.max_lag_ms,
+            'stalls': self.stalls
+        }
+    
+    def stop(self):
+        try:
+            self.root.after_cancel(self._job)
+        except Exception:
+            pass
+
+# Instance partagée par toute l'application
+instrumentation = Instrumentation()
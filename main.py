@@ -6,58 +6,280 @@ Application structurée avec onglets séparés et llama3.2:1b obligatoire
 Version: 3.0.0
 """
 
+import time
+STARTUP_T0 = time.perf_counter()  # Référence du temps de démarrage
+
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
-import threading
 import csv
+from dataclasses import asdict
 from datetime import datetime
 from typing import List, Dict, Any
 
-# Imports locaux
+# Imports locaux (les services, requests et pandas sont chargés à l'initialisation)
 from config import Config
-from models import DataManager, Recipe, CalorieCalculation
-from ollama_service import OllamaService
-from recipe_service import RecipeService
-from calorie_service import CalorieService
+from models import Recipe, CalorieCalculation, IngredientFilter
+from task_executor import TaskExecutor
+from text_renderer import RichText, TextRenderer
+from instrumentation import instrumentation, EventLoopMonitor
+from prompt_builder import prompt_stats
+from metrics import metrics
+from export_pipeline import (WRITERS, writer_for, export_records, jsonl_source, meal_log_source,
+                             library_source, count_lines, default_filename)
+
+instrumentation.set_origin(STARTUP_T0)
 
 class LoadingDialog:
     """Dialogue de chargement pour les opérations IA"""
-    def __init__(self, parent, message):
+    def __init__(self, parent, message, title="⏳ llama3.2:1b en action",
+                 heading="🤖 llama3.2:1b travaille..."):
+        self.on_cancel = None  # Renseigné une fois la tâche soumise
+        
         self.dialog = tk.Toplevel(parent)
-        self.dialog.title("⏳ llama3.2:1b en action")
-        self.dialog.geometry("450x150")
+        self.dialog.title(title)
+        self.dialog.geometry("450x200")
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
         
         # Centrer
         x = parent.winfo_x() + (parent.winfo_width() // 2) - 225
-        y = parent.winfo_y() + (parent.winfo_height() // 2) - 75
-        self.dialog.geometry(f"450x150+{x}+{y}")
+        y = parent.winfo_y() + (parent.winfo_height() // 2) - 100
+        self.dialog.geometry(f"450x200+{x}+{y}")
         
         # Interface
-        tk.Label(self.dialog, text="🤖 llama3.2:1b travaille...", 
+        tk.Label(self.dialog, text=heading, 
                 font=('Segoe UI', 14, 'bold')).pack(pady=15)
-        tk.Label(self.dialog, text=message, 
+        self.message_var = tk.StringVar(value=message)
+        tk.Label(self.dialog, textvariable=self.message_var, 
                 font=('Segoe UI', 11)).pack(pady=5)
         
         self.progress = ttk.Progressbar(self.dialog, mode='indeterminate')
         self.progress.pack(pady=15, padx=30, fill='x')
         self.progress.start()
+        
+        self.cancel_btn = tk.Button(self.dialog, text="⏹️ Annuler", command=self.cancel,
+                                    bg='#6c757d', fg='white')
+        self.cancel_btn.pack(pady=5)
+    
+    def show_suggestions(self, suggestions, on_pick):
+        """Recettes déjà enregistrées proposées pendant la génération
+        
+        on_pick(id) est appelé avec l'id de la recette choisie.
+        """
+        if not self.dialog.winfo_exists() or not suggestions:
+            return
+        self.dialog.geometry("450x360")
+        frame = tk.LabelFrame(self.dialog, text="📚 Déjà dans la bibliothèque")
+        frame.pack(fill='both', expand=True, padx=15, pady=5)
+        listbox = tk.Listbox(frame, height=5)
+        listbox.pack(fill='both', expand=True, padx=5, pady=5)
+        for item in suggestions:
+            listbox.insert('end', f"{item['title']} ({item['coverage']:.0%} des ingrédients)")
+        
+        def pick(event=None):
+            selection = listbox.curselection()
+            if selection:
+                on_pick(suggestions[selection[0]]['id'])
+        
+        listbox.bind('<Double-Button-1>', pick)
+        tk.Button(frame, text="📖 Utiliser cette recette", command=pick).pack(pady=5)
+    
+    def set_progress(self, fraction, message=""):
+        """Passe en progression déterminée (0 à 1)"""
+        if not self.dialog.winfo_exists():
+            return
+        if str(self.progress['mode']) != 'determinate':
+            self.progress.stop()
+            self.progress.config(mode='determinate', maximum=100)
+        self.progress['value'] = fraction * 100
+        if message:
+            self.message_var.set(message)
+    
+    def cancel(self):
+        """Interrompt la génération en cours et ferme le dialogue"""
+        self.cancel_btn.config(state='disabled', text="⏹️ Annulation...")
+        if self.on_cancel:
+            self.on_cancel()
+        else:
+            self.destroy()
     
     def destroy(self):
+        if not self.dialog.winfo_exists():
+            return
         self.progress.stop()
         self.dialog.destroy()
 
+def start_export(parent, executor, filename, kind, records, count=None):
+    """Export groupé en arrière-plan avec progression et annulation
+    
+    records() et count() sont appelés dans le thread de travail: la source
+    est lue au fil de l'écriture, sans être chargée en mémoire.
+    """
+    loading = LoadingDialog(parent, os.path.basename(filename), title="📤 Export",
+                            heading="📤 Export en cours...")
+    
+    def export_task(handle):
+        total = count() if count else None
+        
+        def on_progress(done, total):
+            fraction = done / total if total else 0.0
+            handle.report_progress(fraction, f"{done} / {total}" if total else f"{done} exporté(s)")
+        
+        exported = export_records(records(), writer_for(filename, kind), total,
+                                  on_progress, handle.cancel_event)
+        if handle.cancelled and os.path.exists(filename):
+            os.remove(filename)  # Pas de fichier partiel
+        return exported
+    
+    def on_success(exported):
+        loading.destroy()
+        messagebox.showinfo("Export", f"✅ {exported} enregistrement(s) exporté(s) vers {filename}")
+    
+    def on_error(error):
+        loading.destroy()
+        messagebox.showerror("Erreur", f"❌ Erreur d'export: {error}")
+    
+    handle = executor.submit(
+        export_task,
+        name="Export groupé",
+        key=f"export-{filename}",
+        on_success=on_success,
+        on_error=on_error,
+        on_progress=lambda h: loading.set_progress(h.progress, h.message),
+        on_cancel=loading.destroy
+    )
+    loading.on_cancel = handle.cancel
+    return handle
+
+EXPORT_FILETYPES = [("JSON Lines", "*.jsonl"), ("JSON", "*.json"), ("Fichiers CSV", "*.csv"), ("PDF", "*.pdf")]
+
+class VirtualIngredientGrid:
+    """Grille d'ingrédients virtualisée: seuls les boutons visibles existent et sont recyclés"""
+    
+    CATEGORY_EMOJIS = {
+        "Légume": "🥬", "Viande": "🥩", "Poisson": "🐟",
+        "Produit laitier": "🥛", "Fruit": "🍎", "Céréale": "🌾",
+        "Matière grasse": "🧈", "Aromate": "🌿"
+    }
+    ROW_HEIGHT = 46
+    COLUMNS = 2
+    
+    def __init__(self, parent, on_toggle, is_selected):
+        self.on_toggle = on_toggle
+        self.is_selected = is_selected
+        
+        self.items = []
+        self.pool = []          # (bouton, id de fenêtre canvas)
+        self.slot_state = []    # (nom, sélectionné) affiché par chaque bouton
+        
+        self.canvas = tk.Canvas(parent, highlightthickness=0, yscrollincrement=self.ROW_HEIGHT)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
+        
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._bind_wheel(self.canvas)
+    
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_wheel)
+        widget.bind("<Button-4>", self._on_wheel)
+        widget.bind("<Button-5>", self._on_wheel)
+    
+    def _on_wheel(self, event):
+        if getattr(event, 'num', None) == 4:
+            step = -1
+        elif getattr(event, 'num', None) == 5:
+            step = 1
+        else:
+            step = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(step, "units")
+    
+    def _on_configure(self, event=None):
+        self._update_scrollregion()
+        self.render()
+    
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.render()
+    
+    def _update_scrollregion(self):
+        rows = -(-len(self.items) // self.COLUMNS)
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), rows * self.ROW_HEIGHT))
+    
+    def set_items(self, items):
+        """Remplace la liste affichée (déjà triée) et revient en haut"""
+        self.items = items
+        self._update_scrollregion()
+        self.canvas.yview_moveto(0)
+        self.render()
+    
+    def refresh(self):
+        """Réapplique l'état de sélection aux boutons visibles"""
+        self.render()
+    
+    def render(self):
+        """Positionne les boutons du pool sur les lignes visibles"""
+        width = max(self.canvas.winfo_width(), self.COLUMNS)
+        height = max(self.canvas.winfo_height(), self.ROW_HEIGHT)
+        col_width = width // self.COLUMNS
+        
+        first_row = max(int(self.canvas.canvasy(0) // self.ROW_HEIGHT), 0)
+        needed = (height // self.ROW_HEIGHT + 2) * self.COLUMNS
+        
+        while len(self.pool) < needed:
+            btn = tk.Button(self.canvas, height=2, bg='lightgray', relief='raised', bd=2)
+            self._bind_wheel(btn)
+            window = self.canvas.create_window(0, 0, window=btn, anchor="nw", state='hidden')
+            self.pool.append((btn, window))
+            self.slot_state.append(None)
+        
+        for slot, (btn, window) in enumerate(self.pool):
+            index = first_row * self.COLUMNS + slot
+            if slot >= needed or index >= len(self.items):
+                self.canvas.itemconfigure(window, state='hidden')
+                continue
+            
+            row, col = divmod(index, self.COLUMNS)
+            self.canvas.coords(window, col * col_width + 2, row * self.ROW_HEIGHT + 2)
+            self.canvas.itemconfigure(window, width=col_width - 4, height=self.ROW_HEIGHT - 4, state='normal')
+            
+            ingredient = self.items[index]
+            state = (ingredient.name, self.is_selected(ingredient.name))
+            if self.slot_state[slot] == state:
+                continue
+            
+            emoji = self.CATEGORY_EMOJIS.get(ingredient.category, "🍽️")
+            btn.config(text=f"{emoji} {ingredient.name.title()}",
+                       command=lambda ing=ingredient.name: self.on_toggle(ing),
+                       bg='lightgreen' if state[1] else 'lightgray',
+                       relief='sunken' if state[1] else 'raised')
+            self.slot_state[slot] = state
+
 class RecipeTab:
     """Onglet Générateur de Recettes"""
     
-    def __init__(self, parent, config, recipe_service, data_manager):
+    POLICY_LABELS = {
+        'library': "Réutiliser si déjà générée",
+        'variants': f"Varier ({Config.RECIPE_LIBRARY_VARIANTS} variantes)",
+        'regenerate': "Toujours régénérer"
+    }
+    
+    def __init__(self, parent, config, recipe_service, data_manager, executor, recipe_index=None):
         self.parent = parent
         self.config = config
         self.recipe_service = recipe_service
         self.data_manager = data_manager
+        self.executor = executor
+        self.recipe_index = recipe_index
         
         self.selected_ingredients = []
+        self.all_ingredients = []
+        self.ingredient_filter = None
+        self._filter_job = None
         self.current_recipe = None
         
         self.create_interface()
@@ -109,23 +331,12 @@ class RecipeTab:
         ingredients_container = tk.Frame(parent)
         ingredients_container.pack(fill='both', expand=True, padx=10, pady=10)
         
-        canvas = tk.Canvas(ingredients_container)
-        scrollbar = ttk.Scrollbar(ingredients_container, orient="vertical", command=canvas.yview)
-        self.ingredients_scroll_frame = tk.Frame(canvas)
-        
-        self.ingredients_scroll_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
+        self.ingredient_grid = VirtualIngredientGrid(
+            ingredients_container,
+            on_toggle=self.toggle_ingredient,
+            is_selected=lambda name: name in self.selected_ingredients
         )
         
-        canvas.create_window((0, 0), window=self.ingredients_scroll_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        self.ingredient_buttons = {}
-        
         # Ingrédients sélectionnés
         selected_frame = tk.LabelFrame(parent, text="✅ Sélectionnés")
         selected_frame.pack(fill='x', padx=10, pady=10)
@@ -166,6 +377,12 @@ class RecipeTab:
                                 values=["", "⚡ 15 min", "🕐 30 min", "🕑 1 heure"])
         time_combo.grid(row=2, column=1, sticky='ew', padx=5, pady=2)
         
+        tk.Label(options_frame, text="📚 Bibliothèque:").grid(row=3, column=0, sticky='w', padx=5, pady=2)
+        self.policy_var = tk.StringVar(value=self.POLICY_LABELS[self.config.RECIPE_LIBRARY_POLICY])
+        policy_combo = ttk.Combobox(options_frame, textvariable=self.policy_var, state='readonly',
+                                  values=list(self.POLICY_LABELS.values()))
+        policy_combo.grid(row=3, column=1, sticky='ew', padx=5, pady=2)
+        
         options_frame.grid_columnconfigure(1, weight=1)
         
         # Bouton de génération
@@ -174,7 +391,7 @@ class RecipeTab:
                                     bg='#FF6B35', fg='white', 
                                     font=('Segoe UI', 12, 'bold'),
                                     height=2, cursor='hand2')
-        self.generate_btn.grid(row=3, column=0, columnspan=2, pady=15, sticky='ew')
+        self.generate_btn.grid(row=4, column=0, columnspan=2, pady=15, sticky='ew')
         
         # Zone d'affichage de la recette
         self.recipe_text = scrolledtext.ScrolledText(parent, wrap=tk.WORD, height=25)
@@ -183,6 +400,8 @@ class RecipeTab:
         # Tags pour le formatage
         self.recipe_text.tag_configure('title', font=('Segoe UI', 16, 'bold'), foreground='#FF6B35')
         self.recipe_text.tag_configure('heading', font=('Segoe UI', 12, 'bold'), foreground='#004E98')
+        self.recipe_text.tag_configure('stream', foreground='#6c757d')
+        self.recipe_renderer = TextRenderer(self.recipe_text)
         
         # Boutons d'action
         action_frame = tk.Frame(parent)
@@ -190,6 +409,8 @@ class RecipeTab:
         
         tk.Button(action_frame, text="📄 Exporter", command=self.export_recipe,
                  bg='#004E98', fg='white').pack(side='left', padx=5)
+        tk.Button(action_frame, text="📤 Export groupé", command=self.export_batch,
+                 bg='#004E98', fg='white').pack(side='left', padx=5)
         
         tk.Button(action_frame, text="🔄 Nouveau", command=self.clear_all,
                  bg='#6c757d', fg='white').pack(side='right', padx=5)
@@ -202,93 +423,50 @@ class RecipeTab:
         if not self.data_manager:
             return
         
-        ingredients = self.data_manager.get_all_ingredients()
+        # Tri unique: les filtres conservent l'ordre
+        self.all_ingredients = sorted(self.data_manager.get_all_ingredients(), key=lambda x: x.name)
+        self.ingredient_filter = IngredientFilter(self.all_ingredients, self.config.SEARCH_CACHE_SIZE)
         
         # Catégories
-        categories = sorted(set(ing.category for ing in ingredients))
+        categories = sorted(set(ing.category for ing in self.all_ingredients))
         self.category_combo['values'] = ["Toutes"] + categories
         
         # Afficher les ingrédients
-        self.display_ingredients(ingredients)
+        self.display_ingredients(self.all_ingredients)
     
     def display_ingredients(self, ingredients):
-        """Affiche les ingrédients comme boutons"""
-        # Vider le frame
-        for widget in self.ingredients_scroll_frame.winfo_children():
-            widget.destroy()
-        
-        self.ingredient_buttons.clear()
-        
-        # Créer les boutons
-        row, col = 0, 0
-        for ingredient in sorted(ingredients, key=lambda x: x.name):
-            # Emoji selon catégorie
-            emoji_map = {
-                "Légume": "🥬", "Viande": "🥩", "Poisson": "🐟",
-                "Produit laitier": "🥛", "Fruit": "🍎", "Céréale": "🌾",
-                "Matière grasse": "🧈", "Aromate": "🌿"
-            }
-            emoji = emoji_map.get(ingredient.category, "🍽️")
-            
-            btn_text = f"{emoji} {ingredient.name.title()}"
-            
-            btn = tk.Button(self.ingredients_scroll_frame, text=btn_text,
-                          command=lambda ing=ingredient.name: self.toggle_ingredient(ing),
-                          width=18, height=2, bg='lightgray', relief='raised', bd=2)
-            btn.grid(row=row, column=col, padx=2, pady=2, sticky='ew')
-            
-            self.ingredient_buttons[ingredient.name] = btn
-            
-            col += 1
-            if col >= 2:
-                col = 0
-                row += 1
-        
-        # Configurer les colonnes
-        self.ingredients_scroll_frame.grid_columnconfigure(0, weight=1)
-        self.ingredients_scroll_frame.grid_columnconfigure(1, weight=1)
+        """Affiche les ingrédients (triés) dans la grille virtualisée"""
+        self.ingredient_grid.set_items(ingredients)
     
     def on_search_changed(self, *args):
-        """Filtrage par recherche"""
-        self.filter_ingredients()
+        """Filtrage par recherche, différé pendant la saisie"""
+        if self._filter_job:
+            self.parent.after_cancel(self._filter_job)
+        self._filter_job = self.parent.after(self.config.SEARCH_DEBOUNCE_MS, self.filter_ingredients)
     
     def on_category_changed(self, event=None):
         """Filtrage par catégorie"""
         self.filter_ingredients()
     
+    @instrumentation.timed()
     def filter_ingredients(self):
         """Applique les filtres"""
-        if not self.data_manager:
+        self._filter_job = None
+        if not self.ingredient_filter:
             return
         
-        search_term = self.search_var.get().lower()
-        selected_category = self.category_var.get()
-        
-        all_ingredients = self.data_manager.get_all_ingredients()
-        filtered = []
-        
-        for ingredient in all_ingredients:
-            if search_term and search_term not in ingredient.name.lower():
-                continue
-            if selected_category != "Toutes" and ingredient.category != selected_category:
-                continue
-            filtered.append(ingredient)
-        
+        filtered = self.ingredient_filter.filter(self.search_var.get(), self.category_var.get())
         self.display_ingredients(filtered)
     
+    @instrumentation.timed()
     def toggle_ingredient(self, ingredient_name):
         """Ajoute/retire un ingrédient"""
-        btn = self.ingredient_buttons.get(ingredient_name)
-        if not btn:
-            return
-        
         if ingredient_name in self.selected_ingredients:
             self.selected_ingredients.remove(ingredient_name)
-            btn.config(bg='lightgray', relief='raised')
         else:
             self.selected_ingredients.append(ingredient_name)
-            btn.config(bg='lightgreen', relief='sunken')
         
+        self.ingredient_grid.refresh()
         self.update_selected_display()
     
     def update_selected_display(self):
@@ -304,16 +482,14 @@ class RecipeTab:
         else:
             self.generate_btn.config(state='disabled', bg='gray')
     
+    @instrumentation.timed()
     def clear_selection(self):
         """Vide la sélection"""
-        for ingredient_name in self.selected_ingredients.copy():
-            btn = self.ingredient_buttons.get(ingredient_name)
-            if btn:
-                btn.config(bg='lightgray', relief='raised')
-        
         self.selected_ingredients.clear()
+        self.ingredient_grid.refresh()
         self.update_selected_display()
     
+    @instrumentation.timed()
     def generate_recipe(self):
         """Génère une recette avec llama3.2:1b"""
         if not self.selected_ingredients:
@@ -322,63 +498,129 @@ class RecipeTab:
         
         loading = LoadingDialog(self.parent, "Génération de la recette française...")
         
-        def generate_thread():
-            try:
-                recipe = self.recipe_service.generate_recipe(
-                    self.selected_ingredients,
-                    self.cuisine_var.get(),
-                    self.difficulty_var.get(),
-                    self.time_var.get()
-                )
-                
-                self.parent.after(0, lambda: self.on_recipe_generated(recipe, loading))
-                
-            except Exception as e:
-                error_msg = str(e)
-                self.parent.after(0,lambda msg=error_msg , l=loading :self.on_generation_error(msg,l))
+        # Lire les options sur le thread Tk
+        ingredients = list(self.selected_ingredients)
+        options = (self.cuisine_var.get(), self.difficulty_var.get(), self.time_var.get())
+        policy = next((key for key, label in self.POLICY_LABELS.items()
+                       if label == self.policy_var.get()), None)
+        
+        # Aperçu en flux: une seule mise à jour en attente à la fois
+        preview = {'parts': [], 'pending': False}
         
-        thread = threading.Thread(target=generate_thread, daemon=True)
-        thread.start()
+        def on_chunk(chunk):
+            preview['parts'].append(chunk)
+            if not preview['pending']:
+                preview['pending'] = True
+                self.executor.post(show_preview)
+        
+        def show_preview():
+            preview['pending'] = False
+            if not handle.cancelled and handle.status == 'running':
+                self.show_generation_preview("".join(preview['parts']))
+        
+        def generate_task(handle):
+            from resilience import Deadline  # requests: chargé avec les services, pas au démarrage
+            
+            # Un seul budget pour l'action, réessais compris
+            return self.recipe_service.get_recipe(ingredients, *options, policy=policy,
+                                                  cancel_event=handle.cancel_event,
+                                                  on_chunk=on_chunk,
+                                                  deadline=Deadline(self.config.RECIPE_TIME_BUDGET))
+        
+        handle = self.executor.submit(
+            generate_task,
+            name="Génération de recette",
+            key="recipe",
+            on_success=lambda result: self.on_recipe_generated(*result, loading),
+            on_error=lambda e: self.on_generation_error(str(e), loading),
+            on_cancel=loading.destroy
+        )
+        loading.on_cancel = handle.cancel
+        
+        # Recettes proches déjà enregistrées, proposées pendant la génération
+        if self.recipe_index is not None and self.recipe_index.ready:
+            self.executor.submit(
+                lambda h: self.recipe_index.rank(ingredients, limit=self.config.RECIPE_SUGGESTIONS),
+                name="Suggestions de recettes",
+                key="recipe-suggestions",
+                on_success=lambda suggestions: loading.show_suggestions(
+                    suggestions, lambda recipe_id: self.use_stored_recipe(recipe_id, handle))
+            )
+    
+    def use_stored_recipe(self, recipe_id, generation):
+        """Interrompt la génération et affiche une recette de la bibliothèque"""
+        generation.cancel()
+        self.executor.submit(
+            lambda h: self.recipe_service.library.get(recipe_id),
+            name="Recette de la bibliothèque",
+            key="recipe",
+            on_success=self._show_stored_recipe,
+            on_error=lambda e: messagebox.showerror("Erreur", f"❌ {e}")
+        )
     
-    def on_recipe_generated(self, recipe, loading_dialog):
-        """Affiche la recette générée"""
+    def _show_stored_recipe(self, recipe):
+        if recipe is None:
+            messagebox.showwarning("Bibliothèque", "Cette recette n'est plus dans la bibliothèque")
+            return
+        self.current_recipe = recipe
+        self.display_recipe(recipe)
+    
+    @instrumentation.timed()
+    def on_recipe_generated(self, recipe, from_library, loading_dialog):
+        """Affiche la recette générée ou servie depuis la bibliothèque"""
         loading_dialog.destroy()
         
         self.current_recipe = recipe
         self.display_recipe(recipe)
-        messagebox.showinfo("Succès", "🎉 Recette générée avec succès par llama3.2:1b !")
+        if from_library:
+            messagebox.showinfo("Bibliothèque", "📚 Recette déjà générée pour ces ingrédients et options "
+                                "(choisissez « Toujours régénérer » pour une nouvelle version)")
+        else:
+            messagebox.showinfo("Succès", "🎉 Recette générée avec succès par llama3.2:1b !")
     
     def on_generation_error(self, error, loading_dialog):
         """Gestion des erreurs"""
         loading_dialog.destroy()
         messagebox.showerror("Erreur", error)
     
+    @instrumentation.timed()
     def display_recipe(self, recipe):
         """Affiche une recette"""
-        self.recipe_text.delete(1.0, tk.END)
+        doc = RichText()
         
         # Titre
-        self.recipe_text.insert(tk.END, f"🍽️ {recipe.title}\n", 'title')
-        self.recipe_text.insert(tk.END, "=" * 60 + "\n\n")
+        doc.add(f"🍽️ {recipe.title}\n", 'title')
+        doc.add("=" * 60 + "\n\n")
         
         # Informations
-        self.recipe_text.insert(tk.END, "📋 INFORMATIONS\n", 'heading')
-        self.recipe_text.insert(tk.END, f"⏰ Temps: {recipe.prep_time}\n")
-        self.recipe_text.insert(tk.END, f"⭐ Difficulté: {recipe.difficulty}\n")
+        doc.add("📋 INFORMATIONS\n", 'heading')
+        doc.add(f"⏰ Temps: {recipe.prep_time}\n")
+        doc.add(f"⭐ Difficulté: {recipe.difficulty}\n")
         if recipe.tips:
-            self.recipe_text.insert(tk.END, f"💡 Conseil: {recipe.tips}\n")
-        self.recipe_text.insert(tk.END, "\n")
+            doc.add(f"💡 Conseil: {recipe.tips}\n")
+        doc.add("\n")
         
         # Ingrédients
-        self.recipe_text.insert(tk.END, "🛒 INGRÉDIENTS\n", 'heading')
+        doc.add("🛒 INGRÉDIENTS\n", 'heading')
         for ingredient in recipe.ingredients:
-            self.recipe_text.insert(tk.END, f"• {ingredient['name']}: {ingredient['quantity']} {ingredient['unit']}\n")
-        self.recipe_text.insert(tk.END, "\n")
+            doc.add(f"• {ingredient['name']}: {ingredient['quantity']} {ingredient['unit']}\n")
+        doc.add("\n")
         
         # Préparation
-        self.recipe_text.insert(tk.END, "👨‍🍳 PRÉPARATION\n", 'heading')
+        doc.add("👨‍🍳 PRÉPARATION\n", 'heading')
         for i, step in enumerate(recipe.steps, 1):
-            self.recipe_text.insert(tk.END, f"{i}. {step}\n")
+            doc.add(f"{i}. {step}\n")
+        
+        self.recipe_renderer.render(doc)
+    
+    @instrumentation.timed()
+    def show_generation_preview(self, raw_text):
+        """Affiche le texte brut en cours de génération (ajout incrémental)"""
+        doc = RichText()
+        doc.line("🤖 llama3.2:1b écrit votre recette...", 'heading')
+        doc.line()
+        doc.add(raw_text, 'stream')
+        self.recipe_renderer.render(doc)
     
     def show_welcome_message(self):
         """Message de bienvenue"""
@@ -396,9 +638,9 @@ class RecipeTab:
 
 💡 ASTUCE: Plus d'ingrédients = recette plus créative !"""
 
-        self.recipe_text.delete(1.0, tk.END)
-        self.recipe_text.insert(tk.END, welcome)
+        self.recipe_renderer.render_text(welcome)
     
+    @instrumentation.timed()
     def export_recipe(self):
         """Exporte la recette"""
         if not self.current_recipe:
@@ -407,17 +649,48 @@ class RecipeTab:
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Fichiers texte", "*.txt"), ("Tous les fichiers", "*.*")]
+            filetypes=[("Fichiers texte", "*.txt")] + EXPORT_FILETYPES + [("Tous les fichiers", "*.*")]
         )
         
         if filename:
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(self._format_recipe_for_export())
+                if os.path.splitext(filename)[1].lower() in WRITERS:
+                    export_records([asdict(self.current_recipe)], writer_for(filename, 'recipe'))
+                else:
+                    with open(filename, 'w', encoding='utf-8') as f:
+                        f.write(self._format_recipe_for_export())
                 messagebox.showinfo("Export", f"✅ Recette exportée vers {filename}")
             except Exception as e:
                 messagebox.showerror("Erreur", f"❌ Erreur d'export: {e}")
     
+    def export_batch(self):
+        """Exporte la bibliothèque de recettes ou un fichier de résultats batch (JSONL)"""
+        library = self.recipe_service.library
+        source = None
+        if library is None or not messagebox.askyesno(
+                "Export groupé", "Exporter toute la bibliothèque de recettes ?\n\n"
+                "Non: choisir un fichier de résultats batch (cli.py recipes)"):
+            source = filedialog.askopenfilename(
+                title="Résultats batch (cli.py recipes)",
+                filetypes=[("JSON Lines", "*.jsonl"), ("Tous les fichiers", "*.*")]
+            )
+            if not source:
+                return
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            initialfile=default_filename('recipe', ".pdf"),
+            filetypes=EXPORT_FILETYPES
+        )
+        if not filename:
+            return
+        if source:
+            start_export(self.parent, self.executor, filename, 'recipe',
+                         lambda: jsonl_source(source, 'recipe'), lambda: count_lines(source))
+        else:
+            start_export(self.parent, self.executor, filename, 'recipe',
+                         lambda: library_source(library), lambda: library.stats()['recipes'])
+    
     def _format_recipe_for_export(self):
         """Formate la recette pour l'export"""
         recipe = self.current_recipe
@@ -448,6 +721,7 @@ class RecipeTab:
         
         return "\n".join(lines)
     
+    @instrumentation.timed()
     def clear_all(self):
         """Remet à zéro"""
         self.clear_selection()
@@ -460,11 +734,15 @@ class RecipeTab:
 class CalorieTab:
     """Onglet Calculateur de Calories"""
     
-    def __init__(self, parent, config, calorie_service, data_manager):
+    MEAL_TYPES = ["Petit-déjeuner", "Déjeuner", "Dîner", "Collation"]
+    
+    def __init__(self, parent, config, calorie_service, data_manager, executor, meal_log=None):
         self.parent = parent
         self.config = config
         self.calorie_service = calorie_service
         self.data_manager = data_manager
+        self.executor = executor
+        self.meal_log = meal_log
         
         self.foods_data = []
         self.current_calculations = []
@@ -598,6 +876,7 @@ class CalorieTab:
         # Tags pour formatage
         self.analysis_text.tag_configure('title', font=('Segoe UI', 12, 'bold'), foreground='#FF6B35')
         self.analysis_text.tag_configure('heading', font=('Segoe UI', 10, 'bold'), foreground='#004E98')
+        self.analysis_renderer = TextRenderer(self.analysis_text)
         
         # Boutons d'export
         export_frame = tk.Frame(details_frame)
@@ -608,6 +887,23 @@ class CalorieTab:
         tk.Button(export_frame, text="🔄 Nouvelle analyse", command=self.clear_analysis,
                  bg='#6c757d', fg='white').pack(side='right', padx=5)
         
+        # Journal des repas
+        log_frame = tk.Frame(details_frame)
+        log_frame.pack(fill='x', padx=5, pady=(0, 5))
+        
+        tk.Label(log_frame, text="👤", font=('Segoe UI', 10)).pack(side='left')
+        self.user_var = tk.StringVar(value=self.config.MEAL_LOG_USER)
+        tk.Entry(log_frame, textvariable=self.user_var, width=12).pack(side='left', padx=(0, 5))
+        
+        self.meal_type_var = tk.StringVar(value=self.MEAL_TYPES[1])
+        ttk.Combobox(log_frame, textvariable=self.meal_type_var, values=self.MEAL_TYPES,
+                    width=13, state='readonly').pack(side='left', padx=5)
+        
+        tk.Button(log_frame, text="💾 Enregistrer le repas", command=self.save_meal,
+                 bg='#2ECC71', fg='white').pack(side='left', padx=5)
+        tk.Button(log_frame, text="📅 Historique", command=self.show_history,
+                 bg='#004E98', fg='white').pack(side='left', padx=5)
+        
         # Message initial
         self.show_welcome_analysis()
     
@@ -618,6 +914,7 @@ class CalorieTab:
             food_names = sorted([ing.name for ing in ingredients])
             self.food_combo['values'] = food_names
     
+    @instrumentation.timed()
     def add_food(self):
         """Ajoute un aliment à la liste"""
         food_name = self.food_var.get().strip()
@@ -654,6 +951,7 @@ class CalorieTab:
         # Calculer les totaux de base
         self.calculate_basic_totals()
     
+    @instrumentation.timed()
     def remove_food(self):
         """Supprime l'aliment sélectionné"""
         selected = self.foods_tree.selection()
@@ -669,6 +967,7 @@ class CalorieTab:
             
             self.calculate_basic_totals()
     
+    @instrumentation.timed()
     def clear_foods(self):
         """Vide la liste des aliments"""
         self.foods_data.clear()
@@ -676,6 +975,7 @@ class CalorieTab:
             self.foods_tree.delete(item)
         self.clear_analysis()
     
+    @instrumentation.timed()
     def calculate_basic_totals(self):
         """Calcule les totaux de base"""
         if not self.foods_data:
@@ -686,7 +986,7 @@ class CalorieTab:
             return
         
         try:
-            calculations = self.calorie_service.calculate_meal_calories(self.foods_data)
+            calculations = self.calorie_service.calculate_meal_calories(self.foods_data, blocking=False)
             self.current_calculations = calculations
             
             # Calculer les totaux
@@ -712,6 +1012,7 @@ class CalorieTab:
         except Exception as e:
             print(f"Erreur calcul: {e}")
     
+    @instrumentation.timed()
     def analyze_with_ai(self):
         """Lance l'analyse complète avec llama3.2:1b"""
         if not self.foods_data:
@@ -720,31 +1021,40 @@ class CalorieTab:
         
         loading = LoadingDialog(self.parent, "Analyse nutritionnelle approfondie en cours...")
         
-        def analyze_thread():
-            try:
-                # Créer une recette temporaire pour l'analyse IA
-                from models import Recipe
-                
-                temp_recipe = Recipe(
-                    title="Analyse nutritionnelle",
-                    ingredients=[{"name": food["name"], "quantity": food["quantity"], "unit": food["unit"]} 
-                               for food in self.foods_data],
-                    steps=["Analyse des aliments"],
-                    prep_time="",
-                    difficulty=""
-                )
-                
-                # Analyser avec IA
-                analysis = self.calorie_service.analyze_nutrition_with_ai(temp_recipe)
-                
-                self.parent.after(0, lambda: self.on_analysis_completed(analysis, loading))
-                
-            except Exception as e:
-                self.parent.after(0, lambda: self.on_analysis_error(str(e), loading))
+        # Créer une recette temporaire pour l'analyse IA
+        temp_recipe = Recipe(
+            title="Analyse nutritionnelle",
+            ingredients=[{"name": food["name"], "quantity": food["quantity"], "unit": food["unit"]} 
+                       for food in self.foods_data],
+            steps=["Analyse des aliments"],
+            prep_time="",
+            difficulty=""
+        )
         
-        thread = threading.Thread(target=analyze_thread, daemon=True)
-        thread.start()
+        def analyze_task(handle):
+            def show_provisional(analysis):
+                # Annulée entre-temps: rien à peindre dans l'onglet
+                if not handle.cancel_event.is_set():
+                    self.executor.post(lambda: handle.cancelled or self.display_ai_analysis(analysis))
+            
+            # Analyser avec IA (totaux de la base affichés immédiatement)
+            return self.calorie_service.analyze_nutrition(
+                temp_recipe,
+                on_provisional=show_provisional,
+                cancel_event=handle.cancel_event
+            )
+        
+        handle = self.executor.submit(
+            analyze_task,
+            name="Analyse nutritionnelle",
+            key="analysis",
+            on_success=lambda analysis: self.on_analysis_completed(analysis, loading),
+            on_error=lambda e: self.on_analysis_error(str(e), loading),
+            on_cancel=loading.destroy
+        )
+        loading.on_cancel = handle.cancel
     
+    @instrumentation.timed()
     def on_analysis_completed(self, analysis, loading_dialog):
         """Affiche l'analyse terminée"""
         loading_dialog.destroy()
@@ -760,52 +1070,68 @@ class CalorieTab:
         loading_dialog.destroy()
         messagebox.showerror("Erreur", error)
     
+    @instrumentation.timed()
     def display_ai_analysis(self, analysis):
         """Affiche l'analyse IA complète"""
-        self.analysis_text.delete(1.0, tk.END)
+        doc = RichText()
         
         # Titre
-        self.analysis_text.insert(tk.END, "🤖 ANALYSE NUTRITIONNELLE IA\n", 'title')
-        self.analysis_text.insert(tk.END, "=" * 50 + "\n\n")
+        doc.add("🤖 ANALYSE NUTRITIONNELLE IA\n", 'title')
+        doc.add("=" * 50 + "\n\n")
+        
+        if analysis.is_provisional:
+            doc.add("⏳ Résultat provisoire (base de données) - affinage IA en cours...\n\n")
         
         # Résumé global
-        self.analysis_text.insert(tk.END, "📊 RÉSUMÉ NUTRITIONNEL\n", 'heading')
-        self.analysis_text.insert(tk.END, f"🔥 Calories totales: {analysis.total_calories:.0f} kcal\n")
-        self.analysis_text.insert(tk.END, f"🥩 Protéines: {analysis.total_proteins:.1f} g\n")
-        self.analysis_text.insert(tk.END, f"🍞 Glucides: {analysis.total_carbs:.1f} g\n")
-        self.analysis_text.insert(tk.END, f"🥑 Lipides: {analysis.total_fats:.1f} g\n\n")
+        doc.add("📊 RÉSUMÉ NUTRITIONNEL\n", 'heading')
+        doc.add(f"🔥 Calories totales: {analysis.total_calories:.0f} kcal\n")
+        doc.add(f"🥩 Protéines: {analysis.total_proteins:.1f} g\n")
+        doc.add(f"🍞 Glucides: {analysis.total_carbs:.1f} g\n")
+        doc.add(f"🥑 Lipides: {analysis.total_fats:.1f} g\n\n")
         
         # Conseils IA
         if analysis.health_tips:
-            self.analysis_text.insert(tk.END, "💡 CONSEILS NUTRITIONNELS IA\n", 'heading')
-            self.analysis_text.insert(tk.END, f"{analysis.health_tips}\n\n")
+            doc.add("💡 CONSEILS NUTRITIONNELS IA\n", 'heading')
+            doc.add(f"{analysis.health_tips}\n\n")
+        
+        # Origine des valeurs (base de données ou IA)
+        if analysis.sources:
+            source_labels = {'base': "📚 base", 'ia': "🤖 IA", 'non résolu': "❓ non résolu"}
+            doc.add("🔎 ORIGINE DES VALEURS\n", 'heading')
+            for name, source in analysis.sources.items():
+                doc.add(f"• {name}: {source_labels.get(source, source)}\n")
+            if analysis.tips_source:
+                doc.add(f"• Conseils: {'🤖 IA' if analysis.tips_source == 'ia' else 'par défaut'}\n")
+            doc.add("\n")
         
         # Répartition des macronutriments
         total_macros = analysis.total_proteins + analysis.total_carbs + analysis.total_fats
         if total_macros > 0:
-            self.analysis_text.insert(tk.END, "📈 RÉPARTITION DES MACRONUTRIMENTS\n", 'heading')
+            doc.add("📈 RÉPARTITION DES MACRONUTRIMENTS\n", 'heading')
             protein_pct = (analysis.total_proteins / total_macros) * 100
             carbs_pct = (analysis.total_carbs / total_macros) * 100
             fats_pct = (analysis.total_fats / total_macros) * 100
             
-            self.analysis_text.insert(tk.END, f"🥩 Protéines: {protein_pct:.1f}%\n")
-            self.analysis_text.insert(tk.END, f"🍞 Glucides: {carbs_pct:.1f}%\n")
-            self.analysis_text.insert(tk.END, f"🥑 Lipides: {fats_pct:.1f}%\n\n")
+            doc.add(f"🥩 Protéines: {protein_pct:.1f}%\n")
+            doc.add(f"🍞 Glucides: {carbs_pct:.1f}%\n")
+            doc.add(f"🥑 Lipides: {fats_pct:.1f}%\n\n")
         
         # Détail par aliment
         if self.current_calculations:
-            self.analysis_text.insert(tk.END, "🔍 DÉTAIL PAR ALIMENT\n", 'heading')
-            self.analysis_text.insert(tk.END, "-" * 40 + "\n")
+            doc.add("🔍 DÉTAIL PAR ALIMENT\n", 'heading')
+            doc.add("-" * 40 + "\n")
             
             for calc in self.current_calculations:
-                self.analysis_text.insert(tk.END, f"\n📍 {calc.ingredient_name.upper()}\n")
-                self.analysis_text.insert(tk.END, f"   Quantité: {calc.quantity} {calc.unit}\n")
-                self.analysis_text.insert(tk.END, f"   Calories: {calc.total_calories:.0f} kcal\n")
-                self.analysis_text.insert(tk.END, f"   Protéines: {calc.proteins:.1f} g\n")
-                self.analysis_text.insert(tk.END, f"   Glucides: {calc.carbs:.1f} g\n")
-                self.analysis_text.insert(tk.END, f"   Lipides: {calc.fats:.1f} g\n")
+                doc.add(f"\n📍 {calc.ingredient_name.upper()}\n")
+                doc.add(f"   Quantité: {calc.quantity} {calc.unit}\n")
+                doc.add(f"   Calories: {calc.total_calories:.0f} kcal\n")
+                doc.add(f"   Protéines: {calc.proteins:.1f} g\n")
+                doc.add(f"   Glucides: {calc.carbs:.1f} g\n")
+                doc.add(f"   Lipides: {calc.fats:.1f} g\n")
                 if calc.fiber > 0:
-                    self.analysis_text.insert(tk.END, f"   Fibres: {calc.fiber:.1f} g\n")
+                    doc.add(f"   Fibres: {calc.fiber:.1f} g\n")
+        
+        self.analysis_renderer.render(doc)
     
     def show_welcome_analysis(self):
         """Message de bienvenue pour l'analyse"""
@@ -827,9 +1153,9 @@ class CalorieTab:
 • Répartition nutritionnelle optimale
 • Export des résultats en CSV"""
 
-        self.analysis_text.delete(1.0, tk.END)
-        self.analysis_text.insert(tk.END, welcome)
+        self.analysis_renderer.render_text(welcome)
     
+    @instrumentation.timed()
     def export_analysis(self):
         """Exporte l'analyse en CSV"""
         if not self.current_calculations:
@@ -849,8 +1175,13 @@ class CalorieTab:
                     # En-têtes
                     writer.writerow(['Aliment', 'Quantité', 'Unité', 'Calories', 'Protéines', 'Glucides', 'Lipides', 'Fibres'])
                     
-                    # Données
+                    # Données et totaux en un seul passage
+                    totals = {'calories': 0.0, 'proteins': 0.0, 'carbs': 0.0, 'fats': 0.0}
                     for calc in self.current_calculations:
+                        totals['calories'] += calc.total_calories
+                        totals['proteins'] += calc.proteins
+                        totals['carbs'] += calc.carbs
+                        totals['fats'] += calc.fats
                         writer.writerow([
                             calc.ingredient_name,
                             calc.quantity,
@@ -862,18 +1193,12 @@ class CalorieTab:
                             f"{calc.fiber:.1f}"
                         ])
                     
-                    # Totaux
-                    total_calories = sum(calc.total_calories for calc in self.current_calculations)
-                    total_proteins = sum(calc.proteins for calc in self.current_calculations)
-                    total_carbs = sum(calc.carbs for calc in self.current_calculations)
-                    total_fats = sum(calc.fats for calc in self.current_calculations)
-                    
                     writer.writerow([])
                     writer.writerow(['TOTAL', '', '', 
-                                   f"{total_calories:.1f}",
-                                   f"{total_proteins:.1f}",
-                                   f"{total_carbs:.1f}",
-                                   f"{total_fats:.1f}",
+                                   f"{totals['calories']:.1f}",
+                                   f"{totals['proteins']:.1f}",
+                                   f"{totals['carbs']:.1f}",
+                                   f"{totals['fats']:.1f}",
                                    ""])
                 
                 messagebox.showinfo("Export", f"✅ Analyse exportée vers {filename}")
@@ -881,6 +1206,38 @@ class CalorieTab:
             except Exception as e:
                 messagebox.showerror("Erreur", f"❌ Erreur d'export: {e}")
     
+    @instrumentation.timed()
+    def save_meal(self):
+        """Ajoute le repas courant au journal"""
+        if not self.meal_log:
+            messagebox.showerror("Erreur", "❌ Journal des repas indisponible")
+            return
+        if not self.current_calculations:
+            messagebox.showwarning("Aucun aliment", "Ajoutez au moins un aliment reconnu")
+            return
+        
+        user = self.user_var.get().strip() or self.config.MEAL_LOG_USER
+        calculations = list(self.current_calculations)
+        meal_type = self.meal_type_var.get()
+        
+        self.executor.submit(
+            lambda handle: self.meal_log.log_meal(user, calculations, meal_type),
+            name="Enregistrement du repas",
+            on_success=lambda count: messagebox.showinfo(
+                "Journal", f"✅ {count} aliment(s) enregistré(s) pour {user} ({meal_type})"),
+            on_error=lambda e: messagebox.showerror("Erreur", f"❌ Erreur d'enregistrement: {e}")
+        )
+    
+    @instrumentation.timed()
+    def show_history(self):
+        """Ouvre l'historique de l'utilisateur"""
+        if not self.meal_log:
+            messagebox.showerror("Erreur", "❌ Journal des repas indisponible")
+            return
+        user = self.user_var.get().strip() or self.config.MEAL_LOG_USER
+        MealHistoryWindow(self.parent, self.config, self.meal_log, self.executor, user)
+    
+    @instrumentation.timed()
     def clear_analysis(self):
         """Remet à zéro l'analyse"""
         self.total_calories_var.set("0 kcal")
@@ -890,24 +1247,213 @@ class CalorieTab:
         self.current_calculations.clear()
         self.show_welcome_analysis()
 
+class MealHistoryWindow:
+    """Historique du journal: jours, semaines et moyennes glissantes
+    
+    Les totaux viennent des agrégats tenus à jour par MealLog; seules les
+    pages affichées sont lues, quelle que soit la taille du journal.
+    """
+    
+    DAY_COLUMNS = ('Date', 'Aliments', 'Calories', 'Moy. 7j', 'Protéines', 'Glucides', 'Lipides')
+    WEEK_COLUMNS = ('Semaine du', 'Jours', 'Calories', 'Moy./jour', 'Protéines', 'Glucides', 'Lipides')
+    
+    def __init__(self, parent, config, meal_log, executor, user):
+        self.config = config
+        self.meal_log = meal_log
+        self.executor = executor
+        self.user = user
+        self.oldest_day = None
+        self.oldest_week = None
+        
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"📅 Historique - {user}")
+        self.window.geometry("820x620")
+        
+        header = tk.Frame(self.window)
+        header.pack(fill='x', padx=10, pady=10)
+        self.summary_var = tk.StringVar(value="🔄 Chargement...")
+        tk.Label(header, textvariable=self.summary_var, font=('Segoe UI', 11, 'bold'),
+                justify='left').pack(side='left', anchor='w')
+        tk.Button(header, text="📤 Exporter", command=self.export_history,
+                 bg='#004E98', fg='white').pack(side='right')
+        
+        notebook = ttk.Notebook(self.window)
+        notebook.pack(fill='both', expand=True, padx=10)
+        
+        self.days_tree = self._create_page(notebook, "Jours", self.DAY_COLUMNS, self.load_days)
+        self.weeks_tree = self._create_page(notebook, "Semaines", self.WEEK_COLUMNS, self.load_weeks)
+        self.days_tree.bind('<<TreeviewSelect>>', self.on_day_selected)
+        
+        # Détail du jour sélectionné
+        detail_frame = tk.LabelFrame(self.window, text="🍽️ Détail du jour")
+        detail_frame.pack(fill='x', padx=10, pady=10)
+        self.detail_tree = ttk.Treeview(detail_frame, columns=('Repas', 'Aliment', 'Quantité', 'Calories'),
+                                        show='headings', height=6)
+        for col in ('Repas', 'Aliment', 'Quantité', 'Calories'):
+            self.detail_tree.heading(col, text=col)
+            self.detail_tree.column(col, width=120)
+        self.detail_tree.pack(fill='x', padx=5, pady=5)
+        
+        self.load_summary()
+        self.load_days()
+        self.load_weeks()
+    
+    def _create_page(self, notebook, title, columns, load_more):
+        frame = tk.Frame(notebook)
+        notebook.add(frame, text=title)
+        
+        tree = ttk.Treeview(frame, columns=columns, show='headings', height=12)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor='e' if col not in (columns[0],) else 'w')
+        scroll = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        
+        tk.Button(frame, text="⬇️ Plus ancien", command=load_more).pack(side='bottom', pady=5)
+        tree.pack(side='left', fill='both', expand=True)
+        scroll.pack(side='right', fill='y')
+        return tree
+    
+    def _submit(self, func, on_success, key):
+        self.executor.submit(
+            lambda handle: func(),
+            name="Historique des repas",
+            key=f"{key}-{id(self)}",
+            on_success=lambda result: self.window.winfo_exists() and on_success(result),
+            on_error=lambda e: messagebox.showerror("Erreur", f"❌ Erreur historique: {e}", parent=self.window)
+        )
+    
+    def load_summary(self):
+        def fetch():
+            return (self.meal_log.rolling_average(self.user, 7),
+                    self.meal_log.rolling_average(self.user, 30))
+        
+        def show(averages):
+            week, month = averages
+            self.summary_var.set(
+                f"Moyenne 7 jours: {week['calories']:.0f} kcal/jour ({week['days']} j saisis) | "
+                f"30 jours: {month['calories']:.0f} kcal/jour ({month['days']} j)\n"
+                f"Macros 7 jours: P {week['proteins']:.0f} g  G {week['carbs']:.0f} g  L {week['fats']:.0f} g"
+            )
+        
+        self._submit(fetch, show, "history-summary")
+    
+    def load_days(self):
+        before = self.oldest_day
+        
+        def show(rows):
+            for row in rows:
+                self.days_tree.insert('', 'end', iid=row['day'], values=(
+                    row['day'], row['entries'], f"{row['calories']:.0f}", f"{row['rolling_calories']:.0f}",
+                    f"{row['proteins']:.1f}", f"{row['carbs']:.1f}", f"{row['fats']:.1f}"
+                ))
+            if rows:
+                self.oldest_day = rows[-1]['day']
+        
+        self._submit(lambda: self.meal_log.daily_history(self.user, before, self.config.MEAL_HISTORY_PAGE),
+                     show, "history-days")
+    
+    def load_weeks(self):
+        before = self.oldest_week
+        
+        def show(rows):
+            for row in rows:
+                self.weeks_tree.insert('', 'end', values=(
+                    row['week'], row['days'], f"{row['calories']:.0f}", f"{row['avg_calories']:.0f}",
+                    f"{row['proteins']:.1f}", f"{row['carbs']:.1f}", f"{row['fats']:.1f}"
+                ))
+            if rows:
+                self.oldest_week = rows[-1]['week']
+        
+        self._submit(lambda: self.meal_log.weekly_history(self.user, before, self.config.MEAL_HISTORY_PAGE // 2),
+                     show, "history-weeks")
+    
+    def on_day_selected(self, event=None):
+        selection = self.days_tree.selection()
+        if not selection:
+            return
+        day = selection[0]
+        
+        def show(entries):
+            self.detail_tree.delete(*self.detail_tree.get_children())
+            for entry in entries:
+                self.detail_tree.insert('', 'end', values=(
+                    entry['meal'], entry['food'], f"{entry['quantity']:g} {entry['unit']}",
+                    f"{entry['calories']:.0f}"
+                ))
+        
+        self._submit(lambda: self.meal_log.day_entries(self.user, day), show, "history-detail")
+    
+    def export_history(self):
+        """Exporte tout l'historique de l'utilisateur, journée par journée"""
+        filename = filedialog.asksaveasfilename(
+            parent=self.window,
+            defaultextension=".pdf",
+            initialfile=default_filename('meal', ".pdf"),
+            filetypes=EXPORT_FILETYPES
+        )
+        if filename:
+            start_export(self.window, self.executor, filename, 'meal',
+                         lambda: meal_log_source(self.meal_log, self.user),
+                         lambda: self.meal_log.count_days(self.user))
+
 class MainApplication:
     """Application principale avec onglets séparés"""
     
     def __init__(self):
-        self.root = tk.Tk()
+        with instrumentation.span("démarrage.tk", "démarrage"):
+            self.root = tk.Tk()
         self.config = Config()
-        self.setup_window()
+        with instrumentation.span("démarrage.fenêtre", "démarrage"):
+            self.setup_window()
+        
+        # Exécuteur de tâches partagé par tous les onglets
+        self.executor = TaskExecutor(self.root, self.config.TASK_WORKERS, self.config.TASK_POLL_MS)
+        
+        # Surveillance des blocages de la boucle Tk
+        self.loop_monitor = EventLoopMonitor(self.root, instrumentation,
+                                             self.config.LAG_MONITOR_INTERVAL_MS,
+                                             self.config.LAG_WARN_MS)
+        self.first_paint_ms = None
         
         # Services
         self.data_manager = None
         self.ollama_service = None
         self.recipe_service = None
         self.calorie_service = None
+        self.meal_log = None
+        self.recipe_library = None
+        self.recipe_index = None
+        self.services_ready = False
+        
+        # Onglets construits à la première sélection
+        self.recipe_tab = None
+        self.calorie_tab = None
+        self._tab_builders = {}
+        self._built_tabs = set()
         
         # Interface
-        self.create_interface()
+        with instrumentation.span("démarrage.interface", "démarrage"):
+            self.create_interface()
+        self.root.bind('<Map>', self._on_first_map)
         self.initialize_services()
     
+    def _on_first_map(self, event=None):
+        """Mesure le délai entre le lancement et le premier affichage"""
+        if event is not None and event.widget is not self.root:
+            return
+        self.root.unbind('<Map>')
+        self.root.after_idle(self._report_first_paint)
+    
+    def _report_first_paint(self):
+        elapsed_ms = instrumentation.mark("premier_affichage")
+        target_ms = self.config.STARTUP_TARGET_MS
+        self.first_paint_ms = elapsed_ms
+        if elapsed_ms <= target_ms:
+            print(f"⚡ Premier affichage en {elapsed_ms:.0f} ms (objectif {target_ms} ms)")
+        else:
+            print(f"⚠️ Premier affichage en {elapsed_ms:.0f} ms, au-delà de l'objectif de {target_ms} ms")
+    
     def setup_window(self):
         """Configuration de la fenêtre"""
         self.root.title(self.config.APP_TITLE)
@@ -959,7 +1505,21 @@ class MainApplication:
         # Onglet Status/Test
         self.status_frame = tk.Frame(self.notebook)
         self.notebook.add(self.status_frame, text="🤖 Statut IA")
-        self.create_status_tab()
+        
+        # Statut IA, mis à jour même si l'onglet n'est pas encore construit
+        self.ollama_status_var = tk.StringVar(value="🔄 Vérification en cours...")
+        self.model_status_var = tk.StringVar(value="🔄 Vérification en cours...")
+        
+        # Construction différée: (constructeur, nécessite les services)
+        self._tab_builders = {
+            str(self.recipe_frame): (self.build_recipe_tab, True),
+            str(self.calorie_frame): (self.build_calorie_tab, True),
+            str(self.status_frame): (self.create_status_tab, False),
+        }
+        for frame in (self.recipe_frame, self.calorie_frame):
+            tk.Label(frame, text="🔄 Chargement des services...",
+                    font=('Segoe UI', 12)).pack(expand=True)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
         
         # Barre de statut
         status_bar = tk.Frame(self.root, bg='#FFE066', height=30)
@@ -970,6 +1530,7 @@ class MainApplication:
                                     bg='#FFE066', font=('Segoe UI', 10))
         self.bottom_status.pack(side='left', padx=10, pady=5)
     
+    @instrumentation.timed("onglet.statut", "démarrage")
     def create_status_tab(self):
         """Onglet de statut et test de l'IA"""
         # Titre
@@ -982,9 +1543,6 @@ class MainApplication:
                                         font=('Segoe UI', 12, 'bold'))
         status_info_frame.pack(fill='x', padx=50, pady=20)
         
-        self.ollama_status_var = tk.StringVar(value="🔄 Vérification en cours...")
-        self.model_status_var = tk.StringVar(value="🔄 Vérification en cours...")
-        
         tk.Label(status_info_frame, text="🌐 Ollama:", font=('Segoe UI', 11)).grid(row=0, column=0, sticky='w', padx=10, pady=5)
         tk.Label(status_info_frame, textvariable=self.ollama_status_var, font=('Segoe UI', 11)).grid(row=0, column=1, sticky='w', padx=10, pady=5)
         
@@ -993,6 +1551,21 @@ class MainApplication:
         
         status_info_frame.grid_columnconfigure(1, weight=1)
         
+        # Performance: démarrage, boucle d'événements et callbacks
+        perf_frame = tk.LabelFrame(self.status_frame, text="⏱️ Performance",
+                                  font=('Segoe UI', 12, 'bold'))
+        perf_frame.pack(fill='x', padx=50, pady=(0, 10))
+        
+        self.perf_text = tk.Text(perf_frame, height=12, font=('Consolas', 10),
+                                 state='disabled', wrap='none')
+        self.perf_text.pack(fill='x', padx=10, pady=(10, 5))
+        self.perf_renderer = TextRenderer(self.perf_text)
+        
+        tk.Button(perf_frame, text="💾 Exporter la trace", command=self.export_trace,
+                 bg='#6C757D', fg='white', font=('Segoe UI', 10)).pack(anchor='e', padx=10, pady=(0, 10))
+        
+        self.refresh_performance()
+        
         # Bouton de test
         tk.Button(self.status_frame, text="🧪 TESTER llama3.2:1b",
                  command=self.test_ai_full,
@@ -1025,39 +1598,188 @@ class MainApplication:
 
 ✅ Une fois ces étapes terminées, l'application fonctionnera pleinement !"""
         
-        self.test_text.insert(tk.END, instructions)
+        self.test_renderer = TextRenderer(self.test_text)
+        self.test_renderer.render_text(instructions)
+    
+    def refresh_performance(self):
+        """Met à jour la section Performance tant que l'onglet statut est affiché"""
+        if self.notebook.select() == str(self.status_frame):
+            self.perf_renderer.render_text(self._format_performance())
+        self.root.after(self.config.PERF_REFRESH_MS, self.refresh_performance)
+    
+    def _format_performance(self) -> str:
+        """Résumé texte des mesures"""
+        lines = []
+        if self.first_paint_ms is not None:
+            lines.append(f"Premier affichage: {self.first_paint_ms:.0f} ms "
+                         f"(objectif {self.config.STARTUP_TARGET_MS} ms)")
+        init_ms = instrumentation.marks.get("services_prêts")
+        if init_ms is not None:
+            lines.append(f"Services prêts:    {init_ms:.0f} ms")
+        
+        lag = self.loop_monitor.stats()
+        lines.append(f"Boucle Tk: retard {lag['current']:.0f} ms, moyen {lag['avg']:.1f} ms, "
+                     f"p95 {lag['p95']:.0f} ms, max {lag['max']:.0f} ms, blocages {lag['stalls']}")
+        
+        tasks = self.executor.stats()
+        lines.append(f"Tâches: {tasks['running']} en cours, {tasks['queued']} en attente, "
+                     f"{tasks['ui_backlog']} retours interface")
+        if self.recipe_library:
+            lines.append(f"Bibliothèque: {self.recipe_library.hits} recettes servies sans appel au modèle, "
+                         f"{self.recipe_library.misses} absentes")
+        if self.recipe_index and self.recipe_index.ready:
+            index = self.recipe_index.stats()
+            lines.append(f"Index des recettes: {index['recipes']} recettes, {index['ingredients']} ingrédients")
+        for row in prompt_stats.report():
+            parse_rate = f"{row['parse_rate']:.0%}" if row['parse_rate'] is not None else "-"
+            lines.append(f"Prompt {row['task']}/{row['variant']}: {row['calls']} appels, "
+                         f"~{row['estimated_tokens']:.0f} tokens estimés, {row['prompt_tokens']:.0f} évalués "
+                         f"en {row['prompt_eval_ms']:.0f} ms, parsing {parse_rate}")
+        if self.ollama_service:
+            breaker = self.ollama_service.breaker.stats()
+            state = breaker['state']
+            if breaker['retry_in']:
+                state += f" (appel test dans {breaker['retry_in']:.0f} s)"
+            lines.append(f"Disjoncteur Ollama: {state}, {breaker['failures']} échecs consécutifs, "
+                         f"ouvert {breaker['opens']} fois, {breaker['rejected']} appels refusés, "
+                         f"{self.ollama_service.retries} réessais")
+            for row in self.ollama_service.route_report():
+                timeouts = row['timeouts']
+                lines.append(f"Route {row['task']} → {row['model']}: {row['calls']} appels, "
+                             f"p50 {row['p50_ms']:.0f} ms, p95 {row['p95_ms']:.0f} ms, "
+                             f"1er morceau {row['first_token_ms']:.0f} ms, {row['tokens_per_s']:.1f} tokens/s, "
+                             f"{row['errors']} erreurs, {row['fallbacks']} replis")
+                lines.append(f"  Délais: 1er morceau {timeouts['first_token']:.0f} s, "
+                             f"total {timeouts['total']:.0f} s, blocage {timeouts['stall']:.0f} s")
+            for backend in self.ollama_service.pool.stats():
+                latency = f"{backend['ewma_ms']:.0f} ms" if backend['ewma_ms'] is not None else "non mesurée"
+                lines.append(f"Serveur {backend['url']}: {'actif' if backend['alive'] else 'retiré'}, "
+                             f"{backend['in_flight']} en cours, latence lissée {latency}, "
+                             f"{backend['requests']} appels, {backend['errors']} erreurs")
+        
+        lines.append("")
+        lines.append(f"{'Span':<40} {'n':>5} {'moy ms':>8} {'max ms':>8} {'dern ms':>8}")
+        for row in instrumentation.summary(limit=8):
+            lines.append(f"{row['name'][:40]:<40} {row['count']:>5} {row['avg_ms']:>8.1f} "
+                         f"{row['max_ms']:>8.1f} {row['last_ms']:>8.1f}")
+        return "\n".join(lines)
+    
+    def export_trace(self):
+        """Enregistre la trace pour analyse hors ligne (chrome://tracing, Perfetto, ou JSON lines)"""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("Trace Chrome", "*.json"), ("Spans JSON lines", "*.jsonl"), ("Tous", "*.*")],
+            initialfile=f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        if not filename:
+            return
+        try:
+            count = instrumentation.dump_trace(filename)
+            messagebox.showinfo("Succès", f"✅ Trace exportée ({count} spans):\n{filename}")
+        except OSError as e:
+            messagebox.showerror("Erreur", f"❌ Erreur export: {e}")
     
     def initialize_services(self):
         """Initialise les services"""
-        def init_thread():
-            try:
-                self.root.after(0, lambda: self.status_label.config(text="🔄 Initialisation..."))
-                
-                # Configuration
-                Config.ensure_data_dir()
-                
-                # Services
+        def init_task(handle):
+            # Imports lourds hors du thread Tk, après le premier affichage
+            with instrumentation.span("init.imports", "init"):
+                from models import DataManager
+                from ollama_service import OllamaService
+                from recipe_service import RecipeService
+                from calorie_service import CalorieService
+            
+            # Configuration
+            Config.ensure_data_dir()
+            
+            # Services
+            with instrumentation.span("init.données", "init"):
                 self.data_manager = DataManager(self.config)
+            with instrumentation.span("init.journal", "init"):
+                from meal_log import MealLog
+                self.meal_log = MealLog(self.config.MEAL_LOG_DB, self.config.MEAL_LOG_BATCH_SIZE)
+            with instrumentation.span("init.bibliothèque", "init"):
+                from recipe_library import RecipeLibrary
+                self.recipe_library = RecipeLibrary(self.config.RECIPE_LIBRARY_DB,
+                                                    self.config.RECIPE_LIBRARY_VARIANTS)
+            with instrumentation.span("init.services", "init"):
                 self.ollama_service = OllamaService(self.config)
-                self.recipe_service = RecipeService(self.ollama_service, self.config)
+                self.recipe_service = RecipeService(self.ollama_service, self.config, self.recipe_library)
                 self.calorie_service = CalorieService(self.ollama_service, self.data_manager, self.config)
-                
-                self.root.after(0, self.on_services_ready)
-                
-            except Exception as e:
-                self.root.after(0, lambda: self.on_init_error(str(e)))
+                # Index tenu à jour par la bibliothèque; rempli après le démarrage
+                from recipe_index import RecipeIndex
+                self.recipe_index = RecipeIndex(self.calorie_service.linker)
+                self.recipe_library.listeners.append(self.recipe_index.on_library_change)
+        
+        self._init_started = time.perf_counter()
+        self.status_label.config(text="🔄 Initialisation...")
+        self.executor.submit(
+            init_task,
+            name="Initialisation",
+            priority=TaskExecutor.PRIORITY_HIGH,
+            on_success=lambda _: self.on_services_ready(),
+            on_error=lambda e: self.on_init_error(str(e))
+        )
+    
+    def on_tab_changed(self, event=None):
+        """Construit l'onglet sélectionné à sa première ouverture"""
+        selected = self.notebook.select()
+        if selected in self._built_tabs or selected not in self._tab_builders:
+            return
         
-        threading.Thread(target=init_thread, daemon=True).start()
+        builder, needs_services = self._tab_builders[selected]
+        if needs_services and not self.services_ready:
+            return
+        
+        self._built_tabs.add(selected)
+        builder()
+    
+    @instrumentation.timed("onglet.recettes", "démarrage")
+    def build_recipe_tab(self):
+        """Crée l'onglet recettes"""
+        for widget in self.recipe_frame.winfo_children():
+            widget.destroy()
+        self.recipe_tab = RecipeTab(self.recipe_frame, self.config, self.recipe_service,
+                                    self.data_manager, self.executor, self.recipe_index)
+    
+    @instrumentation.timed("onglet.calories", "démarrage")
+    def build_calorie_tab(self):
+        """Crée l'onglet calories"""
+        for widget in self.calorie_frame.winfo_children():
+            widget.destroy()
+        self.calorie_tab = CalorieTab(self.calorie_frame, self.config, self.calorie_service,
+                                      self.data_manager, self.executor, self.meal_log)
     
     def on_services_ready(self):
         """Services prêts"""
-        # Créer les onglets
-        self.recipe_tab = RecipeTab(self.recipe_frame, self.config, self.recipe_service, self.data_manager)
-        self.calorie_tab = CalorieTab(self.calorie_frame, self.config, self.calorie_service, self.data_manager)
+        self.services_ready = True
+        instrumentation.record("initialize_services", "init", self._init_started,
+                               time.perf_counter() - self._init_started)
+        instrumentation.mark("services_prêts")
+        self.start_metrics()
+        
+        # Créer l'onglet affiché; les autres à leur première sélection
+        self.on_tab_changed()
         
         # Tester la connexion
         self.test_ai_connection()
         
+        self.executor.submit(
+            lambda handle: self.recipe_index.build(self.recipe_library.iter_rows()),
+            name="Index des recettes",
+            priority=TaskExecutor.PRIORITY_LOW,
+            on_error=lambda e: print(f"⚠️ Index des recettes indisponible: {e}")
+        )
+        
+        # Embeddings de la base calculés hors du thread Tk (rapprochement sémantique)
+        semantic_index = self.calorie_service.linker.semantic_index
+        self.executor.submit(
+            lambda handle: semantic_index.enabled and semantic_index.build(),
+            name="Index sémantique",
+            priority=TaskExecutor.PRIORITY_LOW,
+            on_error=lambda e: print(f"⚠️ Index sémantique indisponible: {e}")
+        )
+        
         self.status_label.config(text="✅ Services prêts")
         self.bottom_status.config(text="✅ Application prête - Sélectionnez un onglet pour commencer")
     
@@ -1068,18 +1790,22 @@ class MainApplication:
     
     def test_ai_connection(self):
         """Test silencieux de la connexion"""
-        def test_thread():
-            try:
-                result = self.ollama_service.test_connection()
-                self.root.after(0, lambda: self.update_ai_status(result))
-            except Exception:
-                self.root.after(0, lambda: self.update_ai_status({
-                    'ollama_available': False,
-                    'model_available': False,
-                    'error': 'Erreur de connexion'
-                }))
-        
-        threading.Thread(target=test_thread, daemon=True).start()
+        self.executor.submit(
+            lambda handle: self._timed_test_connection(),
+            name="Test de connexion",
+            priority=TaskExecutor.PRIORITY_LOW,
+            key="ai-test",
+            on_success=self.update_ai_status,
+            on_error=lambda e: self.update_ai_status({
+                'ollama_available': False,
+                'model_available': False,
+                'error': 'Erreur de connexion'
+            })
+        )
+    
+    def _timed_test_connection(self):
+        with instrumentation.span("ollama.test_connection", "ollama"):
+            return self.ollama_service.test_connection()
     
     def update_ai_status(self, result):
         """Met à jour le statut IA"""
@@ -1098,73 +1824,102 @@ class MainApplication:
     
     def test_ai_full(self):
         """Test complet avec affichage"""
-        def test_thread():
-            try:
-                result = self.ollama_service.test_connection()
-                self.root.after(0, lambda: self.show_test_results(result))
-            except Exception as e:
-                self.root.after(0, lambda: self.show_test_results({
-                    'ollama_available': False,
-                    'model_available': False,
-                    'error': str(e)
-                }))
-        
         # Vider et démarrer le test
-        self.test_text.delete(1.0, tk.END)
-        self.test_text.insert(tk.END, "🧪 Test en cours...\n\n")
-        
-        threading.Thread(target=test_thread, daemon=True).start()
+        self.test_renderer.render_text("🧪 Test en cours...\n\n")
+        
+        self.executor.submit(
+            lambda handle: self._timed_test_connection(),
+            name="Test complet",
+            key="ai-test",
+            on_success=self.show_test_results,
+            on_error=lambda e: self.show_test_results({
+                'ollama_available': False,
+                'model_available': False,
+                'test_response': None,
+                'error': str(e)
+            })
+        )
     
     def show_test_results(self, result):
         """Affiche les résultats du test"""
-        self.test_text.delete(1.0, tk.END)
+        doc = RichText()
         
         # Résultats
-        self.test_text.insert(tk.END, "🧪 RÉSULTATS DU TEST llama3.2:1b\n")
-        self.test_text.insert(tk.END, "=" * 50 + "\n\n")
+        doc.add("🧪 RÉSULTATS DU TEST llama3.2:1b\n")
+        doc.add("=" * 50 + "\n\n")
         
         # Ollama
         ollama_status = "✅ Disponible" if result['ollama_available'] else "❌ Non disponible"
-        self.test_text.insert(tk.END, f"🌐 Ollama: {ollama_status}\n")
+        doc.add(f"🌐 Ollama: {ollama_status}\n")
         
         # Modèle
         model_status = "✅ Disponible" if result['model_available'] else "❌ Non installé"
-        self.test_text.insert(tk.END, f"🤖 llama3.2:1b: {model_status}\n\n")
+        doc.add(f"🤖 llama3.2:1b: {model_status}\n\n")
         
         # Test de génération
         if result['test_response']:
-            self.test_text.insert(tk.END, "📝 TEST DE GÉNÉRATION:\n")
-            self.test_text.insert(tk.END, f"Réponse: {result['test_response']}\n\n")
-            self.test_text.insert(tk.END, "🎉 llama3.2:1b fonctionne parfaitement !\n\n")
+            doc.add("📝 TEST DE GÉNÉRATION:\n")
+            doc.add(f"Réponse: {result['test_response']}\n\n")
+            doc.add("🎉 llama3.2:1b fonctionne parfaitement !\n\n")
         
         # Instructions selon l'état
-        self.test_text.insert(tk.END, "🔧 ACTIONS RECOMMANDÉES:\n")
+        doc.add("🔧 ACTIONS RECOMMANDÉES:\n")
         
         if not result['ollama_available']:
-            self.test_text.insert(tk.END, "❌ Ollama n'est pas disponible\n")
-            self.test_text.insert(tk.END, "   → Démarrez Ollama: ollama serve\n")
-            self.test_text.insert(tk.END, "   → Ou installez Ollama: https://ollama.ai/\n\n")
+            doc.add("❌ Ollama n'est pas disponible\n")
+            doc.add("   → Démarrez Ollama: ollama serve\n")
+            doc.add("   → Ou installez Ollama: https://ollama.ai/\n\n")
         
         elif not result['model_available']:
-            self.test_text.insert(tk.END, "❌ llama3.2:1b n'est pas installé\n")
-            self.test_text.insert(tk.END, "   → Installez le modèle: ollama pull llama3.2:1b\n\n")
+            doc.add("❌ llama3.2:1b n'est pas installé\n")
+            doc.add("   → Installez le modèle: ollama pull llama3.2:1b\n\n")
         
         else:
-            self.test_text.insert(tk.END, "✅ Tout fonctionne ! Vous pouvez utiliser l'application.\n\n")
+            doc.add("✅ Tout fonctionne ! Vous pouvez utiliser l'application.\n\n")
         
         # Erreurs
         if result.get('error'):
-            self.test_text.insert(tk.END, f"⚠️ Erreur détectée: {result['error']}\n")
+            doc.add(f"⚠️ Erreur détectée: {result['error']}\n")
+        
+        self.test_renderer.render(doc)
         
         # Mettre à jour le statut
         self.update_ai_status(result)
     
+    def start_metrics(self):
+        """Exposition /metrics et instantané périodique, si configurés"""
+        if self.config.METRICS_PORT:
+            try:
+                metrics.serve(self.config.METRICS_HOST, self.config.METRICS_PORT)
+            except OSError as e:
+                print(f"Erreur serveur de métriques: {e}")
+        if self.config.METRICS_FILE:
+            metrics.start_snapshots(self.config.METRICS_FILE, self.config.METRICS_SNAPSHOT_INTERVAL)
+    
     def run(self):
         """Lance l'application"""
         try:
             self.root.mainloop()
         except KeyboardInterrupt:
             self.root.quit()
+        finally:
+            self.loop_monitor.stop()
+            self.executor.shutdown()
+            if self.meal_log:
+                self.meal_log.close()
+            if self.recipe_library:
+                self.recipe_library.close()
+            if self.config.PERF_TRACE_FILE:
+                try:
+                    count = instrumentation.dump_trace(self.config.PERF_TRACE_FILE)
+                    print(f"📈 Trace écrite ({count} spans): {self.config.PERF_TRACE_FILE}")
+                except OSError as e:
+                    print(f"Erreur écriture trace: {e}")
+            if self.config.METRICS_FILE:
+                try:
+                    metrics.write_snapshot(self.config.METRICS_FILE)
+                except OSError as e:
+                    print(f"Erreur instantané des métriques: {e}")
 
 # ===== FONCTION PRINCIPALE =====
 def main():
@@ -1174,20 +1929,11 @@ def main():
         print("=" * 60)
         print("🔧 Vérification des dépendances...")
         
-        # Vérifier les modules
+        # Vérifier les modules sans les importer (chargés à la première utilisation)
+        import importlib.util
         required_modules = ['tkinter', 'requests', 'pandas']
-        missing = []
-        
-        for module in required_modules:
-            try:
-                if module == 'tkinter':
-                    import tkinter
-                elif module == 'requests':
-                    import requests
-                elif module == 'pandas':
-                    import pandas
-            except ImportError:
-                missing.append(module)
+        missing = [module for module in required_modules
+                   if importlib.util.find_spec(module) is None]
         
         if missing:
             print(f"❌ Modules manquants: {', '.join(missing)}")
@@ -1237,8 +1983,13 @@ if __name__ == "__main__":
 🍽️ Assistant Culinaire & Calories IA v3.0
 
 UTILISATION:
-    python main.py              # Lancer l'application
-    python main.py --help       # Afficher cette aide
+    python main.py                      # Lancer l'application
+    python main.py --trace trace.json   # Écrire une trace de performance à la fermeture
+    python main.py recipes -i lots.jsonl        # Recettes par lots, sans interface (JSONL)
+    python main.py nutrition -i repas.csv -j 8  # Calories par lots, sans interface (JSONL)
+    python main.py export -o journal.pdf        # Export du journal des repas (jsonl, json, csv, pdf)
+    python main.py serve --port 8765            # API HTTP locale
+    python main.py --help               # Afficher cette aide
 
 FONCTIONNALITÉS:
 • Génération de recettes avec llama3.2:1b (OBLIGATOIRE)
@@ -1262,5 +2013,13 @@ INSTALLATION:
 L'application ne fonctionnera PAS sans llama3.2:1b !
             """)
             sys.exit(0)
+        if sys.argv[1] in ['recipes', 'nutrition', 'export']:
+            from cli import run_cli
+            sys.exit(run_cli(sys.argv[1:]))
+        if sys.argv[1] == 'serve':
+            from api_server import run_server
+            sys.exit(run_server(sys.argv[2:]))
+        if sys.argv[1] == '--trace' and len(sys.argv) > 2:
+            Config.PERF_TRACE_FILE = sys.argv[2]
     
     sys.exit(main())
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Journal des repas persistant (SQLite) avec totaux journaliers et hebdomadaires
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from models import CalorieCalculation
+from config import Config
+
+MACROS = ('calories', 'proteins', 'carbs', 'fats', 'fiber')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meals (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    logged_at TEXT NOT NULL,
+    meal TEXT NOT NULL DEFAULT '',
+    food TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    unit TEXT NOT NULL,
+    calories REAL NOT NULL,
+    proteins REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fats REAL NOT NULL,
+    fiber REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meals_user_day ON meals(user, day);
+CREATE INDEX IF NOT EXISTS idx_meals_day ON meals(day);
+
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    calories REAL NOT NULL,
+    proteins REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fats REAL NOT NULL,
+    fiber REAL NOT NULL,
+    PRIMARY KEY (user, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS weekly_totals (
+    user TEXT NOT NULL,
+    week TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    calories REAL NOT NULL,
+    proteins REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fats REAL NOT NULL,
+    fiber REAL NOT NULL,
+    PRIMARY KEY (user, week)
+) WITHOUT ROWID;
+"""
+
+def week_start(day: str) -> str:
+    """Lundi de la semaine d'une date ISO"""
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+class MealLog:
+    """Journal des repas par utilisateur
+    
+    Les tables daily_totals et weekly_totals sont tenues à jour dans la même
+    transaction que chaque insertion ou suppression: l'historique se lit
+    sans jamais reparcourir les repas, quel que soit le nombre d'années.
+    """
+    
+    def __init__(self, path: str = Config.MEAL_LOG_DB, batch_size: int = Config.MEAL_LOG_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+    
+    # ===== ÉCRITURE =====
+    
+    def log_meal(self, user: str, calculations: List[CalorieCalculation], meal: str = "",
+                 day: Optional[str] = None) -> int:
+        """Enregistre les aliments d'un repas en une transaction; retourne le nombre de lignes"""
+        day = day or date.today().isoformat()
+        rows = [{
+            'day': day,
+            'meal': meal,
+            'food': calc.ingredient_name,
+            'quantity': calc.quantity,
+            'unit': calc.unit,
+            'calories': calc.total_calories,
+            'proteins': calc.proteins,
+            'carbs': calc.carbs,
+            'fats': calc.fats,
+            'fiber': calc.fiber
+        } for calc in calculations]
+        return self.add_entries(user, rows)
+    
+    def add_entries(self, user: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Insère des lignes (day, food, quantity, unit, macros) par lots de batch_size
+        
+        Chaque lot est une transaction qui met aussi à jour les agrégats.
+        """
+        logged_at = datetime.now().isoformat(timespec='seconds')
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append((
+                user, row['day'], row.get('logged_at', logged_at), row.get('meal', ""),
+                row['food'], float(row.get('quantity', 0)), row.get('unit', 'g'),
+                *(float(row.get(macro, 0) or 0) for macro in MACROS)
+            ))
+            if len(batch) >= self.batch_size:
+                total += self._insert_batch(batch)
+                batch = []
+        if batch:
+            total += self._insert_batch(batch)
+        return total
+    
+    def _insert_batch(self, batch: List[tuple]) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO meals (user, day, logged_at, meal, food, quantity, unit, "
+                "calories, proteins, carbs, fats, fiber) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            self._apply_deltas([(row[0], row[1], 1, row[7:12]) for row in batch])
+        return len(batch)
+    
+    def delete_entries(self, entry_ids: List[int]) -> int:
+        """Supprime des lignes du journal et retire leur contribution des agrégats"""
+        if not entry_ids:
+            return 0
+        placeholders = ",".join("?" * len(entry_ids))
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT user, day, {', '.join(MACROS)} FROM meals WHERE id IN ({placeholders})",
+                entry_ids
+            ).fetchall()
+            self._conn.execute(f"DELETE FROM meals WHERE id IN ({placeholders})", entry_ids)
+            self._apply_deltas([(row['user'], row['day'], -1, tuple(-row[m] for m in MACROS)) for row in rows])
+        return len(rows)
+    
+    def _apply_deltas(self, deltas: List[Tuple[str, str, int, tuple]]):
+        """Ajoute des contributions (user, day, entrées, macros) aux agrégats (verrou tenu)"""
+        daily: Dict[Tuple[str, str], List[float]] = {}
+        for user, day, count, macros in deltas:
+            acc = daily.setdefault((user, day), [0] * (1 + len(MACROS)))
+            acc[0] += count
+            for i, value in enumerate(macros, start=1):
+                acc[i] += value
+        
+        weekly: Dict[Tuple[str, str], List[float]] = {}
+        for (user, day), acc in daily.items():
+            week_acc = weekly.setdefault((user, week_start(day)), [0] * len(acc))
+            for i, value in enumerate(acc):
+                week_acc[i] += value
+        
+        for table, key_column, totals in (('daily_totals', 'day', daily), ('weekly_totals', 'week', weekly)):
+            self._conn.executemany(
+                f"INSERT INTO {table} (user, {key_column}, entries, {', '.join(MACROS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(MACROS))}) "
+                f"ON CONFLICT(user, {key_column}) DO UPDATE SET entries = entries + excluded.entries, "
+                + ", ".join(f"{m} = {m} + excluded.{m}" for m in MACROS),
+                [(user, key, *acc) for (user, key), acc in totals.items()]
+            )
+            # Après suppression: retirer les jours et semaines devenus vides
+            emptied = [(user, key) for (user, key), acc in totals.items() if acc[0] < 0]
+            if emptied:
+                self._conn.executemany(
+                    f"DELETE FROM {table} WHERE user = ? AND {key_column} = ? AND entries <= 0", emptied
+                )
+    
+    def rebuild_aggregates(self):
+        """Recalcule les agrégats depuis les repas (réparation, migration)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM daily_totals")
+            self._conn.execute("DELETE FROM weekly_totals")
+            rows = self._conn.execute(
+                f"SELECT user, day, COUNT(*) AS n, {', '.join(f'SUM({m}) AS {m}' for m in MACROS)} "
+                "FROM meals GROUP BY user, day"
+            ).fetchall()
+            self._apply_deltas([(row['user'], row['day'], row['n'], tuple(row[m] for m in MACROS))
+                                for row in rows])
+    
+    # ===== LECTURE =====
+    
+    def daily_history(self, user: str, before: Optional[str] = None, limit: int = 60,
+                      rolling_days: int = 7) -> List[Dict[str, Any]]:
+        """Jours enregistrés, du plus récent au plus ancien (pagination par before)
+        
+        Chaque jour porte la moyenne glissante des calories sur rolling_days
+        jours calendaires (jours sans saisie exclus).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT day, entries, {', '.join(MACROS)} FROM daily_totals "
+                "WHERE user = ? AND day < ? ORDER BY day DESC LIMIT ?",
+                (user, before or "9999-12-31", limit)
+            ).fetchall()
+            if not rows:
+                return []
+            # Jours précédant la page, nécessaires aux premières moyennes
+            window_start = (date.fromisoformat(rows[-1]['day']) - timedelta(days=rolling_days - 1)).isoformat()
+            previous = self._conn.execute(
+                "SELECT day, calories FROM daily_totals WHERE user = ? AND day >= ? AND day < ?",
+                (user, window_start, rows[-1]['day'])
+            ).fetchall()
+        
+        calories_by_day = {row['day']: row['calories'] for row in previous}
+        calories_by_day.update((row['day'], row['calories']) for row in rows)
+        
+        history = []
+        for row in rows:
+            day = date.fromisoformat(row['day'])
+            window = [calories_by_day[d] for d in
+                      ((day - timedelta(days=i)).isoformat() for i in range(rolling_days))
+                      if d in calories_by_day]
+            entry = dict(row)
+            entry['rolling_calories'] = sum(window) / len(window)
+            history.append(entry)
+        return history
+    
+    def weekly_history(self, user: str, before: Optional[str] = None, limit: int = 26) -> List[Dict[str, Any]]:
+        """Semaines (lundi) du plus récent au plus ancien, avec le nombre de jours saisis"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT week, entries, {', '.join(MACROS)} FROM weekly_totals "
+                "WHERE user = ? AND week < ? ORDER BY week DESC LIMIT ?",
+                (user, before or "9999-12-31", limit)
+            ).fetchall()
+            if not rows:
+                return []
+            days = self._conn.execute(
+                "SELECT day FROM daily_totals WHERE user = ? AND day >= ? AND day < ?",
+                (user, rows[-1]['week'],
+                 (date.fromisoformat(rows[0]['week']) + timedelta(days=7)).isoformat())
+            ).fetchall()
+        
+        days_per_week: Dict[str, int] = {}
+        for row in days:
+            week = week_start(row['day'])
+            days_per_week[week] = days_per_week.get(week, 0) + 1
+        
+        history = []
+        for row in rows:
+            entry = dict(row)
+            entry['days'] = days_per_week.get(row['week'], 0)
+            entry['avg_calories'] = row['calories'] / entry['days'] if entry['days'] else 0.0
+            history.append(entry)
+        return history
+    
+    def rolling_average(self, user: str, days: int = 7, end: Optional[str] = None) -> Dict[str, float]:
+        """Moyenne par jour saisi des macros sur les days jours se terminant à end"""
+        end_day = date.fromisoformat(end) if end else date.today()
+        start_day = end_day - timedelta(days=days - 1)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT COUNT(*) AS days, {', '.join(f'AVG({m}) AS {m}' for m in MACROS)} "
+                "FROM daily_totals WHERE user = ? AND day BETWEEN ? AND ?",
+                (user, start_day.isoformat(), end_day.isoformat())
+            ).fetchone()
+        return {key: (row[key] or 0) for key in row.keys()}
+    
+    def day_entries(self, user: str, day: str) -> List[Dict[str, Any]]:
+        """Détail des aliments d'une journée"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, logged_at, meal, food, quantity, unit, {', '.join(MACROS)} "
+                "FROM meals WHERE user = ? AND day = ? ORDER BY id",
+                (user, day)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def count_days(self, user: Optional[str] = None) -> int:
+        """Nombre de journées enregistrées (total de progression d'un export)"""
+        with self._lock:
+            if user is None:
+                return self._conn.execute("SELECT COUNT(*) FROM daily_totals").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM daily_totals WHERE user = ?", (user,)).fetchone()[0]
+    
+    def iter_days(self, user: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Journées (aliments + totaux) dans l'ordre (user, day), lues par blocs
+        
+        Une connexion de lecture dédiée parcourt l'index (user, day) sans
+        bloquer les écritures (WAL); une seule journée est en mémoire à la fois.
+        """
+        if self.path == ':memory:':
+            raise ValueError("Parcours en flux impossible sur une base en mémoire")
+        
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            columns = f"id, user, day, meal, food, quantity, unit, {', '.join(MACROS)}"
+            if user is None:
+                cursor = conn.execute(f"SELECT {columns} FROM meals ORDER BY user, day, id")
+            else:
+                cursor = conn.execute(f"SELECT {columns} FROM meals WHERE user = ? ORDER BY day, id", (user,))
+            
+            current = None
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    key = (row['user'], row['day'])
+                    if current is None or current['key'] != key:
+                        if current is not None:
+                            yield self._day_record(current)
+                        current = {'key': key, 'entries': []}
+                    current['entries'].append({k: row[k] for k in ('meal', 'food', 'quantity', 'unit') + MACROS})
+            if current is not None:
+                yield self._day_record(current)
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _day_record(current: Dict[str, Any]) -> Dict[str, Any]:
+        user, day = current['key']
+        entries = current['entries']
+        totals = {macro: sum(entry[macro] for entry in entries) for macro in MACROS}
+        return {'user': user, 'day': day, 'entries': entries, 'totals': totals}
+    
+    def users(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT user FROM daily_totals ORDER BY user")]
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
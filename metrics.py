@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Métriques au format texte Prometheus: compteurs, jauges et histogrammes étiquetés,
+exposition HTTP locale et instantané dans un fichier
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from config import Config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Secondes: du cache local (quelques ms) à une recette sur CPU lent (minutes)
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_NAME_PATTERN = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """Famille de séries d'un même nom, une par combinaison d'étiquettes"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Nom de métrique invalide: {name}")
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Étiquettes de {self.name}: {', '.join(self.labels) or 'aucune'}")
+        return tuple(str(labels[name]) for name in self.labels)
+    
+    def _label_text(self, key: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+    
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{self._label_text(key)} {_format_value(value)}"
+    
+    def clear(self):
+        """Oublie toutes les séries (jauge recalculée à chaque collecte)"""
+        with self._lock:
+            self._values.clear()
+
+class Counter(Metric):
+    """Total croissant (requêtes, erreurs); le nom se termine par _total"""
+    
+    kind = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def sync(self, value: float, **labels):
+        """Recopie un total tenu ailleurs (statistiques existantes d'un service)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Gauge(Metric):
+    """Valeur instantanée (taille, profondeur de file, ratio)"""
+    
+    kind = "gauge"
+    
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Histogram(Metric):
+    """Distribution par seaux cumulés (_bucket, _sum, _count), pour les percentiles côté Prometheus"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        if 'le' in self.labels:
+            raise ValueError("L'étiquette 'le' est réservée aux histogrammes")
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # comptes par seau, puis somme
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+    
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulated += count
+                le = (('le', _format_value(bound)),)
+                yield f"{self.name}_bucket{self._label_text(key, le)} {cumulated}"
+            yield f"{self.name}_sum{self._label_text(key)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{self._label_text(key)} {cumulated}"
+    
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+class MetricsRegistry:
+    """Métriques de l'application et collecteurs appelés avant chaque export
+    
+    Les compteurs et histogrammes sont alimentés au fil des appels; les
+    collecteurs recopient au moment de l'export les statistiques que les
+    services tiennent déjà (caches, files, pool). Un collecteur est
+    enregistré sous un nom: le dernier service créé remplace le précédent.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Callable[[], None]] = {}
+    
+    def _get(self, cls, name: str, documentation: str, labels: Sequence[str], **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif type(metric) is not cls or metric.labels != tuple(labels):
+                raise ValueError(f"Métrique {name} déjà déclarée autrement")
+            return metric
+    
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, documentation, labels)
+    
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, labels)
+    
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labels, buckets=buckets)
+    
+    def register_collector(self, name: str, collector: Callable[[], None]):
+        with self._lock:
+            self._collectors[name] = collector
+    
+    def unregister_collector(self, name: str):
+        with self._lock:
+            self._collectors.pop(name, None)
+    
+    def collect(self):
+        """Appelle les collecteurs; une erreur n'empêche pas l'export des autres"""
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Erreur collecteur de métriques {name}: {e}")
+    
+    def render(self) -> str:
+        """Exposition au format texte Prometheus 0.0.4"""
+        self.collect()
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            samples = list(metric.samples())
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+    
+    def write_snapshot(self, path: str) -> int:
+        """Écrit l'exposition dans un fichier (remplacement atomique, lisible par le
+        collecteur textfile de node_exporter); retourne le nombre d'octets"""
+        data = self.render().encode('utf-8')
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+    
+    # ===== EXPOSITION =====
+    
+    def serve(self, host: str = Config.METRICS_HOST, port: int = Config.METRICS_PORT) -> 'ThreadingHTTPServer':
+        """Sert GET /metrics dans un thread dédié (interface et batch, sans serveur API)"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Seulement si l'exposition est activée
+        
+        registry = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="métriques-http", daemon=True).start()
+        print(f"📈 Métriques sur http://{host}:{server.server_address[1]}/metrics")
+        return server
+    
+    def start_snapshots(self, path: str, interval: float = Config.METRICS_SNAPSHOT_INTERVAL) -> threading.Event:
+        """Réécrit le fichier toutes les interval secondes; lever l'événement retourné arrête"""
+        stop = threading.Event()
+        
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.write_snapshot(path)
+                except OSError as e:
+                    print(f"Erreur instantané des métriques: {e}")
+        
+        threading.Thread(target=run, name="métriques-fichier", daemon=True).start()
+        return stop
+
+# Registre partagé par tous les services
+metrics = MetricsRegistry()
+
+def observe_cache(name: str, hits: float, misses: float, entries: Optional[float] = None):
+    """Recopie les compteurs d'un cache (collecteurs des services)"""
+    metrics.counter('cache_hits_total', "Lectures servies par le cache", ('cache',)).sync(hits, cache=name)
+    metrics.counter('cache_misses_total', "Lectures absentes du cache", ('cache',)).sync(misses, cache=name)
+    lookups = hits + misses
+    metrics.gauge('cache_hit_ratio', "Part des lectures servies par le cache", ('cache',)).set(
+        hits / lookups if lookups else 0.0, cache=name)
+    if entries is not None:
+        metrics.gauge('cache_entries', "Entrées en cache", ('cache',)).set(entries, cache=name)
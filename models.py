@@ -3,10 +3,12 @@
 Modèles de données pour l'application
 """
 
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
-import pandas as pd
 import os
+import time
+from metrics import metrics, observe_cache
 
 @dataclass
 class Ingredient:
@@ -41,6 +43,10 @@ class NutritionAnalysis:
     total_carbs: float
     total_fats: float
     health_tips: str = ""
+    is_provisional: bool = False
+    # Origine des valeurs par ingrédient: 'base', 'ia' ou 'non résolu'
+    sources: Dict[str, str] = field(default_factory=dict)
+    tips_source: str = ""
 
 @dataclass
 class CalorieCalculation:
@@ -65,8 +71,10 @@ class DataManager:
     
     def load_data(self):
         """Charge les données depuis les fichiers CSV"""
+        start = time.perf_counter()
         try:
             if os.path.exists(self.config.CALORIES_CSV):
+                import pandas as pd  # Chargé seulement si un CSV existe
                 df = pd.read_csv(self.config.CALORIES_CSV)
                 self._process_data(df)
             else:
@@ -74,8 +82,12 @@ class DataManager:
         except Exception as e:
             print(f"Erreur chargement données: {e}")
             self._create_sample_data()
+        
+        metrics.gauge('data_ingredients', "Ingrédients chargés dans le DataManager").set(len(self.ingredients_db))
+        metrics.gauge('data_load_seconds', "Durée du dernier chargement des données").set(
+            time.perf_counter() - start)
     
-    def _process_data(self, df: pd.DataFrame):
+    def _process_data(self, df: "pd.DataFrame"):
         """Traite les données du fichier CSV"""
         for _, row in df.iterrows():
             try:
@@ -154,4 +166,58 @@ class DataManager:
     def search_ingredients(self, query: str) -> List[Ingredient]:
         """Recherche d'ingrédients par nom"""
         query = query.lower()
-        return [ing for ing in self.ingredients_db.values() if query in ing.name.lower()]
\ No newline at end of file
+        return [ing for ing in self.ingredients_db.values() if query in ing.name.lower()]
+
+class IngredientFilter:
+    """Filtrage incrémental des ingrédients par recherche et catégorie
+    
+    Les résultats sont mémorisés par (recherche, catégorie). Une recherche
+    qui prolonge une recherche déjà calculée ne parcourt que ses résultats.
+    """
+    
+    ALL_CATEGORIES = "Toutes"
+    
+    def __init__(self, ingredients: List[Ingredient], max_cached: int = 256):
+        self.ingredients = ingredients
+        self.max_cached = max_cached
+        self._names = [ing.name.lower() for ing in ingredients]
+        self._memo: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        metrics.register_collector('ingredient_search',
+                                   lambda: observe_cache('ingredient_search', self.hits, self.misses, len(self._memo)))
+    
+    def filter(self, query: str, category: str = ALL_CATEGORIES) -> List[Ingredient]:
+        """Ingrédients (ordre d'origine) contenant query dans la catégorie"""
+        query = query.lower().strip()
+        return [self.ingredients[i] for i in self._indices(query, category)]
+    
+    def _indices(self, query: str, category: str) -> List[int]:
+        key = (query, category)
+        cached = self._memo.get(key)
+        if cached is not None:
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        
+        if query:
+            # Raffinement: partir du plus long préfixe déjà calculé
+            base = None
+            for length in range(len(query) - 1, 0, -1):
+                base = self._memo.get((query[:length], category))
+                if base is not None:
+                    break
+            if base is None:
+                base = self._indices("", category)
+            names = self._names
+            result = [i for i in base if query in names[i]]
+        elif category == self.ALL_CATEGORIES:
+            result = list(range(len(self.ingredients)))
+        else:
+            result = [i for i, ing in enumerate(self.ingredients) if ing.category == category]
+        
+        self._memo[key] = result
+        if len(self._memo) > self.max_cached:
+            self._memo.popitem(last=False)
+        return result
@@ -5,72 +5,596 @@ Service Ollama pour la communication avec llama3.2:1b
 
 import requests
 import json
-from typing import Optional
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from config import Config
+from prompt_builder import estimate_tokens
+from backend_pool import Backend, BackendPool
+from metrics import metrics
+from instrumentation import instrumentation, current_span
+from resilience import (CircuitBreaker, Deadline, OllamaError, RetryPolicy, classify, error_for_status,
+                        ERROR_DEADLINE, ERROR_SERVER, ERROR_TIMEOUT, HOST_ERRORS)
+
+OLLAMA_REQUESTS = metrics.counter('ollama_requests_total', "Appels Ollama par point d'accès, tâche, modèle et issue",
+                                  ('endpoint', 'task', 'model', 'status'))
+OLLAMA_ERRORS = metrics.counter('ollama_errors_total', "Appels Ollama en erreur par catégorie",
+                                ('endpoint', 'task', 'kind'))
+OLLAMA_RETRIES = metrics.counter('ollama_retries_total', "Réessais d'ouverture d'un flux", ('endpoint', 'kind'))
+OLLAMA_DURATION = metrics.histogram('ollama_request_duration_seconds', "Durée des appels Ollama réussis",
+                                    ('endpoint', 'task'))
+OLLAMA_FIRST_TOKEN = metrics.histogram('ollama_first_token_seconds', "Délai du premier morceau", ('task',))
+
+class RouteStats:
+    """Latences par route (tâche, modèle): appels, erreurs, replis, percentiles, débit"""
+    
+    def __init__(self, window: int = Config.ROUTE_LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    
+    def record(self, task: str, model: str, status: str, seconds: float,
+               first_token: Optional[float], fallback: bool):
+        """status: 'ok', 'error' ou 'cancelled'; first_token: délai du premier morceau"""
+        with self._lock:
+            row = self._rows.get((task, model))
+            if row is None:
+                row = self._rows[(task, model)] = {
+                    'ok': 0, 'error': 0, 'cancelled': 0, 'fallbacks': 0,
+                    'latencies': deque(maxlen=self.window), 'first_tokens': deque(maxlen=self.window),
+                    'rates': deque(maxlen=self.window)
+                }
+            row[status] += 1
+            row['fallbacks'] += 1 if fallback else 0
+            if status == 'ok':
+                row['latencies'].append(seconds * 1000)
+                if first_token is not None:
+                    row['first_tokens'].append(first_token * 1000)
+    
+    def record_rate(self, task: str, model: str, timings: Dict[str, Any]):
+        """Débit de génération (tokens/s) d'après eval_count et eval_duration d'Ollama"""
+        if not timings.get('eval_count') or not timings.get('eval_duration'):
+            return
+        with self._lock:
+            row = self._rows.get((task, model))
+            if row is not None:
+                row['rates'].append(timings['eval_count'] / (timings['eval_duration'] / 1e9))
+    
+    def percentile(self, task: str, model: str, field: str, q: float,
+                   min_samples: int = Config.TIMEOUT_MIN_SAMPLES) -> Optional[float]:
+        """Percentile q d'une série (latencies, first_tokens en ms; rates en tokens/s), None si trop peu de mesures"""
+        with self._lock:
+            row = self._rows.get((task, model))
+            values = sorted(row[field]) if row is not None else []
+        if len(values) < min_samples:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q))]
+    
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, dict(row), sorted(row['latencies']), list(row['first_tokens']))
+                     for key, row in self._rows.items()]
+        
+        report = []
+        for (task, model), row, latencies, first_tokens in items:
+            report.append({
+                'task': task,
+                'model': model,
+                'calls': row['ok'] + row['error'] + row['cancelled'],
+                'errors': row['error'],
+                'cancelled': row['cancelled'],
+                'fallbacks': row['fallbacks'],
+                'avg_ms': sum(latencies) / len(latencies) if latencies else 0.0,
+                'p50_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+                'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+                'first_token_ms': sum(first_tokens) / len(first_tokens) if first_tokens else 0.0,
+                'tokens_per_s': sum(row['rates']) / len(row['rates']) if row['rates'] else 0.0
+            })
+        report.sort(key=lambda item: (item['task'], item['model']))
+        return report
 
 class OllamaService:
-    """Service pour communiquer avec Ollama/llama3.2:1b"""
+    """Service pour communiquer avec Ollama/llama3.2:1b
+    
+    Chaque génération peut préciser sa tâche: Config.MODEL_ROUTES choisit
+    alors le modèle et ses options, avec repli sur OLLAMA_MODEL si le
+    modèle de la route n'est pas installé. Les appels sont répartis entre
+    les serveurs de Config.OLLAMA_BASE_URLS par un BackendPool.
+    """
+    
+    GENERATION_OPTIONS = {
+        "temperature": 0.3,        # Plus déterministe pour la cuisine
+        "top_p": 0.8,             # Réponses plus focalisées
+        "max_tokens": 800,        # Limiter la longueur
+        "repeat_penalty": 1.1     # Éviter répétitions
+    }
     
     def __init__(self, config: Config):
         self.config = config
         self.base_url = config.OLLAMA_BASE_URL
+        self.pool = BackendPool(config.OLLAMA_BASE_URLS, config.BACKEND_POLICY, config.BACKEND_EWMA_ALPHA,
+                                config.BACKEND_FAILURES_TO_DEAD, config.BACKEND_RETRY_INTERVAL,
+                                config.BACKEND_DEFAULT_LATENCY_MS)
         self.model = config.OLLAMA_MODEL
         self.timeout = 30  # Plus de temps pour le modèle compact
-        
+        self.connect_timeout = config.OLLAMA_CONNECT_TIMEOUT  # Un hôte éteint échoue vite
+        self.retry = RetryPolicy(config.OLLAMA_RETRY_ATTEMPTS, config.OLLAMA_RETRY_BASE,
+                                 config.OLLAMA_RETRY_MAX, config.OLLAMA_RETRY_KINDS)
+        self.breaker = CircuitBreaker(config.BREAKER_FAILURES, config.BREAKER_RESET)
+        self.retries = 0
+        self.route_stats = RouteStats(config.ROUTE_LATENCY_WINDOW)
+        self._models_lock = threading.Lock()
+        self._installed: Optional[List[str]] = None  # Noms renvoyés par /api/tags
+        self._installed_at = 0.0
+        self._missing: set = set()  # Modèles refusés par Ollama depuis la dernière lecture
+        metrics.register_collector('ollama', self._collect_metrics)
+    
+    @instrumentation.timed(category="ollama")
     def is_available(self) -> bool:
-        """Vérifie si Ollama est disponible"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except requests.RequestException:
-            return False
+        """Vérifie si au moins un serveur Ollama est disponible"""
+        return bool(self.pool.check_all())
     
     def is_model_available(self) -> bool:
-        """Vérifie si llama3.2:1b est disponible"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                return any(self.model in model.get('name', '') for model in models)
-            return False
-        except requests.RequestException:
+        """Vérifie si llama3.2:1b est disponible sur au moins un serveur"""
+        return self.check_status()['model_available']
+    
+    @instrumentation.timed(category="ollama")
+    def check_status(self) -> dict:
+        """Vérifie Ollama et llama3.2:1b (une requête par serveur, en parallèle)"""
+        status = {'ollama_available': False, 'model_available': False}
+        if self.pool.check_all():
+            status['ollama_available'] = True
+            models = self.pool.models()
+            self._remember_models(models)
+            status['model_available'] = any(self.model in name for name in models)
+        return status
+    
+    # ===== ROUTAGE =====
+    
+    def _remember_models(self, models: List[str]):
+        with self._models_lock:
+            self._installed = list(models)
+            self._installed_at = time.monotonic()
+            self._missing.clear()
+    
+    def installed_models(self) -> List[str]:
+        """Modèles installés, relus au plus toutes les Config.MODEL_LIST_TTL secondes"""
+        with self._models_lock:
+            fresh = self._installed is not None and time.monotonic() - self._installed_at < self.config.MODEL_LIST_TTL
+            if fresh:
+                return list(self._installed)
+        if self.pool.check_all():
+            self._remember_models(self.pool.models())
+        with self._models_lock:
+            return list(self._installed or [])
+    
+    def has_model(self, model: str) -> bool:
+        if model in self._missing:
             return False
+        return any(model in name for name in self.installed_models())
     
-    def generate_text(self, prompt: str, system_prompt: str = "") -> Optional[str]:
-        """Génère du texte avec llama3.2:1b"""
+    def route(self, task: Optional[str] = None) -> Tuple[str, Dict[str, Any], bool]:
+        """(modèle, options, repli) d'une tâche selon Config.MODEL_ROUTES
+        
+        Le modèle de la route puis ses replis sont essayés dans l'ordre;
+        OLLAMA_MODEL sert si aucun n'est installé (repli = True).
+        """
+        route = self.config.MODEL_ROUTES.get(task or "", {})
+        options = self.route_options(task)
+        
+        candidates = [route['model']] if route.get('model') else []
+        candidates += [model for model in route.get('fallback', []) if model not in candidates]
+        for position, model in enumerate(candidates):
+            if model == self.model or self.has_model(model):
+                return model, options, position > 0
+        return self.model, options, bool(candidates)
+    
+    def route_options(self, task: Optional[str] = None) -> Dict[str, Any]:
+        """Options de génération d'une tâche (communes + celles de sa route)"""
+        options = dict(self.GENERATION_OPTIONS)
+        options.update(self.config.MODEL_ROUTES.get(task or "", {}).get('options', {}))
+        return options
+    
+    def route_report(self) -> List[Dict[str, Any]]:
+        """Statistiques par route avec les délais qui s'appliquent au prochain appel"""
+        report = self.route_stats.report()
+        for row in report:
+            row['timeouts'] = self.timeouts(row['task'], row['model'], self.route_options(row['task']))
+        return report
+    
+    def _model_missing(self, model: str):
+        """Modèle refusé par Ollama (404): la route passe au repli jusqu'à la prochaine lecture"""
+        with self._models_lock:
+            self._missing.add(model)
+        print(f"⚠️ Modèle {model} absent, repli sur {self.model}")
+    
+    # ===== GÉNÉRATION =====
+    
+    def generate_text(self, prompt: str, system_prompt: str = "",
+                      cancel_event: Optional[threading.Event] = None,
+                      on_chunk: Optional[Callable[[str], None]] = None,
+                      on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      task: Optional[str] = None, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Génère du texte avec le modèle de la tâche (llama3.2:1b par défaut)
+        
+        on_chunk reçoit chaque morceau au fil de la génération, on_done les
+        compteurs du dernier morceau (prompt_eval_count, eval_duration...).
+        deadline est l'échéance de l'action appelante.
+        Retourne None en cas d'erreur ou si cancel_event est levé en cours de route.
+        """
+        return self._collect(self.stream_text(prompt, system_prompt, cancel_event, on_done, task, deadline),
+                             cancel_event, on_chunk)
+    
+    def chat_text(self, messages: List[Dict[str, str]],
+                  cancel_event: Optional[threading.Event] = None,
+                  on_chunk: Optional[Callable[[str], None]] = None,
+                  on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  task: Optional[str] = None, session: Optional['ChatSession'] = None,
+                  deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Réponse à une conversation (/api/chat), mêmes conventions que generate_text"""
+        return self._collect(self.stream_chat(messages, cancel_event, on_done, task, session, deadline),
+                             cancel_event, on_chunk)
+    
+    def chat_session(self, system_prompt: str = "", task: Optional[str] = None) -> 'ChatSession':
+        """Nouvelle conversation au préfixe système fixe, sur la route de la tâche"""
+        return ChatSession(self, system_prompt, self.config.CHAT_MAX_TURNS, self.config.CHAT_MAX_TOKENS, task)
+    
+    def _collect(self, chunks: Iterator[str], cancel_event: Optional[threading.Event],
+                 on_chunk: Optional[Callable[[str], None]]) -> Optional[str]:
+        """Assemble un flux; None en cas d'erreur ou d'annulation"""
         try:
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "system": system_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,        # Plus déterministe pour la cuisine
-                    "top_p": 0.8,             # Réponses plus focalisées
-                    "max_tokens": 800,        # Limiter la longueur
-                    "repeat_penalty": 1.1     # Éviter répétitions
-                }
-            }
+            parts = []
+            for chunk in chunks:
+                parts.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+            if cancel_event is not None and cancel_event.is_set():
+                print("⏹️ Génération annulée")
+                return None
+            return "".join(parts).strip()
+        
+        except Exception as e:
+            # Fermer la connexion depuis le watcher interrompt la lecture
+            if cancel_event is not None and cancel_event.is_set():
+                print("⏹️ Génération annulée")
+                return None
+            if isinstance(e, json.JSONDecodeError):
+                print(f"Erreur JSON: {e}")
+                return None
+            if isinstance(e, requests.RequestException):
+                print(f"Erreur Ollama: {e}")
+                return None
+            raise
+    
+    def stream_text(self, prompt: str, system_prompt: str = "",
+                    cancel_event: Optional[threading.Event] = None,
+                    on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    task: Optional[str] = None, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Génère du texte en flux, morceau par morceau
+        
+        Si cancel_event est levé, la connexion est fermée: Ollama abandonne
+        la génération et libère le modèle au lieu de finir pour rien.
+        """
+        payload = {
+            "prompt": prompt,
+            "system": system_prompt,
+            "stream": True,
+            "keep_alive": self.config.OLLAMA_KEEP_ALIVE
+        }
+        return self._stream("/api/generate", payload, lambda chunk: chunk.get('response', ''),
+                            cancel_event, on_done, task, None, deadline)
+    
+    def stream_chat(self, messages: List[Dict[str, str]],
+                    cancel_event: Optional[threading.Event] = None,
+                    on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    task: Optional[str] = None, session: Optional['ChatSession'] = None,
+                    deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Réponse à une conversation en flux (messages role/content)
+        
+        session épingle la conversation à l'hôte qui a son préfixe en cache.
+        """
+        payload = {
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.config.OLLAMA_KEEP_ALIVE
+        }
+        return self._stream("/api/chat", payload, lambda chunk: chunk.get('message', {}).get('content', ''),
+                            cancel_event, on_done, task, session, deadline)
+    
+    def _open(self, endpoint: str, payload: Dict[str, Any], session: Optional['ChatSession'] = None,
+              read_timeout: Optional[float] = None) -> Tuple[requests.Response, Backend]:
+        """POST en flux sur l'hôte choisi par le pool
+        
+        Une conversation reste sur son hôte tant qu'il est vivant. Un hôte
+        injoignable est signalé au pool et le suivant est essayé.
+        """
+        tried: List[str] = []
+        prefer = session.backend_url if session is not None else None
+        while True:
+            backend = self.pool.acquire(payload['model'], prefer, tried)
+            if backend is None:
+                raise requests.ConnectionError("Aucun serveur Ollama joignable")
+            try:
+                response = requests.post(f"{backend.url}{endpoint}", json=payload,
+                                         timeout=(self.connect_timeout, read_timeout or self.timeout),
+                                         stream=True)
+            except requests.ConnectionError:
+                self.pool.release(backend, False)
+                tried.append(backend.url)
+                prefer = None
+                continue
+            if session is not None:
+                session.backend_url = backend.url
+            return response, backend
+    
+    def timeouts(self, task: Optional[str], model: str, options: Dict[str, Any]) -> Dict[str, float]:
+        """Délais d'un appel: connexion, premier morceau, total et blocage du flux (s)
+        
+        Tirés du 95e percentile du premier morceau et du débit des appels les
+        plus lents de la route (5e percentile en tokens/s), appliqués à la
+        longueur demandée (num_predict); valeurs de départ tant que la route
+        a moins de TIMEOUT_MIN_SAMPLES mesures.
+        """
+        config = self.config
+        key = task or "défaut"
+        tokens = options.get('num_predict') or config.TASK_OUTPUT_TOKENS.get(task or "", config.OUTPUT_TOKENS_DEFAULT)
+        
+        first_ms = self.route_stats.percentile(key, model, 'first_tokens', 0.95)
+        if first_ms is None:
+            first_token = config.FIRST_TOKEN_TIMEOUT
+        else:
+            first_token = min(max(config.TIMEOUT_FACTOR * first_ms / 1000, config.FIRST_TOKEN_TIMEOUT_MIN),
+                              config.FIRST_TOKEN_TIMEOUT_MAX)
+        
+        rate = self.route_stats.percentile(key, model, 'rates', 0.05) or config.OLLAMA_ASSUMED_RATE
+        total = min(max(first_token + config.TIMEOUT_FACTOR * tokens / rate, config.TOTAL_TIMEOUT_MIN),
+                    config.TOTAL_TIMEOUT_MAX)
+        stall = min(max(config.TIMEOUT_FACTOR * config.STALL_TOKENS / rate, config.STALL_TIMEOUT_MIN),
+                    config.STALL_TIMEOUT_MAX)
+        return {'connect': self.connect_timeout, 'first_token': first_token, 'total': total, 'stall': stall}
+    
+    def _open_checked(self, endpoint: str, payload: Dict[str, Any], session: Optional['ChatSession'],
+                      cancel_event: Optional[threading.Event],
+                      watch: 'StreamWatch') -> Tuple[requests.Response, Backend, bool]:
+        """Ouvre le flux avec réessais: (réponse 200, hôte, repli de modèle)
+        
+        Seules les erreurs d'avant le premier morceau sont réessayées: rien
+        n'a encore été transmis à l'appelant. Un modèle de route absent (404)
+        bascule sur le modèle principal sans compter comme un essai. Aucun
+        essai ni attente ne dépasse l'échéance du flux.
+        """
+        fallback = False
+        attempt = 0
+        while True:
+            watch.check()
+            backend = None
+            try:
+                response, backend = self._open(endpoint, payload, session, watch.until_first_token())
+                if response.status_code == 404 and payload['model'] != self.model:
+                    response.close()
+                    self.pool.release(backend, True)
+                    self._model_missing(payload['model'])
+                    payload['model'] = self.model
+                    fallback = True
+                    continue
+                if response.status_code != 200:
+                    response.close()
+                    raise error_for_status(response.status_code)
+                return response, backend, fallback
+            
+            except requests.RequestException as e:
+                error = e
+                kind = classify(e)
+                if kind == ERROR_TIMEOUT and watch.expired():
+                    # Délai de lecture = échéance du flux: le motif dit laquelle
+                    kind = watch.reason_kind
+                    error = OllamaError(kind, watch.reason)
+                if backend is not None:
+                    self.pool.release(backend, kind not in HOST_ERRORS)
+                delay = self.retry.delay(attempt)
+                if (not self.retry.should_retry(kind, attempt) or delay >= watch.remaining()
+                        or (cancel_event is not None and cancel_event.is_set())):
+                    if error is not e:
+                        raise error from e
+                    if isinstance(e, OllamaError):
+                        raise
+                    raise OllamaError(kind, str(e)) from e
+                
+                attempt += 1
+                self.retries += 1
+                OLLAMA_RETRIES.inc(endpoint=endpoint, kind=kind)
+                print(f"🔁 Ollama ({kind}): essai {attempt + 1}/{self.retry.attempts} dans {delay:.1f} s")
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        raise OllamaError(kind, "Appel annulé pendant l'attente d'un réessai") from e
+                else:
+                    time.sleep(delay)
+    
+    def _stream(self, endpoint: str, payload: Dict[str, Any], extract: Callable[[Dict[str, Any]], str],
+                cancel_event: Optional[threading.Event],
+                on_done: Optional[Callable[[Dict[str, Any]], None]],
+                task: Optional[str], session: Optional['ChatSession'],
+                deadline: Optional[Deadline]) -> Iterator[str]:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        if deadline is not None:
+            deadline.check()
+        
+        # Circuit ouvert: échec immédiat au lieu d'attendre le timeout
+        self.breaker.before_call()
+        
+        model, options, fallback = self.route(task)
+        payload = dict(payload, model=model, options=options)
+        watch = StreamWatch(self.timeouts(task, model, options), deadline)
+        # Générateur: le span est enregistré à la fin, sans devenir le span courant de l'appelant
+        parent = current_span()
+        span = instrumentation.new_span(parent)
+        start = time.perf_counter()
+        first_token = None
+        status = 'error'
+        error_kind = None
+        response, backend = None, None
+        finished = threading.Event()
+        
+        try:
+            response, backend, model_fallback = self._open_checked(endpoint, payload, session, cancel_event, watch)
+            model = payload['model']
+            fallback = fallback or model_fallback
+            self._watch(response, cancel_event, watch, finished)
             
+            try:
+                for line in response.iter_lines():
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    if not line:
+                        continue
+                    watch.chunk()
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(ERROR_SERVER, chunk['error'])
+                    text = extract(chunk)
+                    if text:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        yield text
+                    if chunk.get('done'):
+                        status = 'ok'
+                        timings = {key: value for key, value in chunk.items() if key.endswith(('_count', '_duration'))}
+                        self.route_stats.record_rate(task or "défaut", model, timings)
+                        if on_done:
+                            on_done(timings)
+                        break
+            except Exception as e:
+                # Réponse fermée par le thread de garde: l'erreur utile est le délai
+                if watch.reason:
+                    raise OllamaError(watch.reason_kind, watch.reason) from e
+                raise
+            if watch.reason and status != 'ok':
+                raise OllamaError(watch.reason_kind, watch.reason)
+        except GeneratorExit:
+            # Lecteur arrêté avant la fin (client déconnecté)
+            status = 'cancelled'
+            raise
+        except requests.RequestException as e:
+            error_kind = classify(e)
+            raise
+        finally:
+            finished.set()
+            if response is not None:
+                response.close()
+            if status != 'ok' and cancel_event is not None and cancel_event.is_set():
+                status = 'cancelled'
+            host_failed = status == 'error' and error_kind in HOST_ERRORS
+            if backend is not None:
+                self.pool.release(backend, not host_failed, first_token)
+            if status == 'ok':
+                self.breaker.record_success()
+            elif host_failed:
+                self.breaker.record_failure(error_kind)
+            else:
+                self.breaker.record_neutral()
+            elapsed = time.perf_counter() - start
+            self.route_stats.record(task or "défaut", model, status, elapsed, first_token, fallback)
+            OLLAMA_REQUESTS.inc(endpoint=endpoint, task=task or "défaut", model=model, status=status)
+            if status == 'ok':
+                OLLAMA_DURATION.observe(elapsed, endpoint=endpoint, task=task or "défaut")
+            elif status == 'error':
+                OLLAMA_ERRORS.inc(endpoint=endpoint, task=task or "défaut", kind=error_kind or 'client')
+            if first_token is not None:
+                OLLAMA_FIRST_TOKEN.observe(first_token, task=task or "défaut")
+                # Attente du premier morceau: réseau, file du serveur, chargement et évaluation du prompt
+                instrumentation.record("ollama.premier_morceau", "ollama", start, first_token,
+                                       instrumentation.new_span(span), span)
+            instrumentation.record(f"OllamaService.{endpoint.rsplit('/', 1)[-1]}", "ollama", start, elapsed,
+                                   span, parent, {'task': task or "défaut", 'model': model, 'status': status,
+                                                  'backend': backend.url if backend else None,
+                                                  'error': error_kind})
+    
+    def _watch(self, response, cancel_event: Optional[threading.Event], watch: 'StreamWatch',
+               finished: threading.Event):
+        """Ferme la réponse dès l'annulation ou un délai dépassé, même pendant une lecture bloquante"""
+        def run():
+            while not finished.is_set():
+                if cancel_event is not None and cancel_event.is_set():
+                    response.close()
+                    return
+                if watch.expired():
+                    response.close()
+                    return
+                finished.wait(0.1)
+        
+        threading.Thread(target=run, name="garde-ollama", daemon=True).start()
+    
+    def embed_texts(self, texts: List[str], model: Optional[str] = None) -> Optional[List[List[float]]]:
+        """Calcule les embeddings d'un lot de textes"""
+        model = model or self.config.EMBEDDING_MODEL
+        backend = self.pool.acquire(model)
+        host_ok = True
+        status = 'error'
+        start = time.perf_counter()
+        try:
             response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=self.timeout
+                f"{backend.url}/api/embed",
+                json={"model": model, "input": texts},
+                timeout=(self.connect_timeout, self.timeout)
             )
-            
             if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                print(f"Erreur API Ollama: {response.status_code}")
+                status = 'ok'
+                return response.json().get('embeddings')
+            
+            if response.status_code != 404:
+                print(f"Erreur API Ollama (embed): {response.status_code}")
                 return None
-                
+            
+            # Anciennes versions d'Ollama: un texte par requête
+            embeddings = []
+            for text in texts:
+                response = requests.post(
+                    f"{backend.url}/api/embeddings",
+                    json={"model": model, "prompt": text},
+                    timeout=(self.connect_timeout, self.timeout)
+                )
+                if response.status_code != 200:
+                    print(f"Erreur API Ollama (embeddings): {response.status_code}")
+                    return None
+                embeddings.append(response.json().get('embedding'))
+            status = 'ok'
+            return embeddings
+        
         except requests.RequestException as e:
+            host_ok = False
             print(f"Erreur Ollama: {e}")
             return None
         except json.JSONDecodeError as e:
             print(f"Erreur JSON: {e}")
             return None
+        finally:
+            self.pool.release(backend, host_ok)
+            OLLAMA_REQUESTS.inc(endpoint="/api/embed", task="embed", model=model, status=status)
+            if status == 'ok':
+                OLLAMA_DURATION.observe(time.perf_counter() - start, endpoint="/api/embed", task="embed")
+            else:
+                OLLAMA_ERRORS.inc(endpoint="/api/embed", task="embed", kind='connect' if not host_ok else 'client')
+    
+    def _collect_metrics(self):
+        """Collecteur: disjoncteur et état de chaque serveur du pool"""
+        breaker = self.breaker.stats()
+        states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+        metrics.gauge('ollama_breaker_state', "Disjoncteur: 0 fermé, 1 semi-ouvert, 2 ouvert").set(
+            states[breaker['state']])
+        metrics.counter('ollama_breaker_opens_total', "Ouvertures du disjoncteur").sync(breaker['opens'])
+        metrics.counter('ollama_breaker_rejected_total', "Appels refusés par le disjoncteur").sync(
+            breaker['rejected'])
+        for backend in self.pool.stats():
+            url = backend['url']
+            metrics.gauge('ollama_backend_up', "Serveur Ollama dans le pool (1) ou retiré (0)",
+                          ('backend',)).set(1 if backend['alive'] else 0, backend=url)
+            metrics.gauge('ollama_backend_in_flight', "Appels en cours par serveur",
+                          ('backend',)).set(backend['in_flight'], backend=url)
+            if backend['ewma_ms'] is not None:
+                metrics.gauge('ollama_backend_first_token_ewma_seconds', "Délai lissé du premier morceau",
+                              ('backend',)).set(backend['ewma_ms'] / 1000, backend=url)
     
     def test_connection(self) -> dict:
         """Teste la connexion et retourne le statut"""
@@ -93,11 +617,112 @@ class OllamaService:
                     # Test génération
                     test_response = self.generate_text(
                         "Dis bonjour en français et confirme que tu peux créer des recettes",
-                        "Tu es un chef cuisinier français expert"
+                        "Tu es un chef cuisinier français expert",
+                        task='ping'
                     )
                     result['test_response'] = test_response
-            
+        
         except Exception as e:
             result['error'] = str(e)
         
-        return result
\ No newline at end of file
+        return result
+
+class StreamWatch:
+    """Échéances d'un flux: premier morceau, total et blocage entre deux morceaux
+    
+    Le total est borné par l'échéance de l'appelant; un dépassement dû à
+    celle-ci n'est pas imputé au serveur (ERROR_DEADLINE).
+    """
+    
+    def __init__(self, timeouts: Dict[str, float], deadline: Optional[Deadline] = None):
+        now = time.monotonic()
+        self.timeouts = timeouts
+        self.first_token_at = now + timeouts['first_token']
+        self.total_at = now + timeouts['total']
+        self.caller_bound = deadline is not None and deadline.expires_at < self.total_at
+        if self.caller_bound:
+            self.total_at = deadline.expires_at
+        self.last_chunk: Optional[float] = None
+        self.reason: Optional[str] = None
+        self.reason_kind = ERROR_TIMEOUT
+    
+    def chunk(self):
+        self.last_chunk = time.monotonic()
+    
+    def remaining(self) -> float:
+        return max(0.0, self.total_at - time.monotonic())
+    
+    def until_first_token(self) -> float:
+        """Délai de lecture de la réponse (les en-têtes arrivent avec le premier morceau)"""
+        return max(0.1, min(self.first_token_at, self.total_at) - time.monotonic())
+    
+    def expired(self) -> bool:
+        """Vrai (et reason renseignée) si une échéance est dépassée"""
+        now = time.monotonic()
+        if now >= self.total_at:
+            self.reason_kind = ERROR_DEADLINE if self.caller_bound else ERROR_TIMEOUT
+            self.reason = ("Budget de l'appel épuisé" if self.caller_bound
+                           else f"Délai total dépassé ({self.timeouts['total']:.0f} s)")
+        elif self.last_chunk is None and now >= self.first_token_at:
+            self.reason = f"Pas de premier morceau en {self.timeouts['first_token']:.0f} s"
+        elif self.last_chunk is not None and now - self.last_chunk >= self.timeouts['stall']:
+            self.reason = f"Flux bloqué depuis {self.timeouts['stall']:.0f} s"
+        return self.reason is not None
+    
+    def check(self):
+        """Lève OllamaError si une échéance est déjà dépassée (avant un essai)"""
+        if self.expired():
+            raise OllamaError(self.reason_kind, self.reason)
+
+class ChatSession:
+    """Conversation /api/chat dont le préfixe reste stable d'un appel à l'autre
+    
+    Ollama garde le cache KV du dernier préfixe évalué: une relance n'évalue
+    que son nouveau message, pas le système ni les échanges déjà vus.
+    L'historique est borné en tours et en tokens estimés; les tours retirés
+    sont les plus anciens après le premier échange, qui porte la demande et
+    le format de réponse. Les envois d'une même session sont sérialisés.
+    """
+    
+    def __init__(self, service: OllamaService, system_prompt: str = "",
+                 max_turns: int = Config.CHAT_MAX_TURNS, max_tokens: int = Config.CHAT_MAX_TOKENS,
+                 task: Optional[str] = None):
+        self.service = service
+        self.system = system_prompt
+        self.task = task  # Route (modèle) de toute la conversation
+        self.backend_url: Optional[str] = None  # Hôte qui a le préfixe en cache
+        self.max_turns = max(1, max_turns)
+        self.max_tokens = max_tokens
+        self.turns: List[Tuple[str, str]] = []  # (message utilisateur, réponse)
+        self._lock = threading.Lock()
+    
+    def messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Système, historique puis le nouveau message"""
+        messages = [{'role': 'system', 'content': self.system}] if self.system else []
+        for user, assistant in self.turns:
+            messages.append({'role': 'user', 'content': user})
+            messages.append({'role': 'assistant', 'content': assistant})
+        messages.append({'role': 'user', 'content': prompt})
+        return messages
+    
+    def send(self, prompt: str, cancel_event: Optional[threading.Event] = None,
+             on_chunk: Optional[Callable[[str], None]] = None,
+             on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+             deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Envoie un message; l'échange n'est gardé que si la réponse est complète"""
+        with self._lock:
+            response = self.service.chat_text(self.messages(prompt), cancel_event, on_chunk, on_done,
+                                              self.task, self, deadline)
+            if response:
+                self.turns.append((prompt, response))
+                self._trim()
+            return response
+    
+    def tokens(self) -> int:
+        """Taille estimée de la conversation"""
+        return estimate_tokens(self.system) + sum(estimate_tokens(user) + estimate_tokens(assistant)
+                                                  for user, assistant in self.turns)
+    
+    def _trim(self):
+        while len(self.turns) > 1 and (len(self.turns) > self.max_turns or self.tokens() > self.max_tokens):
+            del self.turns[1]
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Construction des prompts: gabarits précompilés, estimation des tokens, budgets par tâche
+et mesures d'évaluation du prompt par variante
+"""
+
+import re
+import string
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from config import Config
+from metrics import metrics
+
+# Tâche -> (clé du prompt système, clé du gabarit utilisateur)
+TASKS = {
+    'recipe': ('recipe_system', 'recipe_prompt'),
+    'nutrition': ('calories_system', 'nutrition_prompt'),
+    'advice': ('advice_system', 'advice_prompt'),
+    # Relances dans une ChatSession (le système de la session reste celui du premier message)
+    'variant': ('recipe_system', 'variant_prompt'),
+    'advice_followup': ('calories_system', 'advice_followup_prompt')
+}
+
+PROMPT_PARSES = metrics.counter('prompt_parse_total', "Réponses analysées par tâche, variante et résultat",
+                                ('task', 'variant', 'result'))
+
+# Sections facultatives retirées, de la dernière à la première, pour tenir le budget
+# (les ingrédients choisis par l'utilisateur ne sont jamais raccourcis)
+OPTIONAL = {'recipe': ('options',)}
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\n")
+
+def estimate_tokens(text: str) -> int:
+    """Estimation du nombre de tokens (BPE ~4 caractères par morceau de mot)
+    
+    Sans tokenizer local: chaque mot compte pour un token par tranche de
+    4 caractères, chaque signe et chaque retour à la ligne pour un token.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_PATTERN.findall(text))
+
+def compact_text(text: str) -> str:
+    """Retire l'indentation et les lignes vides (des tokens sans information)"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+@dataclass
+class Prompt:
+    """Prompt prêt à envoyer, avec sa provenance pour les statistiques"""
+    task: str
+    variant: str
+    text: str
+    system: str
+    tokens: int
+    dropped: Tuple[str, ...] = ()  # Sections facultatives retirées pour tenir le budget
+    over_budget: bool = False  # Au-delà du budget même sans sections facultatives
+
+class PromptTemplate:
+    """Gabarit découpé une fois pour toutes en (texte fixe, champ)"""
+    
+    def __init__(self, task: str, variant: str, system: str, template: str):
+        self.task = task
+        self.variant = variant
+        self.system = compact_text(system)
+        self.parts: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(template)
+        ]
+        self.fields = [field for _, field in self.parts if field]
+        self.system_tokens = estimate_tokens(self.system)
+        # Coût fixe (sans les champs), pour classer les variantes
+        self.base_tokens = self.system_tokens + estimate_tokens("".join(literal for literal, _ in self.parts))
+    
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join(literal + (values[field] if field else "") for literal, field in self.parts)
+
+class PromptStats:
+    """Mesures par (tâche, variante): tokens estimés et réels, temps d'évaluation, parsing"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: Dict[Tuple[str, str], Dict[str, float]] = {}
+    
+    def _row(self, prompt: Prompt) -> Dict[str, float]:
+        key = (prompt.task, prompt.variant)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = {
+                'built': 0, 'estimated_tokens': 0, 'dropped': 0, 'over_budget': 0,
+                'evaluated': 0, 'prompt_tokens': 0, 'prompt_eval_ms': 0.0,
+                'eval_tokens': 0, 'eval_ms': 0.0, 'parse_ok': 0, 'parse_failed': 0
+            }
+        return row
+    
+    def record_build(self, prompt: Prompt):
+        with self._lock:
+            row = self._row(prompt)
+            row['built'] += 1
+            row['estimated_tokens'] += prompt.tokens
+            row['dropped'] += 1 if prompt.dropped else 0
+            row['over_budget'] += 1 if prompt.over_budget else 0
+    
+    def record_eval(self, prompt: Prompt, timings: Dict[str, Any]):
+        """Compteurs renvoyés par Ollama dans le dernier morceau (durées en ns)
+        
+        prompt_eval_count ne compte que les tokens non trouvés dans le cache
+        du modèle: un préfixe système stable le fait baisser.
+        """
+        if 'prompt_eval_count' not in timings and 'prompt_eval_duration' not in timings:
+            return
+        with self._lock:
+            row = self._row(prompt)
+            row['evaluated'] += 1
+            row['prompt_tokens'] += timings.get('prompt_eval_count', 0)
+            row['prompt_eval_ms'] += timings.get('prompt_eval_duration', 0) / 1e6
+            row['eval_tokens'] += timings.get('eval_count', 0)
+            row['eval_ms'] += timings.get('eval_duration', 0) / 1e6
+    
+    def record_parse(self, prompt: Prompt, ok: bool):
+        with self._lock:
+            self._row(prompt)['parse_ok' if ok else 'parse_failed'] += 1
+        PROMPT_PARSES.inc(task=prompt.task, variant=prompt.variant, result='ok' if ok else 'failed')
+    
+    def report(self) -> List[Dict[str, Any]]:
+        """Moyennes par variante, triées par tâche puis temps d'évaluation du prompt"""
+        with self._lock:
+            items = [(key, dict(row)) for key, row in self._rows.items()]
+        
+        report = []
+        for (task, variant), row in items:
+            evaluated = row['evaluated'] or 1
+            parsed = row['parse_ok'] + row['parse_failed']
+            report.append({
+                'task': task,
+                'variant': variant,
+                'calls': int(row['built']),
+                'estimated_tokens': row['estimated_tokens'] / (row['built'] or 1),
+                'prompt_tokens': row['prompt_tokens'] / evaluated,
+                'prompt_eval_ms': row['prompt_eval_ms'] / evaluated,
+                'ms_per_prompt_token': row['prompt_eval_ms'] / row['prompt_tokens'] if row['prompt_tokens'] else 0.0,
+                'eval_ms': row['eval_ms'] / evaluated,
+                'parse_rate': row['parse_ok'] / parsed if parsed else None,
+                'dropped': int(row['dropped']),
+                'over_budget': int(row['over_budget'])
+            })
+        report.sort(key=lambda item: (item['task'], item['prompt_eval_ms']))
+        return report
+    
+    def reset(self):
+        with self._lock:
+            self._rows.clear()
+
+# Mesures partagées par tous les services
+prompt_stats = PromptStats()
+
+class PromptBuilder:
+    """Construit les prompts d'une tâche dans la variante configurée, sous budget
+    
+    Si le prompt dépasse le budget de la tâche, une variante plus courte est
+    essayée, puis sans ses sections facultatives. S'il ne tient toujours pas,
+    il est rendu complet avec over_budget: l'appelant décide.
+    """
+    
+    VARIANTS = ('standard', 'compact')
+    
+    def __init__(self, config: Config, stats: PromptStats = prompt_stats):
+        self.config = config
+        self.stats = stats
+        sources = {'standard': config.PROMPTS, 'compact': config.PROMPTS_COMPACT}
+        self.templates: Dict[Tuple[str, str], PromptTemplate] = {}
+        for task, (system_key, prompt_key) in TASKS.items():
+            for variant, prompts in sources.items():
+                if system_key in prompts and prompt_key in prompts:
+                    self.templates[(task, variant)] = PromptTemplate(
+                        task, variant, prompts[system_key], prompts[prompt_key])
+    
+    def build(self, task: str, variant: Optional[str] = None, **fields) -> Prompt:
+        """Prompt de la tâche dans la variante demandée (ou configurée)
+        
+        Les listes sont jointes par des virgules, en puces pour un champ *_list.
+        """
+        variant = variant or self.config.PROMPT_VARIANTS.get(task, 'standard')
+        if (task, variant) not in self.templates:
+            raise ValueError(f"Gabarit inconnu: {task}/{variant}")
+        budget = self.config.PROMPT_TOKEN_BUDGETS.get(task)
+        
+        # Variante demandée d'abord, puis les autres de la plus courte à la plus longue
+        candidates = [self.templates[(task, variant)]] + sorted(
+            (template for (name, other), template in self.templates.items()
+             if name == task and other != variant),
+            key=lambda template: template.base_tokens)
+        
+        for template in candidates:
+            prompt = self._render(template, fields)
+            if budget is None or prompt.tokens <= budget:
+                self.stats.record_build(prompt)
+                return prompt
+        
+        # Aucune variante ne tient: retirer les sections facultatives de la plus courte
+        template = min(candidates, key=lambda template: template.base_tokens)
+        optional = [name for name in OPTIONAL.get(task, ()) if fields.get(name)]
+        reduced, dropped = dict(fields), []
+        for name in reversed(optional):
+            reduced[name] = ""
+            dropped.append(name)
+            prompt = self._render(template, reduced)
+            if prompt.tokens <= budget:
+                prompt.dropped = tuple(dropped)
+                self.stats.record_build(prompt)
+                return prompt
+        
+        # Même sans elles, le prompt complet part tel quel et l'appelant est prévenu
+        prompt = self._render(template, fields)
+        prompt.over_budget = True
+        print(f"⚠️ Prompt {task} au-delà du budget: ~{prompt.tokens} tokens pour {budget}")
+        self.stats.record_build(prompt)
+        return prompt
+    
+    def _render(self, template: PromptTemplate, fields: Dict[str, Any]) -> Prompt:
+        values = {}
+        for field in template.fields:
+            value = fields.get(field, "")
+            if isinstance(value, list):
+                value = "\n".join(f"- {item}" for item in value) if field.endswith('_list') \
+                    else ", ".join(str(item) for item in value)
+            values[field] = str(value)
+        text = template.render(values)
+        return Prompt(template.task, template.variant, text, template.system,
+                      template.system_tokens + estimate_tokens(text))
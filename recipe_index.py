@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Index inversé ingrédient -> recettes de la bibliothèque (listes de postings en bitsets)
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+def iter_bits(bits: int) -> List[int]:
+    """Positions des bits à 1, dans l'ordre croissant"""
+    positions = []
+    text = bin(bits)[:1:-1]  # Bit de poids faible en premier
+    position = text.find('1')
+    while position != -1:
+        positions.append(position)
+        position = text.find('1', position + 1)
+    return positions
+
+class RecipeIndex:
+    """Chaque ingrédient a un bitset (entier Python) des recettes qui l'utilisent
+    
+    Bit n = recette d'id n dans la bibliothèque. Intersection et exclusion
+    sont des & et &~ sur des entiers, quel que soit le nombre de recettes.
+    Les noms libres des recettes sont ramenés aux clés du DataManager par
+    l'IngredientLinker; les noms non reconnus gardent leur forme normalisée.
+    """
+    
+    def __init__(self, linker=None):
+        self.linker = linker
+        self.ready = False
+        self._lock = threading.Lock()
+        self._postings: Dict[str, int] = {}
+        self._terms: Dict[int, Set[str]] = {}
+        self._titles: Dict[int, str] = {}
+        self._all = 0
+        self._removed: Set[int] = set()  # Retirées pendant la construction initiale
+    
+    def term(self, name: str) -> str:
+        """Clé DataManager d'un nom d'ingrédient, sinon forme normalisée"""
+        name = str(name).strip()
+        if self.linker is None:
+            return name.lower()
+        return self.linker.resolve(name) or self.linker.normalize(name) or name.lower()
+    
+    def terms(self, names: Iterable[str]) -> Set[str]:
+        return {self.term(name) for name in names if str(name).strip()}
+    
+    # ===== MISE À JOUR =====
+    
+    def add(self, recipe_id: int, recipe: Dict[str, Any]):
+        """Indexe (ou réindexe) une recette sérialisée (asdict)"""
+        terms = self.terms(ing.get('name', "") for ing in recipe.get('ingredients', []))
+        bit = 1 << recipe_id
+        with self._lock:
+            self._discard(recipe_id)
+            for term in terms:
+                self._postings[term] = self._postings.get(term, 0) | bit
+            self._terms[recipe_id] = terms
+            self._titles[recipe_id] = recipe.get('title', "")
+            self._all |= bit
+    
+    def remove(self, recipe_id: int):
+        with self._lock:
+            self._discard(recipe_id)
+            if not self.ready:
+                self._removed.add(recipe_id)
+    
+    def _discard(self, recipe_id: int):
+        terms = self._terms.pop(recipe_id, None)
+        if terms is None:
+            return
+        mask = ~(1 << recipe_id)
+        for term in terms:
+            bits = self._postings[term] & mask
+            if bits:
+                self._postings[term] = bits
+            else:
+                del self._postings[term]
+        self._titles.pop(recipe_id, None)
+        self._all &= mask
+    
+    def on_library_change(self, event: str, recipe_id: int, recipe: Optional[Dict[str, Any]]):
+        """Écouteur de RecipeLibrary: mise à jour incrémentale"""
+        if event == 'add':
+            self.add(recipe_id, recipe)
+        else:
+            self.remove(recipe_id)
+    
+    def build(self, rows: Iterable[Tuple[int, Dict[str, Any]]]) -> int:
+        """Indexe une bibliothèque existante; retourne le nombre de recettes"""
+        count = 0
+        for recipe_id, recipe in rows:
+            if recipe_id not in self._removed:
+                self.add(recipe_id, recipe)
+                count += 1
+        with self._lock:
+            self.ready = True
+            self._removed.clear()
+        return count
+    
+    # ===== REQUÊTES =====
+    
+    def query(self, include: Iterable[str] = (), exclude: Iterable[str] = (),
+              limit: Optional[int] = None) -> List[int]:
+        """Ids des recettes contenant tous les ingrédients include et aucun de exclude
+        
+        Les plus récentes (id le plus grand) en premier.
+        """
+        include_terms = self.terms(include)
+        exclude_terms = self.terms(exclude)
+        with self._lock:
+            bits = self._all
+            for term in include_terms:
+                bits &= self._postings.get(term, 0)
+                if not bits:
+                    return []
+            for term in exclude_terms:
+                bits &= ~self._postings.get(term, 0)
+        ids = iter_bits(bits)[::-1]
+        return ids[:limit] if limit else ids
+    
+    def rank(self, selected: Iterable[str], exclude: Iterable[str] = (),
+             limit: int = 10) -> List[Dict[str, Any]]:
+        """Recettes classées par couverture des ingrédients sélectionnés
+        
+        Score: part des ingrédients sélectionnés présents dans la recette;
+        à égalité, la recette avec le moins d'ingrédients en plus d'abord.
+        """
+        selected_terms = self.terms(selected)
+        if not selected_terms:
+            return []
+        exclude_terms = self.terms(exclude)
+        
+        with self._lock:
+            excluded = 0
+            for term in exclude_terms:
+                excluded |= self._postings.get(term, 0)
+            
+            # Compteurs par tranches de bits: digits[j] = recettes dont le nombre
+            # d'ingrédients couverts a le bit j à 1 (additionneur sur bitsets)
+            digits: List[int] = []
+            candidates = 0
+            for term in selected_terms:
+                carry = self._postings.get(term, 0) & ~excluded
+                candidates |= carry
+                j = 0
+                while carry:
+                    if j == len(digits):
+                        digits.append(0)
+                    digits[j], carry = digits[j] ^ carry, digits[j] & carry
+                    j += 1
+            
+            # Groupes de couverture décroissante; seuls les groupes retenus sont parcourus
+            results = []
+            for matched in range(min(len(selected_terms), (1 << len(digits)) - 1), 0, -1):
+                group = candidates
+                for j, digit in enumerate(digits):
+                    group &= digit if matched >> j & 1 else ~digit
+                if not group:
+                    continue
+                ranked = sorted((len(self._terms[recipe_id]) - matched, -recipe_id)
+                                for recipe_id in iter_bits(group))
+                for extra, neg_id in ranked[:limit - len(results)]:
+                    results.append({
+                        'id': -neg_id,
+                        'title': self._titles.get(-neg_id, ""),
+                        'coverage': matched / len(selected_terms),
+                        'matched': matched,
+                        'extra': extra
+                    })
+                if len(results) >= limit:
+                    break
+            return results
+    
+    def title(self, recipe_id: int) -> str:
+        return self._titles.get(recipe_id, "")
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'recipes': len(self._terms), 'ingredients': len(self._postings)}
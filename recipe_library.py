@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Bibliothèque persistante des recettes générées (SQLite), indexée par demande canonique
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from models import Recipe
+from ingredient_linker import IngredientLinker
+from config import Config
+from metrics import metrics, observe_cache
+
+# Politiques de RecipeService.get_recipe
+POLICY_LIBRARY = 'library'        # Servir depuis la bibliothèque, générer si absente
+POLICY_VARIANTS = 'variants'      # Générer jusqu'à N variantes puis les servir à tour de rôle
+POLICY_REGENERATE = 'regenerate'  # Toujours générer (et conserver les N plus récentes)
+POLICIES = (POLICY_LIBRARY, POLICY_VARIANTS, POLICY_REGENERATE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    ingredients TEXT NOT NULL,
+    options TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    served INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_key ON recipes(key, served, id);
+"""
+
+def _normalize(text: str) -> str:
+    """Minuscules, sans accents ni emojis, espaces réduits ("🇫🇷 Française" -> "francaise")"""
+    text = IngredientLinker.strip_accents(str(text).lower())
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+def canonical_request(ingredients: List[str], cuisine_type: str = "", difficulty: str = "",
+                      prep_time: str = "") -> Dict[str, Any]:
+    """Demande indépendante de l'ordre de sélection, de la casse et des accents"""
+    names = sorted({_normalize(name) for name in ingredients} - {""})
+    return {'ingredients': names, 'cuisine_type': _normalize(cuisine_type),
+            'difficulty': _normalize(difficulty), 'prep_time': _normalize(prep_time)}
+
+def recipe_key(ingredients: List[str], cuisine_type: str = "", difficulty: str = "",
+               prep_time: str = "") -> str:
+    """Empreinte SHA-1 de la demande canonique"""
+    request = canonical_request(ingredients, cuisine_type, difficulty, prep_time)
+    text = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class RecipeLibrary:
+    """Recettes générées, jusqu'à max_variants par demande canonique
+    
+    Une recherche est une lecture d'index sur (key, served): la variante la
+    moins servie est choisie, ce qui fait tourner les variantes d'une clé.
+    """
+    
+    def __init__(self, path: str = Config.RECIPE_LIBRARY_DB,
+                 max_variants: int = Config.RECIPE_LIBRARY_VARIANTS):
+        self.path = path
+        self.max_variants = max(1, max_variants)
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        
+        self.hits = 0
+        self.misses = 0
+        # Écouteurs (événement 'add' ou 'remove', id, recette) appelés après chaque écriture
+        self.listeners: List[Callable[[str, int, Optional[Dict[str, Any]]], None]] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        metrics.register_collector('recipe_library', self._collect_metrics)
+    
+    def count(self, key: str) -> int:
+        """Nombre de variantes enregistrées pour une clé"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recipes WHERE key = ?", (key,)).fetchone()[0]
+    
+    def pick(self, key: str) -> Optional[Recipe]:
+        """Variante la moins servie (la plus ancienne à égalité), ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, data FROM recipes WHERE key = ? ORDER BY served, id LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE recipes SET served = served + 1 WHERE id = ?", (row['id'],))
+            self.hits += 1
+        return Recipe(**json.loads(row['data']))
+    
+    def get(self, recipe_id: int) -> Optional[Recipe]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        return Recipe(**json.loads(row['data'])) if row else None
+    
+    def variants(self, key: str) -> List[Recipe]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM recipes WHERE key = ? ORDER BY id", (key,)).fetchall()
+        return [Recipe(**json.loads(row['data'])) for row in rows]
+    
+    def add(self, key: str, recipe: Recipe, request: Dict[str, Any]) -> int:
+        """Enregistre une variante; au-delà de max_variants, les plus anciennes sont retirées"""
+        record = asdict(recipe)
+        options = json.dumps({k: v for k, v in request.items() if k != 'ingredients'}, ensure_ascii=False)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO recipes (key, ingredients, options, created_at, served, data) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                (key, json.dumps(request['ingredients'], ensure_ascii=False), options, time.time(),
+                 json.dumps(record, ensure_ascii=False))
+            )
+            recipe_id = cursor.lastrowid
+            removed = [row[0] for row in self._conn.execute(
+                "SELECT id FROM recipes WHERE key = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (key, self.max_variants)
+            )]
+            self._conn.executemany("DELETE FROM recipes WHERE id = ?", [(old,) for old in removed])
+        
+        for listener in self.listeners:
+            listener('add', recipe_id, record)
+            for old in removed:
+                listener('remove', old, None)
+        return recipe_id
+    
+    def iter_recipes(self) -> Iterator[Dict[str, Any]]:
+        """Toutes les recettes (dict), lues par blocs sur une connexion dédiée"""
+        for _, recipe in self.iter_rows():
+            yield recipe
+    
+    def iter_rows(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(id, recette) dans l'ordre des id, sans bloquer les écritures (WAL)"""
+        if self.path == ':memory:':
+            raise ValueError("Parcours en flux impossible sur une base en mémoire")
+        
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute("SELECT id, data FROM recipes ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(Config.MEAL_LOG_BATCH_SIZE)
+                if not rows:
+                    break
+                for recipe_id, data in rows:
+                    yield recipe_id, json.loads(data)
+        finally:
+            conn.close()
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            keys, recipes = self._conn.execute("SELECT COUNT(DISTINCT key), COUNT(*) FROM recipes").fetchone()
+        return {'keys': keys, 'recipes': recipes, 'hits': self.hits, 'misses': self.misses}
+    
+    def _collect_metrics(self):
+        stats = self.stats()
+        observe_cache('recipe_library', stats['hits'], stats['misses'], stats['recipes'])
+    
+    def close(self):
+        metrics.unregister_collector('recipe_library')
+        with self._lock:
+            self._conn.close()
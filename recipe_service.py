@@ -4,66 +4,187 @@ Service de génération de recettes avec llama3.2:1b
 """
 
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from models import Recipe
-from ollama_service import OllamaService
+from recipe_library import canonical_request, recipe_key, POLICIES, POLICY_REGENERATE, POLICY_VARIANTS
+from prompt_builder import PromptBuilder, Prompt
+from ollama_service import OllamaService, ChatSession
+from resilience import Deadline, CircuitOpenError
+from instrumentation import instrumentation
 from config import Config
 
 class RecipeService:
     """Service pour la génération de recettes avec IA uniquement"""
     
-    def __init__(self, ollama_service: OllamaService, config: Config):
+    def __init__(self, ollama_service: OllamaService, config: Config, library=None):
         self.ollama_service = ollama_service
         self.config = config
+        self.library = library  # RecipeLibrary optionnelle
+        self.prompts = PromptBuilder(config)
+        # Conversation par demande canonique: une nouvelle variante est une relance
+        self._sessions: "OrderedDict[str, Tuple[ChatSession, str]]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
     
+    def get_recipe(self, ingredients: List[str], cuisine_type: str = "",
+                   difficulty: str = "", prep_time: str = "", policy: Optional[str] = None,
+                   cancel_event: Optional[threading.Event] = None,
+                   on_chunk: Optional[Callable[[str], None]] = None,
+                   deadline: Optional[Deadline] = None) -> Tuple[Optional[Recipe], bool]:
+        """Recette depuis la bibliothèque ou générée selon la politique
+        
+        Retourne (recette, servie_depuis_la_bibliothèque).
+        """
+        recipe = self.library_lookup(ingredients, cuisine_type, difficulty, prep_time, policy)
+        if recipe is not None:
+            return recipe, True
+        # Seule la politique variants demande une autre version de la même demande
+        variant = (policy or self.config.RECIPE_LIBRARY_POLICY) == POLICY_VARIANTS
+        return self.generate_recipe(ingredients, cuisine_type, difficulty, prep_time,
+                                    cancel_event, on_chunk, deadline, variant=variant), False
+    
+    def library_lookup(self, ingredients: List[str], cuisine_type: str = "",
+                       difficulty: str = "", prep_time: str = "",
+                       policy: Optional[str] = None) -> Optional[Recipe]:
+        """Recette à servir sans appel au modèle, ou None s'il faut générer
+        
+        library: toute variante enregistrée; variants: seulement une fois les
+        N variantes générées; regenerate: jamais.
+        """
+        if self.library is None:
+            return None
+        
+        policy = policy or self.config.RECIPE_LIBRARY_POLICY
+        if policy not in POLICIES:
+            raise ValueError(f"❌ Politique inconnue: {policy} ({', '.join(POLICIES)})")
+        if policy == POLICY_REGENERATE:
+            return None
+        
+        key = recipe_key(ingredients, cuisine_type, difficulty, prep_time)
+        if policy == POLICY_VARIANTS and self.library.count(key) < self.library.max_variants:
+            return None
+        
+        recipe = self.library.pick(key)
+        if recipe is not None:
+            print(f"📚 Recette servie depuis la bibliothèque: {recipe.title}")
+        return recipe
+    
+    @instrumentation.timed(category="service")
     def generate_recipe(self, ingredients: List[str], cuisine_type: str = "", 
-                       difficulty: str = "", prep_time: str = "") -> Optional[Recipe]:
-        """Génère une recette avec llama3.2:1b - OBLIGATOIRE"""
+                       difficulty: str = "", prep_time: str = "",
+                       cancel_event: Optional[threading.Event] = None,
+                       on_chunk: Optional[Callable[[str], None]] = None,
+                       deadline: Optional[Deadline] = None,
+                       variant: bool = False) -> Optional[Recipe]:
+        """Génère une recette avec llama3.2:1b - OBLIGATOIRE
+        
+        cancel_event permet d'interrompre la génération en cours;
+        on_chunk reçoit le texte brut au fil de l'eau; deadline borne
+        l'ensemble de l'action (réessais compris); variant demande une
+        autre version dans la conversation existante de la demande.
+        """
         if not ingredients:
             raise ValueError("❌ Aucun ingrédient sélectionné")
         
-        # Vérifier que llama3.2:1b est disponible
-        if not self.ollama_service.is_available():
+        # Circuit ouvert: échec immédiat, sans attendre les délais des sondes
+        try:
+            self.ollama_service.breaker.raise_if_open()
+        except CircuitOpenError as e:
+            raise ConnectionError(f"❌ {e}") from e
+        
+        # Vérifier que llama3.2:1b est disponible (une seule sonde)
+        status = self.ollama_service.check_status()
+        if not status['ollama_available']:
             raise ConnectionError("❌ Ollama n'est pas disponible. Démarrez Ollama avec: ollama serve")
         
-        if not self.ollama_service.is_model_available():
+        if not status['model_available']:
             raise ConnectionError("❌ llama3.2:1b n'est pas disponible. Installez avec: ollama pull llama3.2:1b")
         
-        # Créer le prompt
-        ingredient_list = "\n".join([f"- {ing}" for ing in ingredients])
-        prompt = self.config.PROMPTS['recipe_prompt'].format(
-            ingredients=", ".join(ingredients),
-            ingredient_list=ingredient_list
-        )
-        
-        # Ajouter les options
+        # Options de génération
+        options = ""
         if cuisine_type:
-            prompt += f"\nStyle de cuisine: {cuisine_type}"
+            options += f"\nStyle de cuisine: {cuisine_type}"
         if difficulty:
-            prompt += f"\nDifficulté souhaitée: {difficulty}"
+            options += f"\nDifficulté souhaitée: {difficulty}"
         if prep_time:
-            prompt += f"\nTemps maximum: {prep_time}"
+            options += f"\nTemps maximum: {prep_time}"
+        
+        # Variante d'une demande déjà générée dans ce processus: relancée dans sa
+        # conversation, seul le court message de relance est évalué
+        key = recipe_key(ingredients, cuisine_type, difficulty, prep_time)
+        session, prompt_variant = self._take_session(key) if variant else (None, "")
+        if session is not None:
+            print(f"🔁 Variante demandée: relance dans la conversation existante ({prompt_variant})")
+            prompt = self.prompts.build('variant', variant=prompt_variant)
+        else:
+            # Créer le prompt (variante et budget de Config.PROMPT_VARIANTS / PROMPT_TOKEN_BUDGETS)
+            with instrumentation.span("prompt.construction", "service"):
+                prompt = self.prompts.build('recipe', ingredients=list(ingredients),
+                                            ingredient_list=list(ingredients), options=options)
+            if prompt.dropped:
+                print(f"⚠️ Options ignorées pour tenir le budget du prompt: {options.strip()}")
+            session = self.ollama_service.chat_session(prompt.system, prompt.task)
+            prompt_variant = prompt.variant
         
         # Générer avec llama3.2:1b
-        print(f"🤖 Génération avec llama3.2:1b...")
-        response = self.ollama_service.generate_text(
-            prompt, 
-            self.config.PROMPTS['recipe_system']
+        print(f"🤖 Génération avec llama3.2:1b ({prompt.task}/{prompt.variant}, "
+              f"~{prompt.tokens} tokens de prompt)...")
+        response = session.send(
+            prompt.text,
+            cancel_event,
+            on_chunk,
+            lambda timings: self.prompts.stats.record_eval(prompt, timings),
+            deadline
         )
+        if session.turns:
+            self._keep_session(key, session, prompt_variant)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        
+        if not response and deadline is not None and deadline.expired():
+            raise TimeoutError(f"❌ Recette non générée dans le budget de {deadline.seconds:g} s")
         
         if not response:
             raise RuntimeError("❌ llama3.2:1b n'a pas pu générer de réponse")
         
         # Parser la réponse
-        recipe = self._parse_recipe_response(response, ingredients)
+        recipe = self._parse_recipe_response(response, ingredients, prompt)
         
         if not recipe:
             raise RuntimeError("❌ Impossible de parser la réponse de llama3.2:1b")
         
+        if self.library is not None:
+            self.library.add(key, recipe, canonical_request(ingredients, cuisine_type, difficulty, prep_time))
+        
         return recipe
     
-    def _parse_recipe_response(self, response: str, ingredients: List[str]) -> Optional[Recipe]:
-        """Parse la réponse de llama3.2:1b pour extraire la recette"""
+    def _take_session(self, key: str) -> Tuple[Optional[ChatSession], str]:
+        """Retire la conversation d'une demande (et la variante de son prompt), sinon (None, "")
+        
+        Une demande identique lancée en parallèle démarre donc sa propre
+        conversation; _keep_session remet la conversation en place.
+        """
+        with self._sessions_lock:
+            return self._sessions.pop(key, (None, ""))
+    
+    def _keep_session(self, key: str, session: ChatSession, variant: str):
+        """Garde les Config.CHAT_SESSIONS conversations les plus récentes"""
+        with self._sessions_lock:
+            self._sessions[key] = (session, variant)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.config.CHAT_SESSIONS:
+                self._sessions.popitem(last=False)
+    
+    @instrumentation.timed(category="service")
+    def _parse_recipe_response(self, response: str, ingredients: List[str],
+                               prompt: Optional[Prompt] = None) -> Optional[Recipe]:
+        """Parse la réponse de llama3.2:1b pour extraire la recette
+        
+        Le parsing compte comme réussi pour le gabarit quand titre,
+        ingrédients et étapes viennent de la réponse (sans valeurs de repli).
+        """
         try:
             lines = response.strip().split('\n')
             recipe_data = {
@@ -107,6 +228,10 @@ class RecipeService:
                     if step:
                         recipe_data['steps'].append(step.strip())
             
+            if prompt is not None:
+                complete = bool(recipe_data['title'] and recipe_data['ingredients'] and recipe_data['steps'])
+                self.prompts.stats.record_parse(prompt, complete)
+            
             # Validation et fallbacks
             if not recipe_data['title']:
                 recipe_data['title'] = f"Délicieux plat aux {', '.join(ingredients[:3])}"
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Résilience des appels Ollama: erreurs classées, réessais avec attente aléatoire,
+disjoncteur et échéances partagées par une action
+"""
+
+import random
+import threading
+import time
+import requests
+from urllib3.exceptions import ReadTimeoutError
+from typing import Any, Dict, Iterable, Optional
+from config import Config
+
+# Catégories d'erreurs
+ERROR_CONNECT = 'connect'              # Hôte injoignable (refus, délai de connexion)
+ERROR_TIMEOUT = 'timeout'              # Pas de réponse dans le délai de lecture
+ERROR_SERVER = 'server'                # 5xx ou erreur renvoyée dans le flux
+ERROR_MODEL_MISSING = 'model_missing'  # 404: modèle absent
+ERROR_CLIENT = 'client'                # Autre 4xx, réponse illisible
+ERROR_CIRCUIT_OPEN = 'circuit_open'    # Refus immédiat du disjoncteur
+ERROR_DEADLINE = 'deadline'            # Budget de l'appelant épuisé (pas une faute du serveur)
+
+# Erreurs qui disent que le serveur va mal (santé du pool, disjoncteur)
+HOST_ERRORS = (ERROR_CONNECT, ERROR_TIMEOUT, ERROR_SERVER)
+
+class OllamaError(requests.RequestException):
+    """Erreur d'appel Ollama avec sa catégorie (kind)"""
+    
+    def __init__(self, kind: str, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+
+class CircuitOpenError(OllamaError):
+    """Appel refusé sans attendre: Ollama est en échec répété"""
+    
+    def __init__(self, retry_in: float):
+        super().__init__(ERROR_CIRCUIT_OPEN,
+                         f"Ollama en échec répété, nouvel essai dans {max(0.0, retry_in):.0f} s")
+        self.retry_in = retry_in
+
+class Deadline:
+    """Échéance absolue d'une action (clic, requête API), partagée par tous ses appels
+    
+    Chaque appel prend min(son propre délai, temps restant): les réessais et
+    les appels suivants ne peuvent pas dépasser le budget de l'action.
+    """
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> Optional['Deadline']:
+        return None if seconds is None else cls(seconds)
+    
+    @staticmethod
+    def earliest(*deadlines: Optional['Deadline']) -> Optional['Deadline']:
+        """L'échéance la plus proche parmi celles fournies (None ignorés)"""
+        present = [deadline for deadline in deadlines if deadline is not None]
+        return min(present, key=lambda deadline: deadline.expires_at) if present else None
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    def cap(self, seconds: float) -> float:
+        """Délai borné par le temps restant"""
+        return min(seconds, self.remaining())
+    
+    def check(self):
+        """Lève OllamaError(deadline) si l'échéance est passée"""
+        if self.expired():
+            raise OllamaError(ERROR_DEADLINE, f"Budget de {self.seconds:g} s épuisé")
+
+def status_kind(status: int) -> str:
+    if status == 404:
+        return ERROR_MODEL_MISSING
+    if status >= 500:
+        return ERROR_SERVER
+    return ERROR_CLIENT
+
+def error_for_status(status: int) -> OllamaError:
+    return OllamaError(status_kind(status), f"Erreur API Ollama: {status}", status)
+
+def classify(error: BaseException) -> str:
+    """Catégorie d'une exception levée pendant un appel"""
+    if isinstance(error, OllamaError):
+        return error.kind
+    if isinstance(error, requests.ConnectTimeout):
+        return ERROR_CONNECT
+    if isinstance(error, requests.Timeout):
+        return ERROR_TIMEOUT
+    if isinstance(error, requests.ConnectionError):
+        # requests signale un délai de lecture en flux par un ConnectionError
+        if error.args and isinstance(error.args[0], ReadTimeoutError):
+            return ERROR_TIMEOUT
+        return ERROR_CONNECT
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return status_kind(error.response.status_code)
+    return ERROR_CLIENT
+
+class RetryPolicy:
+    """Réessais bornés avec attente exponentielle à tirage complet (full jitter)
+    
+    Le tirage dans [0, base x 2^n] évite que les appels échoués en même
+    temps reviennent ensemble sur un serveur qui redémarre.
+    """
+    
+    def __init__(self, attempts: int = Config.OLLAMA_RETRY_ATTEMPTS,
+                 base: float = Config.OLLAMA_RETRY_BASE, maximum: float = Config.OLLAMA_RETRY_MAX,
+                 kinds: Iterable[str] = Config.OLLAMA_RETRY_KINDS):
+        self.attempts = max(1, attempts)
+        self.base = base
+        self.maximum = maximum
+        self.kinds = set(kinds)
+    
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        """attempt: numéro (à partir de 0) de l'essai qui vient d'échouer"""
+        return kind in self.kinds and attempt + 1 < self.attempts
+    
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.maximum, self.base * 2 ** attempt))
+
+class CircuitBreaker:
+    """Disjoncteur: fermé, ouvert (refus immédiat) puis semi-ouvert (un appel test)
+    
+    Après failure_threshold échecs serveur consécutifs, les appels sont
+    refusés pendant reset_timeout secondes. Ensuite un seul appel passe:
+    s'il réussit le circuit se referme, sinon il se rouvre.
+    """
+    
+    CLOSED = 'fermé'
+    OPEN = 'ouvert'
+    HALF_OPEN = 'semi-ouvert'
+    
+    def __init__(self, failure_threshold: int = Config.BREAKER_FAILURES,
+                 reset_timeout: float = Config.BREAKER_RESET):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def before_call(self):
+        """Lève CircuitOpenError si l'appel doit être refusé"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(remaining)
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    # Un appel test est déjà en cours
+                    self.rejected += 1
+                    raise CircuitOpenError(0)
+                self._probing = True
+    
+    def raise_if_open(self):
+        """Lève CircuitOpenError pendant l'ouverture, sans réserver l'appel test
+        
+        Pour échouer avant toute sonde de santé (qui attendrait ses délais).
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(remaining)
+    
+    def record_success(self):
+        with self._lock:
+            closed = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+        if closed:
+            print("✅ Ollama répond de nouveau, circuit refermé")
+    
+    def record_failure(self, kind: str):
+        with self._lock:
+            self.failures += 1
+            self.last_error = kind
+            opened = self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                       and self.failures >= self.failure_threshold)
+            if opened:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.opens += 1
+            self._probing = False
+        if opened:
+            print(f"⚠️ Ollama en échec ({kind}), appels suspendus {self.reset_timeout:.0f} s")
+    
+    def record_neutral(self):
+        """Appel sans verdict sur le serveur (annulé, modèle absent): libère l'essai en cours"""
+        with self._lock:
+            self._probing = False
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = self._opened_at + self.reset_timeout - time.monotonic() if self.state == self.OPEN else 0.0
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+                'retry_in': max(0.0, retry_in),
+                'last_error': self.last_error
+            }
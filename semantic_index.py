@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Index vectoriel local pour le rapprochement sémantique des ingrédients
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from models import DataManager
+from ollama_service import OllamaService
+from config import Config
+
+np = None  # NumPy, importé au premier usage
+
+def _load_numpy() -> bool:
+    """Importe NumPy à la demande; False s'il est absent"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # Rapprochement sémantique désactivé sans NumPy
+            return False
+        np = numpy
+    return True
+
+class SemanticIndexUnavailable(Exception):
+    """Index ou embedding de la requête indisponible: l'échec n'est pas définitif"""
+
+class SemanticIngredientIndex:
+    """Rapproche un nom inconnu ("blanc de volaille") de l'ingrédient le plus proche par embeddings"""
+    
+    def __init__(self, ollama_service: OllamaService, data_manager: DataManager, config: Config):
+        self.ollama_service = ollama_service
+        self.data_manager = data_manager
+        self.config = config
+        self.model = config.EMBEDDING_MODEL
+        
+        slug = re.sub(r'[^a-zA-Z0-9]+', '_', self.model).strip('_')
+        self.index_path = os.path.join(config.DATA_DIR, f"embeddings_{slug}.npz")
+        
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._matrix = None
+        self._query_cache: Dict[str, object] = {}
+        self._last_attempt: Optional[float] = None
+    
+    @property
+    def enabled(self) -> bool:
+        """Option activée et NumPy présent"""
+        return self.config.SEMANTIC_MATCHING and _load_numpy()
+    
+    @property
+    def ready(self) -> bool:
+        """Matrice chargée en mémoire"""
+        return self._matrix is not None
+    
+    def _row_text(self, key: str) -> str:
+        """Texte embarqué pour une entrée de la base"""
+        ingredient = self.data_manager.ingredients_db[key]
+        return f"{ingredient.name} ({ingredient.category})"
+    
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+    
+    def build(self) -> bool:
+        """Charge l'index disque et ne calcule que les lignes nouvelles ou modifiées"""
+        if not self.enabled:
+            return False
+        
+        with self._lock:
+            if self._matrix is not None:
+                return True
+            # Pas de nouvelle tentative immédiate si Ollama était indisponible
+            if (self._last_attempt is not None
+                    and time.monotonic() - self._last_attempt < self.config.SEMANTIC_RETRY_DELAY):
+                return False
+            self._last_attempt = time.monotonic()
+            
+            keys = sorted(self.data_manager.ingredients_db)
+            row_hashes = [self._hash(self._row_text(key)) for key in keys]
+            data_hash = self._hash("\n".join(row_hashes))
+            
+            stored = self._load_stored()
+            if stored and stored['data_hash'] == data_hash:
+                self._keys, self._matrix = keys, stored['matrix']
+                return True
+            
+            # Réutiliser les lignes inchangées
+            reusable = {}
+            if stored:
+                for row, row_hash in enumerate(stored['row_hashes']):
+                    reusable[row_hash] = stored['matrix'][row]
+            
+            missing = [key for key, row_hash in zip(keys, row_hashes) if row_hash not in reusable]
+            computed = {}
+            batch_size = self.config.EMBEDDING_BATCH_SIZE
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                vectors = self.ollama_service.embed_texts([self._row_text(key) for key in batch], self.model)
+                if not vectors or len(vectors) != len(batch):
+                    print(f"❌ Embeddings indisponibles pour {self.model}")
+                    return False
+                for key, vector in zip(batch, vectors):
+                    computed[key] = self._normalize(np.asarray(vector, dtype=np.float32))
+            
+            rows = [computed[key] if key in computed else reusable[row_hash]
+                    for key, row_hash in zip(keys, row_hashes)]
+            if not rows:
+                return False
+            
+            self._keys = keys
+            self._matrix = np.vstack(rows).astype(np.float32)
+            self._save(row_hashes, data_hash)
+            print(f"✅ Index sémantique: {len(keys)} ingrédients ({len(missing)} recalculés)")
+            return True
+    
+    def _load_stored(self) -> Optional[Dict]:
+        """Lit l'index persisté pour ce modèle"""
+        try:
+            if os.path.exists(self.index_path):
+                with np.load(self.index_path, allow_pickle=False) as data:
+                    return {
+                        'matrix': data['matrix'],
+                        'row_hashes': [str(h) for h in data['row_hashes']],
+                        'data_hash': str(data['data_hash'])
+                    }
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Erreur chargement index sémantique: {e}")
+        return None
+    
+    def _save(self, row_hashes: List[str], data_hash: str):
+        """Persiste la matrice avec les empreintes des lignes"""
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + ".tmp.npz"
+            np.savez(tmp_path, matrix=self._matrix,
+                     row_hashes=np.array(row_hashes), data_hash=np.array(data_hash))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Erreur sauvegarde index sémantique: {e}")
+    
+    @staticmethod
+    def _normalize(vector):
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def search(self, name: str, k: int = 5, blocking: bool = True) -> List[Tuple[str, float]]:
+        """Top-k des ingrédients par similarité cosinus
+        
+        Sans blocking, seuls l'index déjà construit et les embeddings de requête
+        déjà calculés servent: aucun appel à Ollama (thread de l'interface).
+        Lève SemanticIndexUnavailable si l'index ou l'embedding manque.
+        """
+        if blocking:
+            if not self.enabled:
+                return []
+            if not self.build():
+                raise SemanticIndexUnavailable(f"Index {self.model} non construit")
+        
+        matrix, keys = self._matrix, self._keys
+        if matrix is None:
+            raise SemanticIndexUnavailable(f"Index {self.model} pas encore construit")
+        
+        query = self._query_cache.get(name)
+        if query is None:
+            if not blocking:
+                raise SemanticIndexUnavailable(f"Embedding de « {name} » non calculé")
+            vectors = self.ollama_service.embed_texts([name], self.model)
+            if not vectors:
+                raise SemanticIndexUnavailable(f"Embedding de « {name} » indisponible")
+            query = self._normalize(np.asarray(vectors[0], dtype=np.float32))
+            if len(self._query_cache) >= 1000:
+                self._query_cache.clear()
+            self._query_cache[name] = query
+        
+        scores = matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(keys[i], float(scores[i])) for i in top]
+    
+    def match(self, name: str, blocking: bool = True) -> Optional[str]:
+        """Meilleure correspondance au-dessus du seuil Config.SEMANTIC_MIN_SCORE
+        
+        None signifie « aucun ingrédient proche »; SemanticIndexUnavailable
+        signale un échec provisoire (Ollama absent, index en construction).
+        """
+        results = self.search(name, k=1, blocking=blocking)
+        if results and results[0][1] >= self.config.SEMANTIC_MIN_SCORE:
+            return results[0][0]
+        return None
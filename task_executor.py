@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Exécuteur de tâches d'arrière-plan partagé par toute l'application
+"""
+
+import contextvars
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from config import Config
+from metrics import metrics
+from instrumentation import instrumentation
+
+class TaskCancelled(Exception):
+    """Levée dans une tâche dont l'annulation a été demandée"""
+
+class TaskHandle:
+    """Suivi d'une tâche soumise: statut, progression et annulation"""
+    
+    def __init__(self, executor: 'TaskExecutor', task_id: int, name: str, priority: int):
+        self.executor = executor
+        self.id = task_id
+        self.name = name
+        self.priority = priority
+        self.status = 'pending'
+        self.progress = 0.0
+        self.message = ""
+        self.cancel_event = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Contexte de l'appelant (span courant): la tâche et ses rappels s'y rattachent
+        self.context = contextvars.copy_context()
+        
+        self.on_success: Optional[Callable[[Any], None]] = None
+        self.on_error: Optional[Callable[[Exception], None]] = None
+        self.on_progress: Optional[Callable[['TaskHandle'], None]] = None
+        self.on_cancel: Optional[Callable[[], None]] = None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+    
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed', 'cancelled')
+    
+    def cancel(self):
+        """Demande l'annulation; un résultat tardif sera ignoré"""
+        if self.done:
+            return
+        self.cancel_event.set()
+        if self.status == 'pending':
+            self.status = 'cancelled'
+        self.executor.post(self._notify_cancel)
+    
+    def _notify_cancel(self):
+        if self.on_cancel:
+            self.on_cancel()
+    
+    def check_cancelled(self):
+        """À appeler entre deux étapes longues de la tâche"""
+        if self.cancelled:
+            raise TaskCancelled(self.name)
+    
+    def report_progress(self, fraction: float, message: str = ""):
+        """Publie la progression (appelable depuis le thread de travail)"""
+        self.progress = max(0.0, min(1.0, fraction))
+        self.message = message
+        if self.on_progress and not self.cancelled:
+            self.executor.post(self.on_progress, self)
+
+class TaskExecutor:
+    """Pool de threads borné avec priorités et une file unique vers le thread Tk
+    
+    Les tâches reçoivent leur TaskHandle en argument. Leurs résultats et
+    callbacks passent par une file vidée périodiquement par root.after, de
+    sorte que l'interface n'est jamais modifiée depuis un thread de travail.
+    """
+    
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_LOW = 10
+    
+    def __init__(self, root, max_workers: int = Config.TASK_WORKERS, poll_ms: int = Config.TASK_POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        
+        self._tasks: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._results: "queue.Queue" = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active: Dict[int, TaskHandle] = {}
+        self._keys: Dict[str, TaskHandle] = {}
+        self._running = True
+        
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"tache-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        
+        self._pump_job = self.root.after(self.poll_ms, self._pump)
+        metrics.register_collector('task_executor', self._collect_metrics)
+    
+    def submit(self, func: Callable[[TaskHandle], Any], name: str = "tâche",
+               priority: int = PRIORITY_NORMAL,
+               on_success: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None,
+               on_progress: Optional[Callable[[TaskHandle], None]] = None,
+               on_cancel: Optional[Callable[[], None]] = None,
+               key: Optional[str] = None) -> TaskHandle:
+        """Planifie func(handle); les callbacks s'exécutent sur le thread Tk
+        
+        Une nouvelle tâche de même key annule la précédente encore active.
+        """
+        task_id = next(self._ids)
+        handle = TaskHandle(self, task_id, name, priority)
+        handle.on_success = on_success
+        handle.on_error = on_error
+        handle.on_progress = on_progress
+        handle.on_cancel = on_cancel
+        
+        with self._lock:
+            previous = self._keys.get(key) if key else None
+            if key:
+                self._keys[key] = handle
+            self._active[task_id] = handle
+        
+        if previous is not None:
+            previous.cancel()
+        
+        self._tasks.put((priority, task_id, handle, func, key))
+        return handle
+    
+    def post(self, callback: Callable, *args):
+        """Exécute callback(*args) sur le thread Tk (appelable depuis tout thread)"""
+        self._results.put((contextvars.copy_context(), callback, args))
+    
+    def _run(self, handle: TaskHandle, func: Callable[[TaskHandle], Any]) -> Any:
+        waited_ms = (handle.started_at - handle.submitted_at) * 1000
+        with instrumentation.span(f"tâche: {handle.name}", "tâche", attente_ms=round(waited_ms, 1)):
+            return func(handle)
+    
+    def _worker_loop(self):
+        while self._running:
+            priority, task_id, handle, func, key = self._tasks.get()
+            if func is None:
+                break
+            
+            try:
+                if handle.cancelled:
+                    continue
+                
+                handle.status = 'running'
+                handle.started_at = time.monotonic()
+                try:
+                    result = handle.context.run(self._run, handle, func)
+                    handle.check_cancelled()
+                    handle.status = 'done'
+                    if handle.on_success:
+                        self._results.put((handle.context, self._deliver, (handle, handle.on_success, result)))
+                except TaskCancelled:
+                    handle.status = 'cancelled'
+                except Exception as e:
+                    if handle.cancelled:
+                        handle.status = 'cancelled'
+                    else:
+                        handle.status = 'failed'
+                        if handle.on_error:
+                            self._results.put((handle.context, self._deliver, (handle, handle.on_error, e)))
+                        else:
+                            print(f"Erreur tâche '{handle.name}': {e}")
+            finally:
+                handle.finished_at = time.monotonic()
+                with self._lock:
+                    self._active.pop(task_id, None)
+                    if key and self._keys.get(key) is handle:
+                        del self._keys[key]
+    
+    def _deliver(self, handle: TaskHandle, callback: Callable, value: Any):
+        # Une annulation survenue entre-temps rend le résultat caduc
+        if not handle.cancelled:
+            callback(value)
+    
+    def _pump(self):
+        """Vide la file de résultats sur le thread Tk"""
+        try:
+            while True:
+                context, callback, args = self._results.get_nowait()
+                try:
+                    context.copy().run(callback, *args)
+                except Exception as e:
+                    print(f"Erreur callback interface: {e}")
+        except queue.Empty:
+            pass
+        
+        if self._running:
+            self._pump_job = self.root.after(self.poll_ms, self._pump)
+    
+    def stats(self) -> Dict[str, int]:
+        """Profondeur de file et tâches en cours"""
+        with self._lock:
+            running = sum(1 for h in self._active.values() if h.status == 'running')
+            active = len(self._active)
+        return {
+            'queued': active - running,
+            'running': running,
+            'workers': len(self._workers),
+            'ui_backlog': self._results.qsize()
+        }
+    
+    def _collect_metrics(self):
+        depth = metrics.gauge('task_queue_depth', "Tâches d'arrière-plan en attente, en cours et rappels Tk en file",
+                              ('state',))
+        for state, value in self.stats().items():
+            if state != 'workers':
+                depth.set(value, state=state)
+    
+    def shutdown(self):
+        """Arrête les workers et annule les tâches restantes"""
+        self._running = False
+        with self._lock:
+            handles = list(self._active.values())
+        for handle in handles:
+            handle.cancel_event.set()
+        for _ in self._workers:
+            self._tasks.put((float('inf'), next(self._ids), None, None, None))
+        try:
+            self.root.after_cancel(self._pump_job)
+        except Exception:
+            pass
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Rendu groupé des documents texte dans les widgets Tk
+"""
+
+import tkinter as tk
+from typing import List, Optional, Tuple
+
+class RichText:
+    """Document construit en mémoire: suite de segments (texte, tags)"""
+    
+    def __init__(self):
+        self.segments: List[Tuple[str, Tuple[str, ...]]] = []
+    
+    def add(self, text: str, *tags: str) -> 'RichText':
+        """Ajoute du texte; fusionné avec le segment précédent si mêmes tags"""
+        if not text:
+            return self
+        if self.segments and self.segments[-1][1] == tags:
+            self.segments[-1] = (self.segments[-1][0] + text, tags)
+        else:
+            self.segments.append((text, tags))
+        return self
+    
+    def line(self, text: str = "", *tags: str) -> 'RichText':
+        """Ajoute une ligne complète"""
+        return self.add(text + "\n", *tags)
+    
+    @property
+    def text(self) -> str:
+        return "".join(text for text, _ in self.segments)
+
+class TextRenderer:
+    """Applique un RichText à un widget Text en un seul appel insert
+    
+    Tk accepte plusieurs paires (texte, tags) dans un même insert: le
+    document entier et ses tags sont posés en une fois, sans re-layout
+    intermédiaire. Si le nouveau document prolonge celui déjà affiché
+    (génération en flux), seule la fin est ajoutée.
+    """
+    
+    def __init__(self, widget: tk.Text):
+        self.widget = widget
+        self._rendered: List[Tuple[str, Tuple[str, ...]]] = []
+    
+    def render(self, document: RichText):
+        """Affiche document, en n'ajoutant que la différence quand c'est possible"""
+        segments = document.segments
+        suffix = self._appended_suffix(segments)
+        
+        state = self.widget.cget('state')
+        self.widget.configure(state='normal')
+        try:
+            if suffix is None:
+                self.widget.delete("1.0", tk.END)
+                suffix = segments
+                follow = False
+            else:
+                # Suivre la fin seulement si l'utilisateur y était déjà
+                follow = self.widget.yview()[1] >= 0.999
+            
+            args = []
+            for text, tags in suffix:
+                args.extend((text, tags))
+            if args:
+                self.widget.insert(tk.END, *args)
+            if follow:
+                self.widget.see(tk.END)
+        finally:
+            self.widget.configure(state=state)
+        
+        self._rendered = list(segments)
+    
+    def render_text(self, text: str, *tags: str):
+        """Affiche un texte simple"""
+        self.render(RichText().add(text, *tags))
+    
+    def _appended_suffix(self, segments) -> Optional[List[Tuple[str, Tuple[str, ...]]]]:
+        """Segments à ajouter si segments prolonge l'affichage actuel, sinon None"""
+        rendered = self._rendered
+        if not rendered or len(segments) < len(rendered):
+            return None
+        
+        last = len(rendered) - 1
+        if segments[:last] != rendered[:last]:
+            return None
+        
+        old_text, old_tags = rendered[last]
+        new_text, new_tags = segments[last]
+        if new_tags != old_tags or not new_text.startswith(old_text):
+            return None
+        
+        suffix = []
+        if len(new_text) > len(old_text):
+            suffix.append((new_text[len(old_text):], new_tags))
+        suffix.extend(segments[last + 1:])
+        return suffix